@@ -15,7 +15,7 @@ import GUI_model
 import GUI_signal
 import GUI_system
 import Library
-from MechSys import Signal, Signal_processing, Functions
+from MechSys import Cache, Signal, Signal_processing, Functions
 # Instantiate logger:
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -105,6 +105,7 @@ class MainUI(QtWidgets.QMainWindow):
             if k < 176767 / 4:
                 AE_signal.Y[k + 15000] += np.int16(burst_signal.Y[k + s_i, 0] / 300)
                 s_i += 3
+        Cache.invalidate(AE_signal)
 
         self.signals_interface.add_signal(AE_signal)
 
@@ -10,7 +10,7 @@ import numpy as np
 import pyqtgraph as pg
 # Internals
 import GUI_base_widgets
-from MechSys import Signal_processing, Signal
+from MechSys import Signal_processing, Signal, Store
 import GUI_signal_dialogs
 # Instantiate logger:
 logger = logging.getLogger(__name__)
@@ -40,6 +40,8 @@ class SignalsInterface(QtWidgets.QWidget):
 
         self.menu.addAction(GUI_base_widgets.Action('Save', self, trigger_func=self.menu_save_trigger))
         self.menu.addAction(GUI_base_widgets.Action('Load', self, trigger_func=self.menu_load_trigger))
+        self.menu.addAction(GUI_base_widgets.Action('Save to store', self, trigger_func=self.menu_save_store_trigger))
+        self.menu.addAction(GUI_base_widgets.Action('Load from store', self, trigger_func=self.menu_load_store_trigger))
         self.menu.addAction(GUI_base_widgets.Action('Close', self, trigger_func=self.menu_close_trigger))
         self.menu.addAction(GUI_base_widgets.Action('Close all', self, trigger_func=self.menu_close_all_trigger))
 
@@ -122,10 +124,52 @@ class SignalsInterface(QtWidgets.QWidget):
         filename = QtWidgets.QFileDialog.getOpenFileName(self, "Load signal", '', "")
         if filename[0]:
             signal_interface = SignalInterface(config=self.config)
-            signal_interface.signal = Signal.TimeSignal.static_load(filename[0])
+            signal_interface.signal = Signal.TimeSignal.static_load(filename[0], lazy=True)
             signal_interface.update_info()
             self.add_interface(signal_interface)
 
+    def menu_save_store_trigger(self):
+        if len(self.signal_interfaces) > 0:
+            index = self.tabs.currentIndex()
+            signal_interface = self.signal_interfaces[index]
+            if signal_interface.signal:
+                filename = QtWidgets.QFileDialog.getSaveFileName(self, "Save signal to store", '', "", options=QtWidgets.QFileDialog.DontConfirmOverwrite)
+                if filename[0]:
+                    name, ok = QtWidgets.QInputDialog.getText(self, 'Save signal to store', 'Name:')
+                    if ok and name:
+                        try:
+                            store = Store.open_store(filename[0], mode='a')
+                        except (ValueError, OSError) as error:
+                            msg = QtWidgets.QMessageBox()
+                            msg.setText(str(error))
+                            msg.exec()
+                            return
+                        if name in store:
+                            answer = QtWidgets.QMessageBox.question(self, 'Save signal to store', 'Replace {}?'.format(name))
+                            if not answer == QtWidgets.QMessageBox.Yes:
+                                return
+                        store.put(name, signal_interface.signal)
+                        self.tabs.setTabText(index, signal_interface.signal.name())
+
+    def menu_load_store_trigger(self):
+        filename = QtWidgets.QFileDialog.getOpenFileName(self, "Load signal from store", '', "")
+        if filename[0]:
+            try:
+                store = Store.open_store(filename[0], mode='r')
+            except (ValueError, OSError) as error:
+                msg = QtWidgets.QMessageBox()
+                msg.setText(str(error))
+                msg.exec()
+                return
+            names = store.names()
+            if len(names) > 0:
+                name, ok = QtWidgets.QInputDialog.getItem(self, 'Load signal from store', 'Signal:', names, 0, False)
+                if ok:
+                    signal_interface = SignalInterface(config=self.config)
+                    signal_interface.signal = store.get(name, lazy=True)
+                    signal_interface.update_info()
+                    self.add_interface(signal_interface)
+
     def menu_close_trigger(self):
         if len(self.tabs) > 0:
             index = self.tabs.currentIndex()
@@ -181,8 +225,16 @@ class SignalsInterface(QtWidgets.QWidget):
                             delta_freq=params['delta_freq'],
                             update=progress_window
                         ))
+                        progress_window.setValue(iterations)
                 elif signal.signal_type == 'time-frequency':
-                    pass
+                    if signal.window_size is None:
+                        msg = QtWidgets.QMessageBox()
+                        msg.setText('Only Gabor transforms can be inverted!')
+                        msg.exec()
+                    else:
+                        progress_window = GUI_base_widgets.ProgressDialog('Transforming...', 'Cancel', 0, 1, self)
+                        self.add_signal(Signal_processing.inverse_gabor_transform(signal, update=progress_window))
+                        progress_window.setValue(progress_window.maximum())
 
     def menu_wavelet_trigger(self):
         index = self.tabs.currentIndex()
@@ -193,13 +245,16 @@ class SignalsInterface(QtWidgets.QWidget):
                     wizard = GUI_signal_dialogs.GetWaveletParams()
                     if wizard.complete:
                         params = wizard.params
+                        progress_window = GUI_base_widgets.ProgressDialog('Transforming...', 'Cancel', 0, 1, self)
                         self.add_signal(Signal_processing.wavelet_transform(
                             signal,
                             window_size=params['window_length'],
                             window_function=params['window_function'],
                             delta_tau=params['delta_tau'],
-                            delta_freq=params['delta_freq']
+                            delta_freq=params['delta_freq'],
+                            update=progress_window
                         ))
+                        progress_window.setValue(progress_window.maximum())
                 elif signal.signal_type == 'time-frequency':
                     pass
 
@@ -321,6 +376,15 @@ class SignalInterface(QtWidgets.QWidget):
         layout.addLayout(panel_layout)
         self.setLayout(layout)
 
+    def update_plot(self, plot, curve, channel):
+        """Redraw the curve of a time signal channel from the pyramid level that matches the visible range."""
+        x_0, x_1 = plot.viewRange()[0]
+        pixels = int(plot.getViewBox().width())
+        if pixels <= 0:
+            pixels = 1000
+        X, Y = Signal_processing.plot_data(self.signal, x_0, x_1, channel=channel, pixels=pixels)
+        curve.setData(X, Y)
+
     def plot_signal(self):
         self.graphs.clear()
         if self.signal is not None:
@@ -338,20 +402,24 @@ class SignalInterface(QtWidgets.QWidget):
                         legend.setBrush('k')
 
                         if self.config.getboolean('Plotting', 'complex-valued_time_signals_plot_real'):
-                            plot.plot(self.signal.X, np.real(self.signal.Y[:, j]), name='Re')
+                            plot.plot(self.signal.X[:], np.real(self.signal.Y[:, j]), name='Re')
 
                         if self.config.getboolean('Plotting', 'complex-valued_time_signals_plot_imaginary'):
-                            plot.plot(self.signal.X, np.imag(self.signal.Y[:, j]), pen='r', name='Im')
+                            plot.plot(self.signal.X[:], np.imag(self.signal.Y[:, j]), pen='r', name='Im')
 
                         if self.config.getboolean('Plotting', 'complex-valued_time_signals_plot_magnitude'):
-                            plot.plot(self.signal.X, np.absolute(self.signal.Y[:, j]), pen='g', name='Magnitude')
+                            plot.plot(self.signal.X[:], np.absolute(self.signal.Y[:, j]), pen='g', name='Magnitude')
 
                         if self.config.getboolean('Plotting', 'complex-valued_time_signals_plot_phase'):
-                            plot.plot(self.signal.X, np.angle(self.signal.Y[:, j]), pen='y', name='Phase')
+                            plot.plot(self.signal.X[:], np.angle(self.signal.Y[:, j]), pen='y', name='Phase')
 
                     else:
 
-                        plot.plot(self.signal.X, self.signal.Y[:, j])
+                        curve = plot.plot()
+                        plot.setXRange(self.signal.x_start, self.signal.x_end, padding=0)
+                        plot.enableAutoRange(x=False)
+                        plot.sigXRangeChanged.connect(lambda *args, plot=plot, curve=curve, channel=j: self.update_plot(plot, curve, channel))
+                        self.update_plot(plot, curve, j)
 
                     plot.setTitle('Signal')
                     plot.setLabel('left', 'Amplitude ({})'.format(self.signal.units[1]))
@@ -359,10 +427,14 @@ class SignalInterface(QtWidgets.QWidget):
 
             elif self.signal.signal_type == 'frequency':
 
+                if self.signal.one_sided:
+                    positive_frequency_index = 0
+                else:
+                    positive_frequency_index = self.signal.n // 2
                 if self.config.getboolean('Plotting', 'complex-valued_frequency_signals_Plot_negative_frequencies'):
                     start_frequency_index = 0
                 else:
-                    start_frequency_index = self.signal.n // 2
+                    start_frequency_index = positive_frequency_index
 
                 for j in range(self.signal.channels):
 
@@ -398,7 +470,7 @@ class SignalInterface(QtWidgets.QWidget):
 
                     if self.config.getboolean('Plotting', 'complex-valued_frequency_signals_plot_phase'):
                         plot = plot_widget.addPlot(row=1, col=0)
-                        plot.plot(self.signal.X[self.signal.n // 2:], np.angle(self.signal.Y[self.signal.n // 2:, j]))
+                        plot.plot(self.signal.X[positive_frequency_index:], np.angle(self.signal.Y[positive_frequency_index:, j]))
                         plot.setTitle('Phase spectrum')
                         plot.setLabel('left', 'Angle, (rad)')
                         plot.setLabel('bottom', 'Frequency f, (Hz)')
@@ -533,23 +533,8 @@ class CropSignal(QtWidgets.QDialog):
             msg.setText('Timestamp "to" must be larger than "from"!')
             msg.exec()
         else:
-            start_index = 0
-            end_index = self.ui_obj.signal.n - 1
-            for i, x in enumerate(self.ui_obj.signal.X):
-                if x >= new_start:
-                    start_index = i
-                    break
-            for i, x in enumerate(self.ui_obj.signal.X):
-                if x > new_end:
-                    end_index = i
-                    break
-            new_X = self.ui_obj.signal.X[start_index:end_index]
-            new_Y = self.ui_obj.signal.Y[start_index:end_index]
-
-            if self.ui_obj.signal.signal_type == 'time':
-                self.ui_obj.signal = ss.TimeSignal.from_data(new_X, new_Y)
-            elif self.ui_obj.signal.signal_type == 'frequency':
-                self.ui_obj.signal = ss.FrequencySignal.from_data(new_X, new_Y)
+            if self.ui_obj.signal.signal_type in ['time', 'frequency']:
+                self.ui_obj.signal = self.ui_obj.signal.view(new_start, new_end)
             else:
                 logger.info('error')
                 print('error')
@@ -672,7 +657,7 @@ class GetWaveletParams(QtWidgets.QDialog):
         self.cmb_window_function = QtWidgets.QComboBox()
         self.cmb_window_function.addItems([
             'Morlet',
-            'Haar'
+            'Mexican hat'
         ])
 
         self.box_delta_tau = QtWidgets.QDoubleSpinBox()
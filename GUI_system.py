@@ -159,7 +159,7 @@ class SystemsInterface(QtWidgets.QWidget):
             if system is not None:
                 filename = QtWidgets.QFileDialog.getOpenFileName(self, "Load signal", '', "")
                 if filename[0]:
-                    signal = Signal.TimeSignal.static_load(filename[0])
+                    signal = Signal.TimeSignal.static_load(filename[0], lazy=True)
                     self.system_interfaces[index].system_scene.add_component_input()
                     self.system_interfaces[index].system.add_input(signal)
                     self.system_interfaces[index].update_info()
@@ -312,7 +312,7 @@ class SystemsInterface(QtWidgets.QWidget):
         if index >= 0:
             progress_window = GUI_base_widgets.ProgressDialog('Simulating...', 'Cancel', 0, 100, self)
             if len(self.system_interfaces[index].system.get_input_components(get_index=False)) > 0 and len(self.system_interfaces[index].system.get_output_components(get_index=False)):
-                out_signals = System_processing.simulate(self.system_interfaces[index].system, update=progress_window)
+                out_signals = System_processing.simulate(self.system_interfaces[index].system, update=progress_window, method='auto')
                 for s, signal in enumerate(out_signals):
                     filename = QtWidgets.QFileDialog.getSaveFileName(self, 'save output signal {}'.format(s), '', "")
                     if filename[0]:
@@ -9,6 +9,7 @@ from PyQt5 import QtWidgets, QtGui, QtCore
 # Internals
 import GUI_system_dialogs
 from MechSys import Signal
+from MechSys import Store
 # Instantiate logger:
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -576,7 +577,7 @@ class SystemComponentInput(SystemComponent):
         if wiz.complete:
             params = wiz.params
             self.designation = params['designation']
-            self.scene.system_interface.system.components[self.component_id].signal = Signal.TimeSignal.static_load(params['signal_path'])
+            self.scene.system_interface.system.components[self.component_id].signal = Store.resolve(params['signal_path'], lazy=True)
 
     def build_component(self):
 
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+"""Convert directories of WAV and CSV recordings to signal files from the command line, without the GUI.
+
+Example:
+    python MechImport.py recordings/session_3 -o signals/session_3 --compression gzip --shuffle
+"""
+
+# standard library
+import argparse
+import logging
+import sys
+# 3rd party
+# Internals
+from MechSys import Signal_processing
+# Instantiate logger:
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+class ConsoleProgress:
+    """Progress reporting on the console, with the setMaximum/setValue interface of the GUI progress windows."""
+
+    def __init__(self):
+        self.maximum = 0
+
+    def setMaximum(self, maximum):
+        self.maximum = maximum
+
+    def setValue(self, value):
+        # Overwrite the line on a terminal, and write a line per update to pipes and log files
+        if sys.stdout.isatty():
+            print('\r{}/{}'.format(value, self.maximum), end='' if value < self.maximum else '\n', flush=True)
+        else:
+            print('{}/{}'.format(value, self.maximum), flush=True)
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Convert WAV and CSV recordings to signal files.')
+    parser.add_argument('sources', nargs='+', help='directories, glob patterns or files to convert')
+    parser.add_argument('-o', '--output', required=True, help='directory to write the signal files and manifest to')
+    parser.add_argument('-p', '--processes', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--compression', choices=['gzip', 'lzf'], default=None, help='compression filter')
+    parser.add_argument('--shuffle', action='store_true', help='use the shuffle filter')
+    parser.add_argument('--chunk-length', type=int, default=None, help='samples per chunk')
+    parser.add_argument('--manifest', default='manifest.json', help='name of the manifest file')
+    args = parser.parse_args(argv)
+
+    entries = Signal_processing.import_batch(
+        args.sources,
+        args.output,
+        processes=args.processes,
+        manifest=args.manifest,
+        chunks=args.chunk_length,
+        compression=args.compression,
+        shuffle=args.shuffle,
+        update=ConsoleProgress()
+    )
+
+    failed = [entry for entry in entries if entry['error'] is not None]
+    for entry in failed:
+        print('{}: {}'.format(entry['source'], entry['error']))
+    print('{} of {} recordings imported'.format(len(entries) - len(failed), len(entries)))
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+
+    sys.exit(main())
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+
+"""Cache of transform results, keyed by the content of the signal they were computed from
+
+Results are kept in memory up to a byte budget, least recently used first out. If a spill file is set, results that
+are pushed out of memory are written to it, and read back from it when they are asked for again. Keys are hashes of
+the samples and axes of the source signal plus the transform parameters, so a changed signal never hits an old result.
+"""
+
+# standard library
+import collections
+import copy
+import hashlib
+import logging
+import mmap
+import pathlib
+import threading
+# 3rd party
+import h5py
+import numpy as np
+# Internals
+from MechSys import Signal
+# Instantiate logger:
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+memory_budget = 256 * 2 ** 20
+hash_block_length = 65536
+
+signal_classes = {
+    'TimeSignal': Signal.TimeSignal,
+    'FrequencySignal': Signal.FrequencySignal,
+    'TimeFrequencySignal': Signal.TimeFrequencySignal
+}
+
+
+def hash_array(h, A):
+    """Feed the dtype, shape and values of the array A to the hash h, hash_block_length rows at a time."""
+    h.update('{}{}'.format(A.dtype.str, tuple(A.shape)).encode())
+    for k_0 in range(0, A.shape[0], hash_block_length):
+        h.update(np.ascontiguousarray(A[k_0:k_0 + hash_block_length]).view(np.uint8).reshape(-1))
+
+
+def file_identity(A):
+    """Get a string that identifies the samples of A by the file they are read from, or None if A is not a whole dataset
+    or mapping of a file. The file is identified by its path, size and modification time."""
+    if isinstance(A, Signal.LazyDataset):
+        path = A.path
+        identity = '{} {} {}'.format(A.name, A.rows, A.columns)
+    elif isinstance(A, np.memmap) and isinstance(A.base, mmap.mmap) and A.filename is not None:
+        path = pathlib.Path(A.filename)
+        identity = '{} {} {}'.format(A.offset, A.dtype.str, A.shape)
+    else:
+        return None
+    stat = path.stat()
+    return '{} {} {} {}'.format(path.resolve(), stat.st_size, stat.st_mtime_ns, identity)
+
+
+def content_key(signal):
+    """Get the hash of the axes and samples of signal.
+
+    The hash is stored in signal.content_key, so the samples are only read the first time. Samples that are read lazily
+    from a file are not read at all, the file is hashed by identity instead, until the signal is changed. Code that
+    changes Y in place must call invalidate().
+    """
+    if getattr(signal, 'content_key', None) is not None:
+        return signal.content_key
+
+    h = hashlib.blake2b(digest_size=16)
+    h.update('{} {} {} {} {}'.format(signal.signal_type, signal.x_start, signal.x_end, signal.delta_x, signal.units).encode())
+    for X in signal.X if isinstance(signal.X, list) else [signal.X]:
+        if not isinstance(X, Signal.UniformAxis):
+            hash_array(h, np.asarray(X))
+    identity = None if getattr(signal, 'changed', False) else file_identity(signal.Y)
+    if identity is None:
+        hash_array(h, signal.Y)
+    else:
+        h.update(identity.encode())
+
+    signal.content_key = h.hexdigest()
+    return signal.content_key
+
+
+def transform_key(signal, transform, **parameters):
+    """Get the key of the result of transform with parameters applied to signal."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update('{} {} {}'.format(content_key(signal), transform, sorted(parameters.items())).encode())
+    return h.hexdigest()
+
+
+def result_bytes(value):
+    """Get the number of bytes held by the arrays of a cached value."""
+    if isinstance(value, (Signal.Signal, Signal.MultiSignal)):
+        arrays = (value.X if isinstance(value.X, list) else [value.X]) + [value.Y]
+    else:
+        arrays = list(value)
+    return sum(A.nbytes for A in arrays if isinstance(A, np.ndarray))
+
+
+def result_copy(value):
+    """Get a copy of a cached value that can be changed without changing the cached one."""
+    if isinstance(value, (Signal.Signal, Signal.MultiSignal)):
+        value = copy.copy(value)
+        value.Y = np.array(value.Y)
+        if isinstance(value.X, list):
+            value.X = list(value.X)
+        return value
+    return tuple(np.array(A) if isinstance(A, np.ndarray) else A for A in value)
+
+
+class TransformCache:
+    """LRU cache of transform results (signals or tuples of arrays) with a memory budget in bytes, and an optional
+    HDF5 spill file for results that do not fit. It can be shared by threads."""
+
+    def __init__(self, max_bytes=memory_budget, spill_path=None):
+        self.max_bytes = max_bytes
+        self.spill_path = None if spill_path is None else pathlib.Path(spill_path)
+        self.spill_file = None
+        self.entries = collections.OrderedDict()
+        self.sizes = dict()
+        self.sources = collections.defaultdict(set)
+        self.source_of = dict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.RLock()
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries or self.spilled(key)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def info(self):
+        return {
+            'entries': len(self.entries),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'spill_path': self.spill_path,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+    def cached(self, signal, transform, compute, **parameters):
+        """Get the result of transform with parameters applied to signal from the cache, or compute() it and cache it.
+
+        The caller gets a copy, so the cached result is not changed by what is done with it.
+        """
+        key = transform_key(signal, transform, **parameters)
+        with self.lock:
+            value = self.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if value is None:
+            # Compute without holding the lock, so other threads can use the cache meanwhile
+            value = compute()
+            self.put(key, value, source=content_key(signal))
+        return result_copy(value)
+
+    def get(self, key):
+        """Get the value cached under key, or None. Values found in the spill file are moved back to memory."""
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+            if self.spilled(key):
+                value = self.read_spill(key)
+                self.put(key, value)
+                return value
+            return None
+
+    def put(self, key, value, source=None):
+        """Cache value under key. source is the content key of the signal it was computed from, see invalidate()."""
+        if hasattr(value, 'time_signal'):
+            # Do not keep the source signal alive through its result
+            value = copy.copy(value)
+            value.time_signal = None
+        size = result_bytes(value)
+        with self.lock:
+            if source is not None:
+                self.sources[source].add(key)
+                self.source_of[key] = source
+            if key in self.entries:
+                self.bytes -= self.sizes.pop(key)
+                del self.entries[key]
+            self.entries[key] = value
+            self.sizes[key] = size
+            self.bytes += size
+            while self.bytes > self.max_bytes and len(self.entries) > 0:
+                self.evict()
+
+    def evict(self):
+        """Drop the least recently used value from memory, writing it to the spill file if there is one."""
+        key, value = self.entries.popitem(last=False)
+        self.bytes -= self.sizes.pop(key)
+        if self.spill_path is None:
+            self.forget(key)
+        elif not self.spilled(key):
+            self.write_spill(key, value)
+
+    def forget(self, key):
+        """Drop key from the sources of a value that is no longer cached."""
+        source = self.source_of.pop(key, None)
+        if source is not None and source in self.sources:
+            self.sources[source].discard(key)
+            if not self.sources[source]:
+                del self.sources[source]
+
+    def invalidate(self, signal):
+        """Drop the results computed from signal, and reset its content key. Call this after changing Y in place.
+
+        The signal is marked as changed, so it is no longer identified by the file it was loaded from.
+        """
+        source = getattr(signal, 'content_key', None)
+        if source is not None:
+            with self.lock:
+                for key in self.sources.pop(source, set()):
+                    self.source_of.pop(key, None)
+                    if key in self.entries:
+                        self.bytes -= self.sizes.pop(key)
+                        del self.entries[key]
+                    if self.spilled(key):
+                        del self.spill_file[key]
+        signal.content_key = None
+        signal.changed = True
+
+    def clear(self):
+        """Drop all cached values, and delete the spill file."""
+        with self.lock:
+            self.entries.clear()
+            self.sizes.clear()
+            self.sources.clear()
+            self.source_of.clear()
+            self.bytes = 0
+            if self.spill_file is not None:
+                self.spill_file.close()
+                self.spill_file = None
+            if self.spill_path is not None and self.spill_path.exists():
+                self.spill_path.unlink()
+
+    def spilled(self, key):
+        if self.spill_path is None:
+            return False
+        if self.spill_file is None:
+            if not self.spill_path.exists():
+                return False
+            self.spill_file = h5py.File(self.spill_path, 'a')
+        return key in self.spill_file
+
+    def write_spill(self, key, value):
+        if self.spill_file is None:
+            self.spill_file = h5py.File(self.spill_path, 'a')
+        group = self.spill_file.create_group(key)
+        if isinstance(value, (Signal.Signal, Signal.MultiSignal)):
+            group.attrs['class'] = type(value).__name__
+            value.write(group)
+        else:
+            group.attrs['class'] = 'tuple'
+            for i, A in enumerate(value):
+                group.create_dataset('item_{}'.format(i), data=A)
+        self.spill_file.flush()
+
+    def read_spill(self, key):
+        group = self.spill_file[key]
+        class_name = str(group.attrs['class'])
+        if class_name == 'tuple':
+            return tuple(group['item_{}'.format(i)][()] for i in range(len(group)))
+        signal_class = signal_classes[class_name]
+        dimensions = 2 if issubclass(signal_class, Signal.MultiSignal) else 1
+        # A placeholder Y, so the default size is not allocated before read replaces it
+        value = signal_class(Y=np.zeros((1, ) * (dimensions + 1)))
+        value.read(group)
+        return value
+
+
+cache = TransformCache()
+
+
+def invalidate(signal):
+    """Drop the results computed from signal from the default cache, see TransformCache.invalidate."""
+    cache.invalidate(signal)
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+"""FFT backends
+
+The transforms in MechSys go through this module, which runs them with pyFFTW (cached plans, threads) or scipy.fft
+(workers) when they are installed, and with numpy.fft otherwise. The backend is picked on import, see set_backend.
+"""
+
+# standard library
+import logging
+import os
+import threading
+# 3rd party
+import numpy as np
+try:
+    import scipy.fft
+except ImportError:
+    scipy = None
+try:
+    import pyfftw
+    import pyfftw.interfaces.cache
+    import pyfftw.interfaces.numpy_fft
+except ImportError:
+    pyfftw = None
+# Internals
+# Instantiate logger:
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+backends = ['pyfftw', 'scipy', 'numpy']
+
+backend = None
+workers = None
+planner_effort = 'FFTW_ESTIMATE'
+# Threads of a pool set their own number of transform threads, see set_thread_workers
+local = threading.local()
+
+
+def available_backends():
+    """Get the names of the backends that can be used, fastest first."""
+    names = []
+    if pyfftw is not None:
+        names.append('pyfftw')
+    if scipy is not None:
+        names.append('scipy')
+    names.append('numpy')
+    return names
+
+
+def set_backend(name='auto', threads=None, effort='FFTW_ESTIMATE'):
+    """Select the backend by name, or the fastest available one with 'auto'.
+
+    threads is the number of threads a transform may use, by default all cores. effort is the pyFFTW planner effort.
+    Plans are cached, but every new shape is planned again, and the blocked transforms meet many shapes (the last block
+    of every signal, every chunk length), so the default is FFTW_ESTIMATE, which plans without timing trial transforms.
+    """
+    global backend, workers, planner_effort
+    if name == 'auto':
+        name = available_backends()[0]
+    if name not in backends:
+        raise ValueError('Unknown FFT backend {}, use one of {}'.format(name, ', '.join(backends)))
+    if name not in available_backends():
+        raise ValueError('The FFT backend {} is not installed'.format(name))
+    if threads is None:
+        threads = os.cpu_count() or 1
+    if name == 'pyfftw':
+        pyfftw.interfaces.cache.enable()
+        pyfftw.interfaces.cache.set_keepalive_time(60.0)
+    backend = name
+    workers = threads
+    planner_effort = effort
+    logger.debug('FFT backend {} with {} threads'.format(backend, workers))
+
+
+def set_thread_workers(threads=None):
+    """Set the number of threads the transforms of the calling thread may use, None for workers.
+
+    Used as the initializer of thread pools whose threads each run transforms, so that pool and transform threads
+    together do not outnumber the cores.
+    """
+    local.workers = threads
+
+
+def thread_workers():
+    """Get the number of threads the transforms of the calling thread may use."""
+    threads = getattr(local, 'workers', None)
+    return workers if threads is None else threads
+
+
+def transform(function, a, n, axis):
+    if backend == 'pyfftw':
+        return getattr(pyfftw.interfaces.numpy_fft, function)(a, n=n, axis=axis, threads=thread_workers(),
+                                                             planner_effort=planner_effort)
+    if backend == 'scipy':
+        return getattr(scipy.fft, function)(a, n=n, axis=axis, workers=thread_workers())
+    return getattr(np.fft, function)(a, n=n, axis=axis)
+
+
+def fft(a, n=None, axis=-1):
+    """Complex FFT of a along axis, zero padded or cropped to n samples, as numpy.fft.fft."""
+    return transform('fft', a, n, axis)
+
+
+def ifft(a, n=None, axis=-1):
+    """Inverse of fft, as numpy.fft.ifft."""
+    return transform('ifft', a, n, axis)
+
+
+def rfft(a, n=None, axis=-1):
+    """FFT of the real a along axis, only the n // 2 + 1 non-negative frequencies, as numpy.fft.rfft."""
+    return transform('rfft', a, n, axis)
+
+
+def irfft(a, n=None, axis=-1):
+    """Inverse of rfft, giving n real samples, as numpy.fft.irfft."""
+    return transform('irfft', a, n, axis)
+
+
+def next_fast_len(n, real=False):
+    """Get the smallest length of at least n that the backend transforms fast. Zero padding a transform to this length
+    avoids the slow transforms of lengths with large prime factors."""
+    if n <= 1:
+        return max(n, 1)
+    if backend == 'pyfftw':
+        return pyfftw.next_fast_len(n)
+    if backend == 'scipy':
+        return scipy.fft.next_fast_len(n, real=real)
+    # numpy.fft is fast for lengths with factors 2, 3 and 5
+    best = 2 ** int(np.ceil(np.log2(n)))
+    p_5 = 1
+    while p_5 < best:
+        p_35 = p_5
+        while p_35 < best:
+            length = p_35
+            while length < n:
+                length *= 2
+            best = min(best, length)
+            p_35 *= 3
+        p_5 *= 5
+    return best
+
+
+set_backend()
@@ -5,6 +5,9 @@
 # standard library
 import logging
 import random
+import ast
+import builtins
+import functools
 # 3rd party
 import numpy as np
 # Internals
@@ -14,14 +17,70 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
 
+numpy_names = [
+    'sin', 'cos', 'tan', 'arcsin', 'arccos', 'arctan', 'arctan2', 'sinh', 'cosh', 'tanh', 'arcsinh', 'arccosh',
+    'arctanh', 'exp', 'exp2', 'expm1', 'log', 'log2', 'log10', 'log1p', 'sqrt', 'cbrt', 'square', 'power', 'abs',
+    'absolute', 'sign', 'floor', 'ceil', 'round', 'rint', 'trunc', 'clip', 'minimum', 'maximum', 'fmin', 'fmax',
+    'where', 'mod', 'fmod', 'hypot', 'real', 'imag', 'conj', 'angle', 'heaviside', 'sinc', 'deg2rad', 'rad2deg',
+    'logical_and', 'logical_or', 'logical_not', 'isfinite', 'isnan', 'pi', 'e', 'inf', 'nan'
+]
+
+builtin_names = ['abs', 'min', 'max', 'pow', 'round', 'complex', 'float', 'int']
+
+allowed_nodes = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare, ast.IfExp, ast.Call, ast.keyword, ast.Name, ast.Load,
+    ast.Attribute, ast.Constant, ast.operator, ast.unaryop, ast.cmpop
+)
+
+namespace = {'__builtins__': {}, 'np': np}
+for name in numpy_names:
+    namespace[name] = getattr(np, name)
+for name in builtin_names:
+    namespace[name] = getattr(builtins, name)
+
+
+@functools.lru_cache(maxsize=256)
+def compile_function(string, variables=('x', )):
+    """Compile a function string once, to a function of the given variables.
+
+    Only arithmetic, comparisons and the whitelisted numpy and builtin names are allowed, with numpy names available
+    both bare and as np.<name>. Since the whitelisted numpy functions are ufuncs, the compiled function evaluates
+    arrays element wise as well as scalars.
+    """
+    expression = ast.parse(string.strip(), mode='eval')
+
+    for node in ast.walk(expression):
+        if not isinstance(node, allowed_nodes):
+            raise ValueError('Not allowed in function string: {}'.format(type(node).__name__))
+        if isinstance(node, ast.Name) and node.id not in variables and node.id not in namespace:
+            raise ValueError('Unknown name in function string: {}'.format(node.id))
+        if isinstance(node, ast.Attribute):
+            if not isinstance(node.value, ast.Name) or not node.value.id == 'np' or node.attr not in numpy_names:
+                raise ValueError('Unknown attribute in function string: {}'.format(ast.dump(node)))
+        if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float, complex)):
+            raise ValueError('Not allowed in function string: {}'.format(repr(node.value)))
+
+    arguments = ast.arguments(
+        posonlyargs=[],
+        args=[ast.arg(arg=variable) for variable in variables],
+        kwonlyargs=[],
+        kw_defaults=[],
+        defaults=[]
+    )
+    function = ast.Expression(body=ast.Lambda(args=arguments, body=expression.body))
+    ast.fix_missing_locations(function)
+
+    return eval(compile(function, '<function string>', 'eval'), dict(namespace))
+
+
 def custom_R(x, string='x'):
     """Custom function as string"""
-    return eval(string)
+    return compile_function(string, ('x', ))(x)
 
 
 def custom_R2(x_1, x_2, string='x_1 + x_2'):
     """Custom function as string"""
-    return eval(string)
+    return compile_function(string, ('x_1', 'x_2'))(x_1, x_2)
 
 
 def sine_RR(x, A=666.0, f=666.0, phi=0.0):
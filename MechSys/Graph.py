@@ -4,6 +4,7 @@
 
 # standard library
 import logging
+import collections
 # 3rd party
 
 # Internals
@@ -60,5 +61,90 @@ class Digraph:
             yield que.que[0]
             que.dequeue()
 
-
-
+    def csr(self):
+        """Compressed sparse row form of the adjacency. The out neighbours of vertex i are indices[indptr[i]:indptr[i + 1]]."""
+        indptr = [0]
+        indices = []
+        for vertex in self.vertices:
+            indices.extend(vertex.out_neighbourhood)
+            indptr.append(len(indices))
+        return indptr, indices
+
+    def topological_sort(self, strict=False):
+        """Kahn's algorithm on the CSR adjacency, O(V + E).
+
+        Vertices that lie on, or behind, a cycle are appended in index order, or if strict, a ValueError is raised.
+        """
+        indptr, indices = self.csr()
+        in_degree = [0] * self.order()
+        for j in indices:
+            in_degree[j] += 1
+
+        que = collections.deque([i for i in range(self.order()) if in_degree[i] == 0])
+        order = []
+        while que:
+            i = que.popleft()
+            order.append(i)
+            for j in indices[indptr[i]:indptr[i + 1]]:
+                in_degree[j] -= 1
+                if in_degree[j] == 0:
+                    que.append(j)
+
+        if len(order) < self.order():
+            ordered = set(order)
+            remaining = [i for i in range(self.order()) if i not in ordered]
+            if strict:
+                raise ValueError('Graph has a cycle through the vertices {}'.format(remaining))
+            order += remaining
+
+        return order
+
+    def strongly_connected_components(self):
+        """Tarjan's algorithm, iterative. The components are returned in topological order of the condensation."""
+        index = [None] * self.order()
+        low_link = [0] * self.order()
+        on_stack = [False] * self.order()
+        stack = []
+        components = []
+        counter = 0
+
+        for root in range(self.order()):
+            if index[root] is not None:
+                continue
+            work = [(root, 0)]
+            while work:
+                i, n = work.pop()
+                if n == 0:
+                    index[i] = counter
+                    low_link[i] = counter
+                    counter += 1
+                    stack.append(i)
+                    on_stack[i] = True
+                recurse = False
+                out_neighbourhood = self.vertices[i].out_neighbourhood
+                for m in range(n, len(out_neighbourhood)):
+                    j = out_neighbourhood[m]
+                    if index[j] is None:
+                        work.append((i, m + 1))
+                        work.append((j, 0))
+                        recurse = True
+                        break
+                    elif on_stack[j]:
+                        low_link[i] = min(low_link[i], index[j])
+                if recurse:
+                    continue
+                if low_link[i] == index[i]:
+                    component = []
+                    while True:
+                        j = stack.pop()
+                        on_stack[j] = False
+                        component.append(j)
+                        if j == i:
+                            break
+                    components.append(component)
+                if work:
+                    parent = work[-1][0]
+                    low_link[parent] = min(low_link[parent], low_link[i])
+
+        components.reverse()
+        return components
@@ -8,7 +8,7 @@ import random
 # 3rd party
 import numpy as np
 # Internals
-import Signal_processing
+from MechSys import Cache, Fourier, Signal_processing
 # Instantiate logger:
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -16,21 +16,24 @@ logger.setLevel(logging.DEBUG)
 
 def noise(signal, noise_gen):
     f = np.fft.fftfreq(len(noise_gen))
-    f_spectrum = Signal_processing.fft(signal)
+    f_spectrum = Signal_processing.fft(signal, one_sided=False)
     for k, disturbance in enumerate(noise_gen):
         print(k)
         if not k == 0:
             f_spectrum.Y[k] += disturbance
             f_spectrum.Y[-k] += disturbance
+    Cache.invalidate(f_spectrum)
 
 
 def noise_psd(N, psd=lambda f: 1):
-    X_white = np.fft.rfft(np.random.randn(N))
-    S = psd(np.fft.rfftfreq(N))
+    # Generate at a length the FFT backend is fast for, and keep the first N samples
+    length = Fourier.next_fast_len(N, real=True)
+    X_white = Fourier.rfft(np.random.randn(length))
+    S = psd(np.fft.rfftfreq(length))
     # Normalize S
     S = S / np.sqrt(np.mean(S ** 2))
     X_shaped = X_white * S
-    return np.fft.irfft(X_shaped)
+    return Fourier.irfft(X_shaped, n=length)[:N]
 
 
 def PSDGenerator(f):
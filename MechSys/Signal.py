@@ -3,21 +3,440 @@
 """Signals and systems"""
 
 # standard library
+import copy
 import logging
+import os
 import pathlib
 from abc import ABC
 # 3rd party
 import numpy as np
-import wave
+import numpy.lib.mixins
 import h5py
 # import sounddevice
 # import librosa
 # Internals
+from MechSys import Wav
 
 # Instantiate logger:
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
+# Version of the file format written by save(). Version 1 files store the sample axis as an X dataset, version 2 files
+# store it as attributes only, and may store Y chunked and compressed, with the min/max of every chunk.
+format_version = 2
+chunk_length = 65536
+# The min/max pyramid of a time signal has levels that decimate by pyramid_base, pyramid_base * pyramid_ratio, ...
+# samples per bin, down to pyramid_length bins.
+pyramid_base = 16
+pyramid_ratio = 4
+pyramid_length = 1024
+
+
+class LazyDataset(numpy.lib.mixins.NDArrayOperatorsMixin):
+    """Read-only array backed by a dataset in an open HDF5 file. Slices are read from file when indexed.
+
+    rows (a range) and columns (a slice of the last axis) restrict it to a part of the dataset, see view(). If file is
+    given, that open handle is used instead of a new one. readers is a weak dict that this array and its views are added
+    to, by id, so the owner of a shared handle can move them to a new one, see reopen().
+    """
+
+    def __init__(self, path_string, name, rows=None, columns=None, file=None):
+        self.path = pathlib.Path(path_string)
+        self.name = name
+        if file is None:
+            self.file = h5py.File(path_string, 'r')
+            self.owner = True
+        else:
+            # Read through a handle that is shared with others, and closed by its owner
+            self.file = file
+            self.owner = False
+        self.dataset = self.file[name]
+        if rows is None:
+            rows = range(self.dataset.shape[0])
+        self.rows = rows
+        self.columns = columns
+        self.readers = None
+
+    def __getstate__(self):
+        return {'path': self.path, 'name': self.name, 'rows': self.rows, 'columns': self.columns}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['name'], rows=state['rows'], columns=state['columns'])
+
+    def __copy__(self):
+        # A copy shares the file handle, pickling opens a new one
+        array = LazyDataset.__new__(LazyDataset)
+        array.__dict__.update(self.__dict__)
+        return array
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key, )
+        if len(key) > 0 and isinstance(key[0], (int, np.integer, slice)):
+            rows = self.rows[key[0]]
+            if isinstance(rows, int) or rows.step > 0:
+                if isinstance(rows, range):
+                    if len(rows) == 0:
+                        rows = slice(0, 0)
+                    else:
+                        rows = slice(rows[0], rows[-1] + 1, rows.step)
+                if self.columns is None:
+                    selection = (rows, )
+                else:
+                    selection = (rows, ) + (slice(None), ) * (self.dataset.ndim - 2) + (self.columns, )
+                try:
+                    data = self.dataset[selection]
+                    if isinstance(rows, int):
+                        return data[key[1:]]
+                    return data[(slice(None), ) + key[1:]]
+                except (TypeError, ValueError):
+                    pass
+        # h5py only does a subset of numpy indexing (no negative steps, only one sorted index list)
+        return np.asarray(self)[key]
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None:
+            return self[:]
+        return self[:].astype(dtype)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        inputs = [np.asarray(x) if isinstance(x, LazyDataset) else x for x in inputs]
+        return getattr(ufunc, method)(*inputs, **kwargs)
+
+    @property
+    def shape(self):
+        shape = (len(self.rows), ) + self.dataset.shape[1:]
+        if self.columns is not None:
+            shape = shape[:-1] + (len(range(shape[-1])[self.columns]), )
+        return shape
+
+    @property
+    def dtype(self):
+        return self.dataset.dtype
+
+    @property
+    def ndim(self):
+        return self.dataset.ndim
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    def astype(self, dtype):
+        return np.asarray(self, dtype=dtype)
+
+    def view(self, rows, columns=None):
+        """Get the rows (a slice) and columns (a slice of the last axis) of this array, sharing its file handle."""
+        view = copy.copy(self)
+        view.rows = self.rows[rows]
+        if columns is not None:
+            if self.columns is not None:
+                columns = range(self.dataset.shape[-1])[self.columns][columns]
+                columns = slice(columns.start, columns.stop, columns.step)
+            view.columns = columns
+        view.owner = False
+        if view.readers is not None:
+            view.readers[id(view)] = view
+        return view
+
+    def reopen(self, file):
+        """Read through the open handle file to the same file from now on, after the shared handle was closed."""
+        self.file = file
+        self.dataset = file[self.name]
+
+    def close(self):
+        if self.owner and self.file.id.valid:
+            self.file.close()
+
+
+class UniformAxis(numpy.lib.mixins.NDArrayOperatorsMixin):
+    """Read-only uniform sample axis, described by its end points and number of samples only.
+
+    Indexing gives the same values as np.linspace(x_start, x_end, num=n), without ever storing the whole axis.
+    """
+
+    def __init__(self, x_start, x_end, n, step=None):
+        self.x_start = x_start
+        self.x_end = x_end
+        self.n = n
+        if step is not None:
+            self.step = step
+        elif n > 1:
+            self.step = (x_end - x_start) / (n - 1)
+        else:
+            self.step = 0.0
+
+    def __len__(self):
+        return self.n
+
+    def __iter__(self):
+        for k_0 in range(0, self.n, 65536):
+            for x in self.values(range(k_0, min(k_0 + 65536, self.n))):
+                yield x
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            if key < 0:
+                key += self.n
+            if not 0 <= key < self.n:
+                raise IndexError('index {} is out of bounds for axis with size {}'.format(key, self.n))
+            return self.values(np.array([key]))[0]
+        if isinstance(key, slice):
+            return self.values(range(self.n)[key])
+        return np.asarray(self)[key]
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None:
+            return self.values(range(self.n))
+        return self.values(range(self.n)).astype(dtype)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        inputs = [np.asarray(x) if isinstance(x, UniformAxis) else x for x in inputs]
+        return getattr(ufunc, method)(*inputs, **kwargs)
+
+    @property
+    def shape(self):
+        return (self.n, )
+
+    @property
+    def dtype(self):
+        return np.dtype(np.float64)
+
+    @property
+    def ndim(self):
+        return 1
+
+    @property
+    def size(self):
+        return self.n
+
+    def astype(self, dtype):
+        return np.asarray(self, dtype=dtype)
+
+    def view(self, k_0, k_1):
+        """Get the part of the axis from sample k_0 up to k_1, with the same step."""
+        return UniformAxis(self[k_0], self[k_1 - 1], k_1 - k_0, step=self.step)
+
+    def values(self, k):
+        """Get the axis values at the sample indices k (a range or an array of non-negative indices)."""
+        if isinstance(k, range):
+            k = np.arange(k.start, k.stop, k.step, dtype=np.float64)
+        else:
+            k = np.asarray(k, dtype=np.float64)
+        return np.where(k == self.n - 1, self.x_end, k * self.step + self.x_start)
+
+
+def axis_index(X, x, side='nearest'):
+    """Get the sample indices of the values x on the ascending axis X.
+
+    side is 'nearest' for the nearest sample (the lower one on ties), 'left' for the first sample at or after x, and
+    'right' for the first sample after x. 'left' and 'right' give X.shape[0] when there is no such sample. Uniform axes
+    are looked up in closed form, other axes with a binary search. x can be a scalar or an array.
+    """
+    n = X.shape[0]
+    scalar = np.ndim(x) == 0
+    x = np.asarray(x, dtype=np.float64)
+
+    if isinstance(X, UniformAxis) and n > 1:
+        u = (x - X.x_start) / X.step
+        if side == 'nearest':
+            k = np.clip(np.floor(u), 0, n - 2).astype(np.int64)
+            # Compare against the axis values themselves, so that rounding in u can not tip a tie
+            k = np.where(np.absolute(x - X.values(k)) <= np.absolute(X.values(k + 1) - x), k, k + 1)
+        elif side in ['left', 'right']:
+            if side == 'left':
+                k = np.clip(np.ceil(u), 0, n).astype(np.int64)
+            else:
+                k = np.clip(np.floor(u) + 1, 0, n).astype(np.int64)
+            # Correct for rounding in u, so that the result agrees with the axis values themselves
+            before = X.values(np.clip(k - 1, 0, n - 1))
+            at = X.values(np.clip(k, 0, n - 1))
+            if side == 'left':
+                k = np.where((k > 0) & (before >= x), k - 1, np.where((k < n) & (at < x), k + 1, k))
+            else:
+                k = np.where((k > 0) & (before > x), k - 1, np.where((k < n) & (at <= x), k + 1, k))
+        else:
+            raise ValueError('Unknown side {}'.format(side))
+    else:
+        X = np.asarray(X)
+        if side == 'nearest':
+            k = np.clip(np.searchsorted(X, x, side='left'), 1, max(n - 1, 1))
+            k = np.where(np.absolute(x - X[k - 1]) <= np.absolute(X[np.minimum(k, n - 1)] - x), k - 1, k)
+            k = np.clip(k, 0, n - 1)
+        elif side in ['left', 'right']:
+            k = np.searchsorted(X, x, side=side)
+        else:
+            raise ValueError('Unknown side {}'.format(side))
+
+    if scalar:
+        return int(k)
+    return k
+
+
+def chunk_statistics(Y, k_0, length):
+    """Get the min and max of every chunk of length samples that the block Y, starting at sample k_0, overlaps.
+
+    Returns the index of the first chunk and the arrays of min and max per chunk and channel. Complex samples are
+    described by their magnitude.
+    """
+    Y = np.asarray(Y)
+    if np.iscomplexobj(Y):
+        Y = np.absolute(Y)
+    first = k_0 // length
+    last = (k_0 + Y.shape[0] - 1) // length
+    starts = np.arange(first, last + 1) * length - k_0
+    starts[0] = 0
+    return first, np.minimum.reduceat(Y, starts, axis=0), np.maximum.reduceat(Y, starts, axis=0)
+
+
+def build_pyramid(Y, block_length=1048576):
+    """Build the min/max decimation pyramid of the samples Y, of shape (n, channels).
+
+    Y is read in blocks, so it can be a lazily loaded array or an HDF5 dataset. Returns a list of levels (factor, Y_min,
+    Y_max), where Y_min[b] and Y_max[b] are the min and max of the samples b * factor to (b + 1) * factor. Signals
+    shorter than pyramid_base * pyramid_length samples get no levels.
+    """
+    n = Y.shape[0]
+    if n < pyramid_base * pyramid_length:
+        return []
+
+    block_length = max(block_length // pyramid_base, 1) * pyramid_base
+    blocks = [chunk_statistics(Y[k_0:k_0 + block_length], k_0, pyramid_base) for k_0 in range(0, n, block_length)]
+    factor = pyramid_base
+    Y_min = np.concatenate([block[1] for block in blocks])
+    Y_max = np.concatenate([block[2] for block in blocks])
+    levels = [(factor, Y_min, Y_max)]
+
+    while Y_min.shape[0] > pyramid_length:
+        starts = np.arange(0, Y_min.shape[0], pyramid_ratio)
+        factor *= pyramid_ratio
+        Y_min = np.minimum.reduceat(Y_min, starts, axis=0)
+        Y_max = np.maximum.reduceat(Y_max, starts, axis=0)
+        levels.append((factor, Y_min, Y_max))
+
+    return levels
+
+
+def write_pyramid(f, levels):
+    """Write the pyramid levels to the group pyramid of the open file f, replacing any that is there."""
+    if 'pyramid' in f:
+        del f['pyramid']
+    group = f.create_group('pyramid')
+    group.attrs['factors'] = [factor for factor, Y_min, Y_max in levels]
+    for l, (factor, Y_min, Y_max) in enumerate(levels):
+        group.create_dataset('min_{}'.format(l), data=Y_min)
+        group.create_dataset('max_{}'.format(l), data=Y_max)
+
+
+def read_pyramid(f, lazy=False, shared=False):
+    """Read the pyramid levels from the open file f, or None if it has none."""
+    if 'pyramid' not in f:
+        return None
+    levels = []
+    for l, factor in enumerate(f['pyramid'].attrs['factors']):
+        if lazy:
+            levels.append((
+                int(factor),
+                lazy_dataset(f, 'pyramid/min_{}'.format(l), shared=shared),
+                lazy_dataset(f, 'pyramid/max_{}'.format(l), shared=shared)
+            ))
+        else:
+            levels.append((int(factor), f['pyramid/min_{}'.format(l)][()], f['pyramid/max_{}'.format(l)][()]))
+    return levels
+
+
+def create_y_dataset(f, Y=None, shape=None, dtype=None, chunks=None, compression=None, compression_opts=None, shuffle=False):
+    """Create the Y dataset in the layout selected by the save options, and set the format attributes.
+
+    Y is stored contiguously unless chunks, compression or shuffle is given. chunks is a (time, channel) shape, or a
+    number of samples of all channels, and defaults to chunk_length samples. compression is None, 'gzip' or 'lzf'.
+    """
+    if Y is not None:
+        shape = Y.shape
+        dtype = Y.dtype
+    f.attrs['format_version'] = format_version
+    if chunks is None and compression is None and not shuffle:
+        f.attrs['layout'] = 'contiguous'
+        return f.create_dataset('Y', shape=shape, dtype=dtype, data=Y)
+    if chunks is None:
+        chunks = chunk_length
+    if isinstance(chunks, int):
+        chunks = (max(min(shape[0], chunks), 1), ) + tuple(shape[1:])
+    dataset = f.create_dataset(
+        'Y',
+        shape=shape,
+        dtype=dtype,
+        data=Y,
+        chunks=chunks,
+        compression=compression,
+        compression_opts=compression_opts,
+        shuffle=shuffle
+    )
+    f.attrs['layout'] = 'chunked'
+    f.attrs['chunk_length'] = dataset.chunks[0]
+    return dataset
+
+
+def lazy_dataset(f, name, shared=False):
+    """Get an array for the dataset name in the open file or group f, without reading it.
+
+    Contiguous, uncompressed datasets are memory mapped (copy on write, so the file is never modified). Other datasets
+    are wrapped in a LazyDataset that keeps its own handle to the file, or reads through the handle of f if shared.
+    """
+    dataset = f[name]
+    if dataset.size == 0:
+        return dataset[()]
+    if dataset.chunks is None and dataset.compression is None and dataset.dtype.kind in 'biufc':
+        offset = dataset.id.get_offset()
+        if offset is not None:
+            return np.memmap(dataset.file.filename, dtype=dataset.dtype, mode='c', offset=offset, shape=dataset.shape)
+    if shared:
+        return LazyDataset(dataset.file.filename, dataset.name, file=dataset.file)
+    return LazyDataset(dataset.file.filename, dataset.name)
+
+
+def source_path(A):
+    """Get the path of the file that the array A is read from, or None if A is held in memory."""
+    if isinstance(A, LazyDataset):
+        return A.path
+    if isinstance(A, np.memmap) and A.filename is not None:
+        return pathlib.Path(A.filename)
+    return None
+
+
+def read_from(path, arrays):
+    """Check if any of the arrays is read from the file at path."""
+    if not path.exists():
+        return False
+    for A in arrays:
+        source = source_path(A)
+        if source is not None and source.exists() and source.samefile(path):
+            return True
+    return False
+
+
+def write_file(signal, path, replace=False, **options):
+    """Write signal to a new file at path, with the layout options of Signal.save.
+
+    If replace, the signal is written to a temporary file that then replaces the one at path, so the old file stays
+    intact for the arrays and handles that still read from it.
+    """
+    if not replace:
+        with h5py.File(path, 'w') as f:
+            signal.write(f, **options)
+        return
+    temporary = path.with_name(path.name + '.tmp')
+    try:
+        with h5py.File(temporary, 'w') as f:
+            signal.write(f, **options)
+        os.replace(temporary, path)
+    finally:
+        if temporary.exists():
+            temporary.unlink()
+
 
 class Signal(ABC):
 
@@ -34,7 +453,7 @@ class Signal(ABC):
         'np.bool_'
     ]
 
-    def __init__(self, x_start=0.0, x_end=10.0, delta_x=1.0/44100.0, bit_depth=16, codomain='int', channels=1, units=None):
+    def __init__(self, x_start=0.0, x_end=10.0, delta_x=1.0/44100.0, bit_depth=16, codomain='int', channels=1, units=None, Y=None):
 
         if units is None:
             self.units = ['1', '1']
@@ -58,19 +477,27 @@ class Signal(ABC):
 
         self.f_s = 1.0 / self.delta_x
 
-        self.n = int(np.round(((self.x_end - self.x_start) / self.delta_x) + 1.0, decimals=0))
-        self.X = np.linspace(self.x_start, self.x_end, num=self.n, dtype=np.float64)
+        if Y is None:
+            self.n = int(np.round(((self.x_end - self.x_start) / self.delta_x) + 1.0, decimals=0))
+        else:
+            self.n = Y.shape[0]
+        self.X = UniformAxis(self.x_start, self.x_end, self.n)
         self.N = self.n
 
         self.channels = channels
         self.bit_depth = bit_depth
 
-        self.Y = np.zeros((self.n, self.channels), dtype=eval(self.valid_types[self.type_id]))
+        if Y is None:
+            self.Y = np.zeros((self.n, self.channels), dtype=eval(self.valid_types[self.type_id]))
+        else:
+            self.Y = Y
 
         self.codomain = self.Y.dtype.name.replace('{}'.format(self.bit_depth), '')
 
         self.path = None
         self.signal_type = 'generic_1D'
+        # Hash of X and Y, see Cache.content_key. Reset it to None whenever Y is changed in place
+        self.content_key = None
 
     def __str__(self):
         meta_data = self.info()
@@ -115,72 +542,192 @@ class Signal(ABC):
     def length(self):
         return self.x_end - self.x_start
 
-    def save(self, path_string):
-
-        self.path = pathlib.Path(path_string)
-
-        with h5py.File(path_string, 'w') as f:
-
-            f.create_dataset('X', data=self.X)
-            f.attrs['f_s'] = self.f_s
-            f.attrs['delta_x'] = self.delta_x
-            f.attrs['x_start'] = self.x_start
-            f.attrs['x_end'] = self.x_end
-            f.attrs['n'] = self.n
-            f.create_dataset('Y', data=self.Y)
-
-            f.attrs['type_id'] = self.type_id
-            f.attrs['codomain'] = self.codomain
-            f.attrs['channels'] = self.channels
-            f.attrs['dimensions'] = self.dimensions
-            f.attrs['bit_depth'] = self.bit_depth
-            f.attrs['signal_type'] = self.signal_type
-            f.attrs['N'] = self.N
-            f.attrs['x_unit'] = self.units[0]
-            f.attrs['y_unit'] = self.units[1]
-
-    def load(self, path_string):
+    def save(self, path_string, chunks=None, compression=None, compression_opts=None, shuffle=False):
+        """Save the signal to file.
+
+        By default Y is stored as one contiguous dataset. Give a chunk shape (time, channels), a compression filter
+        ('gzip' or 'lzf', with compression_opts as the gzip level) and/or shuffle to store it chunked instead. Chunked
+        files also store the min and max of every chunk in Y_min and Y_max.
+        """
+
+        path = pathlib.Path(path_string)
+        replace = read_from(path, [self.X, self.Y])
+        if replace:
+            # Y or X is read from the file that is about to be overwritten, also when this is a view of a signal that
+            # was loaded from it. Read them into memory, and write a new file in place of the old one, so the file is
+            # never truncated while it is mapped or open.
+            Y = np.array(self.Y)
+            X = self.X if isinstance(self.X, UniformAxis) else np.array(self.X)
+            self.close()
+            self.X = X
+            self.Y = Y
+
+        write_file(self, path, replace, chunks=chunks, compression=compression, compression_opts=compression_opts, shuffle=shuffle)
+        self.path = path
+
+    def write(self, group, chunks=None, compression=None, compression_opts=None, shuffle=False):
+        """Write the signal to an open HDF5 file or group. See save for the layout options."""
+
+        if not isinstance(self.X, UniformAxis):
+            group.create_dataset('X', data=self.X)
+        group.attrs['f_s'] = self.f_s
+        group.attrs['delta_x'] = self.delta_x
+        group.attrs['x_start'] = self.x_start
+        group.attrs['x_end'] = self.x_end
+        group.attrs['n'] = self.n
+        dataset = create_y_dataset(
+            group,
+            Y=np.asarray(self.Y),
+            chunks=chunks,
+            compression=compression,
+            compression_opts=compression_opts,
+            shuffle=shuffle
+        )
+        if dataset.chunks is not None and self.n > 0:
+            first, Y_min, Y_max = chunk_statistics(self.Y, 0, dataset.chunks[0])
+            group.create_dataset('Y_min', data=Y_min)
+            group.create_dataset('Y_max', data=Y_max)
+
+        group.attrs['type_id'] = self.type_id
+        group.attrs['codomain'] = self.codomain
+        group.attrs['channels'] = self.channels
+        group.attrs['dimensions'] = self.dimensions
+        group.attrs['bit_depth'] = self.bit_depth
+        group.attrs['signal_type'] = self.signal_type
+        group.attrs['N'] = self.N
+        group.attrs['x_unit'] = self.units[0]
+        group.attrs['y_unit'] = self.units[1]
+
+    def load(self, path_string, lazy=False):
+        """Load the signal from file. If lazy, only the attributes are read, and X and Y are read on demand."""
 
         self.path = pathlib.Path(path_string)
 
         with h5py.File(path_string, 'r') as f:
-
-            self.type_id = int(f.attrs['type_id'])
-            self.codomain = f.attrs['codomain']
-            self.channels = int(f.attrs['channels'])
-            self.dimensions = int(f.attrs['dimensions'])
-            self.bit_depth = int(f.attrs['bit_depth'])
-            self.signal_type = str(f.attrs['signal_type'])
-            self.N = int(f.attrs['N'])
-            self.units = [f.attrs['x_unit'], f.attrs['y_unit']]
-
-            self.X = f['X'][()]
-            self.f_s = f.attrs['f_s']
-            self.delta_x = float(f.attrs['delta_x'])
+            self.read(f, lazy=lazy)
+
+    def read(self, group, lazy=False, shared=False):
+        """Read the signal from an open HDF5 file or group. See load for lazy, shared lazy arrays read through the handle
+        of group."""
+
+        self.type_id = int(group.attrs['type_id'])
+        self.codomain = group.attrs['codomain']
+        self.channels = int(group.attrs['channels'])
+        self.dimensions = int(group.attrs['dimensions'])
+        self.bit_depth = int(group.attrs['bit_depth'])
+        self.signal_type = str(group.attrs['signal_type'])
+        self.N = int(group.attrs['N'])
+        self.units = [group.attrs['x_unit'], group.attrs['y_unit']]
+
+        self.f_s = group.attrs['f_s']
+        self.delta_x = float(group.attrs['delta_x'])
+        self.n = int(group.attrs['n'])
+
+        if 'X' not in group:
+            self.x_start = float(group.attrs['x_start'])
+            self.x_end = float(group.attrs['x_end'])
+            self.X = UniformAxis(self.x_start, self.x_end, self.n)
+        elif lazy:
+            self.X = lazy_dataset(group, 'X', shared=shared)
+            self.x_start = float(group.attrs['x_start'])
+            self.x_end = float(group.attrs['x_end'])
+        else:
+            self.X = group['X'][()]
             self.x_start = self.X[0]
             self.x_end = self.X[-1]
-            self.n = int(f.attrs['n'])
 
-            self.Y = f['Y'][()]
+        if lazy:
+            self.Y = lazy_dataset(group, 'Y', shared=shared)
+        else:
+            self.Y = group['Y'][()]
+        self.content_key = None
 
     @staticmethod
-    def static_load(path_string):
+    def static_load(path_string, lazy=False):
         signal = Signal()
-        signal.load(path_string)
+        signal.load(path_string, lazy=lazy)
         return signal
 
+    def close(self):
+        """Release the file handles held by a lazily loaded signal."""
+        for array in [self.X, self.Y]:
+            if isinstance(array, LazyDataset):
+                array.close()
+
+    def statistics(self):
+        """Get the chunk length and the per chunk min and max of Y stored in the signal file, or None if there are none."""
+        if self.path is None or not self.path.exists():
+            return None
+        with h5py.File(self.path, 'r') as f:
+            if 'Y_min' not in f:
+                return None
+            return int(f.attrs['chunk_length']), f['Y_min'][()], f['Y_max'][()]
+
     def play(self, channel=1):
         pass
         # sounddevice.play(self.Y[:, channel - 1], self.f_s)
 
+    def sample_index(self, x, side='nearest'):
+        """Get the sample indices of x, which can be a scalar or an array. See axis_index for side."""
+        return axis_index(self.X, x, side=side)
+
     def get_nearest_sample_index(self, x):
-        residual = np.absolute(x - self.X[0])
-        residual_index = 0
-        for k, t in enumerate(self.X):
-            if np.absolute(x - t) < residual:
-                residual = np.absolute(x - t)
-                residual_index = k
-        return residual_index
+        return self.sample_index(x)
+
+    def view(self, x_0=None, x_1=None, channels=None):
+        """Get the part of the signal from x_0 to x_1, both included, and the given channels, without copying samples.
+
+        The view shares Y with the signal, also when Y is lazily loaded, so in-place changes show up in both. channels
+        is a list of channel indices, which must be evenly spaced for Y to be shared rather than copied.
+        """
+        if x_0 is None:
+            k_0 = 0
+        else:
+            k_0 = self.sample_index(x_0, side='left')
+        if x_1 is None:
+            k_1 = self.n
+        else:
+            k_1 = self.sample_index(x_1, side='right')
+        if k_1 <= k_0:
+            raise ValueError('There are no samples from {} to {}'.format(x_0, x_1))
+
+        if channels is None:
+            channels = list(range(self.channels))
+        else:
+            channels = list(channels)
+        steps = set(np.diff(channels).tolist())
+        if len(channels) == 1:
+            columns = slice(channels[0], channels[0] + 1)
+        elif len(steps) == 1 and min(steps) > 0:
+            columns = slice(channels[0], channels[-1] + 1, min(steps))
+        else:
+            columns = channels
+
+        if isinstance(columns, list):
+            Y = np.asarray(self.Y[k_0:k_1])[:, columns]
+        elif isinstance(self.Y, LazyDataset):
+            Y = self.Y.view(slice(k_0, k_1), columns)
+        else:
+            Y = self.Y[k_0:k_1, columns]
+
+        if isinstance(self.X, UniformAxis):
+            X = self.X.view(k_0, k_1)
+        else:
+            X = self.X[k_0:k_1]
+
+        view = copy.copy(self)
+        view.X = X
+        view.Y = Y
+        view.x_start = X[0]
+        view.x_end = X[-1]
+        view.n = k_1 - k_0
+        view.N = view.n
+        view.channels = len(channels)
+        view.path = None
+        view.content_key = None
+        if hasattr(view, 'pyramid'):
+            view.pyramid = None
+        return view
 
 
 class MultiSignal(ABC):
@@ -198,7 +745,7 @@ class MultiSignal(ABC):
         'np.bool_'
     ]
 
-    def __init__(self, x_start=None, x_end=None, delta_x=None, bit_depth=128, codomain='complex', channels=1, units=None):
+    def __init__(self, x_start=None, x_end=None, delta_x=None, bit_depth=128, codomain='complex', channels=1, units=None, Y=None):
 
         if units is None:
             self.units = ['s', '1']
@@ -249,9 +796,12 @@ class MultiSignal(ABC):
 
         self.n = []
         self.X = []
-        for start, end, delta in zip(self.x_start, self.x_end, self.delta_x):
-            self.n.append(int(np.round(((end - start) / delta) + 1.0, decimals=0)))
-            self.X.append(np.linspace(start, end, num=self.n[-1], dtype=np.float64))
+        for d, (start, end, delta) in enumerate(zip(self.x_start, self.x_end, self.delta_x)):
+            if Y is None:
+                self.n.append(int(np.round(((end - start) / delta) + 1.0, decimals=0)))
+            else:
+                self.n.append(Y.shape[d])
+            self.X.append(UniformAxis(start, end, self.n[-1]))
         self.N = 1
         for n in self.n:
             self.N *= n
@@ -259,12 +809,17 @@ class MultiSignal(ABC):
         self.channels = channels
         self.bit_depth = bit_depth
 
-        self.Y = np.zeros(tuple(self.n + [self.channels]), dtype=eval(self.valid_types[self.type_id]))
+        if Y is None:
+            self.Y = np.zeros(tuple(self.n + [self.channels]), dtype=eval(self.valid_types[self.type_id]))
+        else:
+            self.Y = Y
 
         self.codomain = self.Y.dtype.name.replace('{}'.format(self.bit_depth), '')
 
         self.path = None
         self.signal_type = 'generic_nD'
+        # Hash of X and Y, see Cache.content_key. Reset it to None whenever Y is changed in place
+        self.content_key = None
 
     def __str__(self):
         meta_data = self.info()
@@ -307,91 +862,277 @@ class MultiSignal(ABC):
         else:
             return self.path.name
 
-    def save(self, path_string):
+    def save(self, path_string, chunks=None, compression=None, compression_opts=None, shuffle=False):
+        """Save the signal to file. See Signal.save for the layout options, chunks is a shape of the full Y here."""
+
+        path = pathlib.Path(path_string)
+        replace = read_from(path, self.X + [self.Y])
+        if replace:
+            # Y or X is read from the file that is about to be overwritten, see Signal.save
+            Y = np.array(self.Y)
+            X = [X if isinstance(X, UniformAxis) else np.array(X) for X in self.X]
+            self.close()
+            self.X = X
+            self.Y = Y
+
+        write_file(self, path, replace, chunks=chunks, compression=compression, compression_opts=compression_opts, shuffle=shuffle)
+        self.path = path
+
+    def write(self, group, chunks=None, compression=None, compression_opts=None, shuffle=False):
+        """Write the signal to an open HDF5 file or group. See save for the layout options."""
+
+        for i, X in enumerate(self.X):
+            if not isinstance(X, UniformAxis):
+                group.create_dataset('X_{}'.format(i), data=X)
+            group.attrs['f_s_{}'.format(i)] = self.f_s[i]
+            group.attrs['delta_x_{}'.format(i)] = self.delta_x[i]
+            group.attrs['x_start_{}'.format(i)] = self.x_start[i]
+            group.attrs['x_end_{}'.format(i)] = self.x_end[i]
+            group.attrs['n_{}'.format(i)] = self.n[i]
+        create_y_dataset(
+            group,
+            Y=np.asarray(self.Y),
+            chunks=chunks,
+            compression=compression,
+            compression_opts=compression_opts,
+            shuffle=shuffle
+        )
 
-        self.path = pathlib.Path(path_string)
+        group.attrs['type_id'] = self.type_id
+        group.attrs['channels'] = self.channels
+        group.attrs['dimensions'] = self.dimensions
+        group.attrs['bit_depth'] = self.bit_depth
+        group.attrs['signal_type'] = self.signal_type
+        group.attrs['N'] = self.N
 
-        with h5py.File(path_string, 'w') as f:
-            for i, X in enumerate(self.X):
-                f.create_dataset('X_{}'.format(i), data=X)
-                f.attrs['f_s_{}'.format(i)] = self.f_s[i]
-                f.attrs['delta_x_{}'.format(i)] = self.delta_x[i]
-                f.attrs['x_start_{}'.format(i)] = self.x_start[i]
-                f.attrs['x_end_{}'.format(i)] = self.x_end[i]
-                f.attrs['n_{}'.format(i)] = self.n[i]
-            f.create_dataset('Y', data=self.Y)
-
-            f.attrs['type_id'] = self.type_id
-            f.attrs['channels'] = self.channels
-            f.attrs['dimensions'] = self.dimensions
-            f.attrs['bit_depth'] = self.bit_depth
-            f.attrs['signal_type'] = self.signal_type
-            f.attrs['N'] = self.N
-
-    def load(self, path_string):
+    def load(self, path_string, lazy=False):
+        """Load the signal from file. If lazy, only the attributes are read, and X and Y are read on demand."""
 
         self.path = pathlib.Path(path_string)
 
         with h5py.File(path_string, 'r') as f:
+            self.read(f, lazy=lazy)
+
+    def read(self, group, lazy=False, shared=False):
+        """Read the signal from an open HDF5 file or group. See Signal.read."""
+
+        self.type_id = int(group.attrs['type_id'])
+        self.channels = int(group.attrs['channels'])
+        self.dimensions = int(group.attrs['dimensions'])
+        self.bit_depth = int(group.attrs['bit_depth'])
+        self.signal_type = str(group.attrs['signal_type'])
+        self.N = int(group.attrs['N'])
 
-            self.type_id = int(f.attrs['type_id'])
-            self.channels = int(f.attrs['channels'])
-            self.dimensions = int(f.attrs['dimensions'])
-            self.bit_depth = int(f.attrs['bit_depth'])
-            self.signal_type = str(f.attrs['signal_type'])
-            self.N = int(f.attrs['N'])
-
-            self.X = []
-            self.f_s = []
-            self.delta_x = []
-            self.x_start = []
-            self.x_end = []
-            self.n = []
-            for i in range(self.dimensions):
-                self.X.append(f['X_{}'.format(i)][()])
-                self.f_s.append(float(f.attrs['f_s_{}'.format(i)]))
-                self.delta_x.append(float(f.attrs['delta_x_{}'.format(i)]))
+        self.X = []
+        self.f_s = []
+        self.delta_x = []
+        self.x_start = []
+        self.x_end = []
+        self.n = []
+        for i in range(self.dimensions):
+            self.f_s.append(float(group.attrs['f_s_{}'.format(i)]))
+            self.delta_x.append(float(group.attrs['delta_x_{}'.format(i)]))
+            if 'X_{}'.format(i) not in group:
+                self.x_start.append(float(group.attrs['x_start_{}'.format(i)]))
+                self.x_end.append(float(group.attrs['x_end_{}'.format(i)]))
+                self.n.append(int(group.attrs['n_{}'.format(i)]))
+                self.X.append(UniformAxis(self.x_start[-1], self.x_end[-1], self.n[-1]))
+            elif lazy:
+                self.X.append(lazy_dataset(group, 'X_{}'.format(i), shared=shared))
+                self.x_start.append(float(group.attrs['x_start_{}'.format(i)]))
+                self.x_end.append(float(group.attrs['x_end_{}'.format(i)]))
+                self.n.append(int(group.attrs['n_{}'.format(i)]))
+            else:
+                self.X.append(group['X_{}'.format(i)][()])
                 self.x_start.append(self.X[-1][0])
                 self.x_end.append(self.X[-1][-1])
                 self.n.append(self.X[-1].shape[0])
 
-            self.Y = f['Y'][()]
+        if lazy:
+            self.Y = lazy_dataset(group, 'Y', shared=shared)
+        else:
+            self.Y = group['Y'][()]
+        self.codomain = self.Y.dtype.name.replace('{}'.format(self.bit_depth), '')
+        self.content_key = None
 
     @staticmethod
-    def static_load(path_string):
+    def static_load(path_string, lazy=False):
         signal = Signal()
-        signal.load(path_string)
+        signal.load(path_string, lazy=lazy)
         return signal
 
+    def close(self):
+        """Release the file handles held by a lazily loaded signal."""
+        for array in self.X + [self.Y]:
+            if isinstance(array, LazyDataset):
+                array.close()
+
     def play(self, channel=1):
         pass
         # sounddevice.play(self.Y[:, 0, channel - 1], self.f_s[0])
 
+    def sample_index(self, x, axis=0, side='nearest'):
+        """Get the sample indices of x along axis, x can be a scalar or an array. See axis_index for side."""
+        return axis_index(self.X[axis], x, side=side)
+
     def get_nearest_sample_index(self, x, axis=0):
-        residual = np.absolute(x - self.X[axis][0])
-        residual_index = 0
-        for k, t in enumerate(self.X[axis]):
-            if np.absolute(x - t) < residual:
-                residual = np.absolute(x - t)
-                residual_index = k
-        return residual_index
+        return self.sample_index(x, axis=axis)
+
+
+class TimeSignalWriter:
+    """Write a time signal to file block by block, in the same format as Signal.save, without holding it in memory.
+
+    The layout options are the same as for Signal.save.
+    """
+
+    def __init__(self, path_string, x_start=0.0, x_end=10.0, delta_x=1.0/44100.0, dtype=np.int16, channels=1, units=None,
+                 chunks=None, compression=None, compression_opts=None, shuffle=False):
+
+        if units is None:
+            units = ['s', '1']
+
+        dtype = np.dtype(dtype)
+        if dtype == np.bool_:
+            type_id = Signal.valid_types.index('np.bool_')
+        else:
+            type_id = Signal.valid_types.index('np.{}'.format(dtype.name))
+
+        self.path = pathlib.Path(path_string)
+        self.x_start = x_start
+        self.x_end = x_end
+        self.delta_x = delta_x
+        self.n = int(np.round(((x_end - x_start) / delta_x) + 1.0, decimals=0))
+        self.channels = channels
+        self.k = 0
+
+        bit_depth = 8 * dtype.itemsize
+
+        self.file = h5py.File(path_string, 'w')
+        self.file.attrs['f_s'] = 1.0 / delta_x
+        self.file.attrs['delta_x'] = delta_x
+        self.file.attrs['x_start'] = x_start
+        self.file.attrs['x_end'] = x_end
+        self.file.attrs['n'] = self.n
+        self.Y = create_y_dataset(
+            self.file,
+            shape=(self.n, channels),
+            dtype=dtype,
+            chunks=chunks,
+            compression=compression,
+            compression_opts=compression_opts,
+            shuffle=shuffle
+        )
+        if self.Y.chunks is not None and self.n > 0:
+            self.chunk_length = self.Y.chunks[0]
+            n_chunks = (self.n - 1) // self.chunk_length + 1
+            first, Y_min, Y_max = chunk_statistics(np.zeros((1, channels), dtype=dtype), 0, 1)
+            self.Y_min = self.file.create_dataset('Y_min', shape=(n_chunks, channels), dtype=Y_min.dtype)
+            self.Y_max = self.file.create_dataset('Y_max', shape=(n_chunks, channels), dtype=Y_max.dtype)
+        else:
+            self.chunk_length = None
+
+        self.file.attrs['type_id'] = type_id
+        self.file.attrs['codomain'] = dtype.name.replace('{}'.format(bit_depth), '')
+        self.file.attrs['channels'] = channels
+        self.file.attrs['dimensions'] = 1
+        self.file.attrs['bit_depth'] = bit_depth
+        self.file.attrs['signal_type'] = 'time'
+        self.file.attrs['N'] = self.n
+        self.file.attrs['x_unit'] = units[0]
+        self.file.attrs['y_unit'] = units[1]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, Y):
+        """Append a block of samples, of shape (m, ) or (m, channels)."""
+        Y = np.reshape(Y, (-1, self.channels))
+        k_1 = self.k + Y.shape[0]
+        Y = Y.astype(self.Y.dtype)
+        self.Y[self.k:k_1, :] = Y
+        if self.chunk_length is not None and Y.shape[0] > 0:
+            first, Y_min, Y_max = chunk_statistics(Y, self.k, self.chunk_length)
+            if not self.k % self.chunk_length == 0:
+                # The first chunk was started by the previous block
+                Y_min[0] = np.minimum(Y_min[0], self.Y_min[first])
+                Y_max[0] = np.maximum(Y_max[0], self.Y_max[first])
+            self.Y_min[first:first + Y_min.shape[0]] = Y_min
+            self.Y_max[first:first + Y_max.shape[0]] = Y_max
+        self.k = k_1
+
+    def close(self):
+        if self.file is not None:
+            if not self.Y.dtype.kind == 'c':
+                write_pyramid(self.file, build_pyramid(self.Y))
+            self.file.close()
+            self.file = None
 
 
 class TimeSignal(Signal):
 
-    def __init__(self, x_start=0.0, x_end=10.0, delta_x=1.0/44100.0, bit_depth=16, codomain='int', channels=1, units=None):
-        """Init a signal with a given **sampling rate** and start and end timestamps."""
+    def __init__(self, x_start=0.0, x_end=10.0, delta_x=1.0/44100.0, bit_depth=16, codomain='int', channels=1, units=None, Y=None):
+        """Init a signal with a given **sampling rate** and start and end timestamps. A given Y is adopted without copying."""
         if units is None:
             units = ['s', '1']
-        super().__init__(x_start=x_start, x_end=x_end, delta_x=delta_x, bit_depth=bit_depth, codomain=codomain, channels=channels, units=units)
+        super().__init__(x_start=x_start, x_end=x_end, delta_x=delta_x, bit_depth=bit_depth, codomain=codomain, channels=channels, units=units, Y=Y)
         self.signal_type = 'time'
+        self.pyramid = None
+
+    def write(self, group, chunks=None, compression=None, compression_opts=None, shuffle=False):
+        """Write the signal, along with its min/max pyramid, to an open HDF5 file or group."""
+        super().write(group, chunks=chunks, compression=compression, compression_opts=compression_opts, shuffle=shuffle)
+        if not self.codomain == 'complex':
+            self.pyramid = build_pyramid(self.Y)
+            write_pyramid(group, self.pyramid)
+
+    def read(self, group, lazy=False, shared=False):
+        super().read(group, lazy=lazy, shared=shared)
+        self.pyramid = read_pyramid(group, lazy=lazy, shared=shared)
 
     @staticmethod
-    def static_load(path_string):
+    def static_load(path_string, lazy=False):
         time_signal = TimeSignal()
-        time_signal.load(path_string)
+        time_signal.load(path_string, lazy=lazy)
         return time_signal
 
+    def get_pyramid(self):
+        """Get the min/max pyramid of the signal, building it if the signal has none yet."""
+        if self.pyramid is None:
+            self.pyramid = build_pyramid(self.Y)
+        return self.pyramid
+
+    def plot_data(self, x_0, x_1, channel=0, pixels=1000):
+        """Get X and Y to plot the channel between x_0 and x_1 on a plot that is pixels wide.
+
+        If the range holds many more samples than pixels, the pyramid level with the largest bins that still gives at
+        least one bin per pixel is used, and every bin is drawn as a vertical stroke from its min to its max. The size of
+        the returned arrays therefore depends on pixels, not on the length of the signal.
+        """
+        k_0 = max(self.sample_index(x_0, side='right') - 1, 0)
+        k_1 = min(self.sample_index(x_1, side='left') + 1, self.n)
+        samples_per_pixel = (k_1 - k_0) / max(pixels, 1)
+
+        level = None
+        if not self.codomain == 'complex' and samples_per_pixel >= pyramid_base:
+            for factor, Y_min, Y_max in self.get_pyramid():
+                if factor <= samples_per_pixel:
+                    level = (factor, Y_min, Y_max)
+
+        if level is None:
+            return self.X[k_0:k_1], np.asarray(self.Y[k_0:k_1, channel])
+
+        factor, Y_min, Y_max = level
+        b_0 = k_0 // factor
+        b_1 = (k_1 - 1) // factor + 1
+        X = self.x_start + (np.arange(b_0, b_1) * factor + 0.5 * (factor - 1)) * self.delta_x
+        Y = np.empty((2 * (b_1 - b_0), ), dtype=Y_min.dtype)
+        Y[0::2] = Y_min[b_0:b_1, channel]
+        Y[1::2] = Y_max[b_0:b_1, channel]
+        return np.repeat(X, 2), Y
+
     @staticmethod
     def from_data(X, Y):
         if not X.shape[0] == Y.shape[0]:
@@ -404,50 +1145,100 @@ class TimeSignal(Signal):
         bit_depth = 8 * Y.dtype.itemsize
         codomain = Y.dtype.name.replace(str(bit_depth), '')
         channels = Y.shape[-1]
-        new_signal = TimeSignal(x_start=x_start, x_end=x_end, delta_x=delta_x, bit_depth=bit_depth, codomain=codomain, channels=channels)
-        new_signal.Y = Y
+        new_signal = TimeSignal(x_start=x_start, x_end=x_end, delta_x=delta_x, bit_depth=bit_depth, codomain=codomain, channels=channels, Y=Y)
 
         return new_signal
 
     @staticmethod
-    def from_wav(file_path):
-        """Does not yet support 24 or 18 bit wav."""
-        wav = wave.open(file_path, mode='rb')
-        f_s = np.float64(wav.getframerate())
-        delta_x = np.float64(1.0) / f_s
-        n = wav.getnframes()
-        t_end = delta_x * (n - 1)
-        nchan = wav.getnchannels()
-        bitsize = 8 * wav.getsampwidth()
-        dstr = wav.readframes(n * nchan)
-        data = np.fromstring(dstr, eval('np.int{}'.format(bitsize)))
-        data = np.reshape(data, (-1, nchan))
-        result = TimeSignal(x_start=0.0, x_end=t_end, delta_x=delta_x, bit_depth=bitsize, codomain='int', channels=nchan)
-        result.Y = data
-        return result
+    def from_wav(file_path, out=None):
+        """Import a WAV file of 8, 16, 24 or 32-bit PCM or float samples.
+
+        16 and 32-bit PCM and float samples are memory mapped rather than read. Other samples are decoded block by block
+        into out (see Wav.read), or a new array. 24-bit samples are held as int32.
+        """
+        Y, header = Wav.read(file_path, out=out)
+        delta_x = np.float64(1.0) / np.float64(header['f_s'])
+        t_end = delta_x * (Y.shape[0] - 1)
+        bit_depth = 8 * Y.dtype.itemsize
+        codomain = Y.dtype.name.replace(str(bit_depth), '')
+        return TimeSignal(x_start=0.0, x_end=t_end, delta_x=delta_x, bit_depth=bit_depth, codomain=codomain, channels=header['channels'], Y=Y)
+
+    @staticmethod
+    def from_csv(file_path, delimiter=','):
+        """Import a CSV file with the sample times in the first column and one channel per further column.
+
+        Lines starting with # and a header line of column names are skipped. The samples are assumed to be uniformly
+        spaced in time.
+        """
+        with open(file_path, 'r') as f:
+            first = f.readline()
+        try:
+            [float(value) for value in first.split(delimiter)]
+            skip = 0
+        except ValueError:
+            skip = 1
+        data = np.loadtxt(file_path, delimiter=delimiter, comments='#', skiprows=skip, ndmin=2)
+        if data.shape[1] < 2:
+            raise ValueError('{} needs a time column and at least one channel column'.format(file_path))
+        return TimeSignal.from_data(data[:, 0], np.ascontiguousarray(data[:, 1:]))
 
     @staticmethod
     def from_mp3(file_path):
         pass
 
-    def export_wav_signal(self, file_path):
-        wav = wave.open(file_path, mode='wb')
-        wav.setnchannels(self.channels)
-        wav.setsampwidth(self.bit_depth // 8)
-        wav.setframerate(self.f_s)
-        wav.setnframes(self.n)
-        wav.writeframes(self.Y.astype('<h').tobytes())
+    def export_wav_signal(self, file_path, bit_depth=None, codomain=None):
+        """Export the signal as a WAV file, written block by block.
+
+        By default integer signals keep their bit depth (as 32-bit if it is 64), and other signals are written as 32-bit
+        float. Give bit_depth and codomain ('int' or 'float') to convert instead.
+        """
+        if codomain is None:
+            if self.codomain == 'int':
+                codomain = 'int'
+            else:
+                codomain = 'float'
+        if bit_depth is None:
+            if codomain == 'int':
+                bit_depth = min(self.bit_depth, 32)
+            else:
+                bit_depth = 32
+        Wav.write(file_path, self.Y, self.f_s, bits=bit_depth, codomain=codomain)
 
 
 class FrequencySignal(Signal):
 
-    def __init__(self, x_start=-22050.0, x_end=22050.0, delta_x=0.1, bit_depth=128, codomain='complex', channels=1, units=None):
-        """Init a signal with a given **sampling rate** and start and end timestamps."""
+    def __init__(self, x_start=-22050.0, x_end=22050.0, delta_x=0.1, bit_depth=128, codomain='complex', channels=1, units=None, Y=None):
+        """Init a signal with a given **sampling rate** and start and end timestamps. A given Y is adopted without copying."""
         if units is None:
             units = ['Hz', '1']
-        super().__init__(x_start=x_start, x_end=x_end, delta_x=delta_x, bit_depth=bit_depth, codomain=codomain, channels=channels, units=units)
+        super().__init__(x_start=x_start, x_end=x_end, delta_x=delta_x, bit_depth=bit_depth, codomain=codomain, channels=channels, units=units, Y=Y)
         self.time_signal = None
         self.signal_type = 'frequency'
+        # One-sided spectra hold the frequencies 0 to f_s / 2 of a real signal of time_n samples. fft_n is the length
+        # of the transform, more than time_n if the signal was zero padded
+        self.one_sided = False
+        self.time_n = None
+        self.fft_n = None
+
+    def write(self, group, chunks=None, compression=None, compression_opts=None, shuffle=False):
+        super().write(group, chunks=chunks, compression=compression, compression_opts=compression_opts, shuffle=shuffle)
+        group.attrs['one_sided'] = self.one_sided
+        if self.time_n is not None:
+            group.attrs['time_n'] = self.time_n
+        if self.fft_n is not None:
+            group.attrs['fft_n'] = self.fft_n
+
+    def read(self, group, lazy=False, shared=False):
+        super().read(group, lazy=lazy, shared=shared)
+        self.one_sided = bool(group.attrs.get('one_sided', False))
+        self.time_n = int(group.attrs['time_n']) if 'time_n' in group.attrs else None
+        self.fft_n = int(group.attrs['fft_n']) if 'fft_n' in group.attrs else None
+
+    @staticmethod
+    def static_load(path_string, lazy=False):
+        frequency_signal = FrequencySignal()
+        frequency_signal.load(path_string, lazy=lazy)
+        return frequency_signal
 
     def generate(self, real_function, im_function):
         for k, x in enumerate(self.X):
@@ -466,20 +1257,41 @@ class FrequencySignal(Signal):
         bit_depth = 8 * Y.dtype.itemsize
         codomain = Y.dtype.name.replace(str(bit_depth), '')
         channels = Y.shape[-1]
-        new_signal = FrequencySignal(x_start=x_start, x_end=x_end, delta_x=delta_x, bit_depth=bit_depth, codomain=codomain, channels=channels)
-        new_signal.Y = Y
+        new_signal = FrequencySignal(x_start=x_start, x_end=x_end, delta_x=delta_x, bit_depth=bit_depth, codomain=codomain, channels=channels, Y=Y)
 
         return new_signal
 
 
 class TimeFrequencySignal(MultiSignal):
 
-    def __init__(self, x_start=None, x_end=None, delta_x=None, bit_depth=128, codomain='complex', channels=1, units=None):
+    def __init__(self, x_start=None, x_end=None, delta_x=None, bit_depth=128, codomain='complex', channels=1, units=None, Y=None):
         if units is None:
             units = ['s', 'Hz', '1']
-        super().__init__(x_start=x_start, x_end=x_end, delta_x=delta_x, bit_depth=bit_depth, codomain=codomain, channels=channels, units=units)
+        super().__init__(x_start=x_start, x_end=x_end, delta_x=delta_x, bit_depth=bit_depth, codomain=codomain, channels=channels, units=units, Y=Y)
         self.time_signal = None
         self.signal_type = 'time-frequency'
+        # Window and hop of the Gabor transform that made the signal, for its inverse. None if it was not made by one
+        self.window_size = None
+        self.window_function = None
+        self.delta_tau = None
+
+    def write(self, group, chunks=None, compression=None, compression_opts=None, shuffle=False):
+        super().write(group, chunks=chunks, compression=compression, compression_opts=compression_opts, shuffle=shuffle)
+        if self.window_size is not None:
+            group.attrs['window_size'] = self.window_size
+            group.attrs['window_function'] = self.window_function
+            group.attrs['delta_tau'] = self.delta_tau
+
+    def read(self, group, lazy=False, shared=False):
+        super().read(group, lazy=lazy, shared=shared)
+        if 'window_size' in group.attrs:
+            self.window_size = float(group.attrs['window_size'])
+            self.window_function = str(group.attrs['window_function'])
+            self.delta_tau = float(group.attrs['delta_tau'])
+        else:
+            self.window_size = None
+            self.window_function = None
+            self.delta_tau = None
 
     def generate(self, function):
         pass
@@ -505,11 +1317,10 @@ class TimeFrequencySignal(MultiSignal):
             delta_x=delta_x,
             bit_depth=bit_depth,
             codomain=codomain,
-            channels=channels
+            channels=channels,
+            Y=Y
         )
 
-        time_frequency_signal.Y = Y
-
         return time_frequency_signal
 
 
@@ -4,15 +4,25 @@
 
 # standard library
 import logging
+import concurrent.futures
+import glob
+import json
+import os
+import pathlib
+import tempfile
 import time
 # 3rd party
 import numpy as np
 # Internals
-from MechSys import Signal
+from MechSys import Cache, Fourier, Signal, Wav
 # Instantiate logger:
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
+stft_block_bytes = 32 * 2 ** 20
+wavelet_chunk_length = 2 ** 16
+wavelet_cache = Cache.TransformCache(max_bytes=64 * 2 ** 20)
+
 
 def evaluate(signal, function, kwargs, method='overwrite', a=None, b=None, channels=None, update=None, vector=False):
     """Assumes that the function output matches the signal type!"""
@@ -22,6 +32,10 @@ def evaluate(signal, function, kwargs, method='overwrite', a=None, b=None, chann
     if channels is None:
         channels = [x for x in range(signal.channels)]
 
+    # Samples that are read lazily from file cannot be written in place, so read them into memory first
+    if isinstance(signal.Y, Signal.LazyDataset):
+        signal.Y = np.array(signal.Y)
+
     if a is None:
         if signal.dimensions == 1:
             a = [signal.x_start]
@@ -45,28 +59,12 @@ def evaluate(signal, function, kwargs, method='overwrite', a=None, b=None, chann
         b_index = [x - 1 for x in signal.n]
 
     if signal.dimensions == 1:
-        distance_a = 100000000000
-        distance_b = 100000000000
-        for k, x in enumerate(signal.X):
-            if np.absolute(a[0] - x) < distance_a:
-                distance_a = np.absolute(a[0] - x)
-                a_index[0] = k
-            if np.absolute(b[0] - x) < distance_b:
-                distance_b = np.absolute(b[0] - x)
-                b_index[0] = k
+        a_index[0] = signal.sample_index(a[0])
+        b_index[0] = signal.sample_index(b[0])
     else:
-        distance_a = []
-        distance_b = []
         for d in range(signal.dimensions):
-            distance_a.append(100000000000)
-            distance_b.append(100000000000)
-            for k, x in enumerate(signal.X[d]):
-                if np.absolute(a[d] - x) < distance_a[d]:
-                    distance_a[d] = np.absolute(a[d] - x)
-                    a_index[d] = k
-                if np.absolute(b[d] - x) < distance_b[d]:
-                    distance_b[d] = np.absolute(b[d] - x)
-                    b_index[d] = k
+            a_index[d] = signal.sample_index(a[d], axis=d)
+            b_index[d] = signal.sample_index(b[d], axis=d)
 
     if signal.dimensions == 1:
 
@@ -130,6 +128,10 @@ def evaluate(signal, function, kwargs, method='overwrite', a=None, b=None, chann
 
     print(time.time() - start_time)
 
+    if signal.signal_type == 'time':
+        signal.pyramid = None
+    Cache.invalidate(signal)
+
     return signal
 
 
@@ -156,56 +158,183 @@ def noise_1f(signal, coefficient, alpha):
         """
         make noise with a certain spectral density
         """
-        freqs = np.fft.rfftfreq(samples, 1.0 / rate)  # real-fft frequencies (not the negative ones)
+        length = Fourier.next_fast_len(samples, real=True)  # transform length the FFT backend is fast for
+        freqs = np.fft.rfftfreq(length, 1.0 / rate)  # real-fft frequencies (not the negative ones)
         spectrum = np.zeros_like(freqs, dtype='complex')  # make complex numbers for spectrum
         spectrum[1:] = spectrum_func(freqs[1:])  # get spectrum amplitude for all frequencies except f=0
         phases = np.random.uniform(0, 2 * np.pi, len(freqs) - 1)  # random phases for all frequencies except f=0
         spectrum[1:] *= np.exp(1j * phases)  # apply random phases
-        noise = np.fft.irfft(spectrum)  # return the reverse fourier transform
-        noise = np.pad(noise, (0, samples - len(noise)), 'constant')  # add zero for odd number of input samples
+        noise = Fourier.irfft(spectrum, n=length)[:samples]  # return the reverse fourier transform
 
         return noise
 
 
-def fft(time_signal):
-    """Recover the **Fast Fourier Transform** (FFT) of the signal **Y** on the time domain **T**."""
+def fft(time_signal, use_cache=True, one_sided=None, pad=False):
+    """Recover the **Fast Fourier Transform** (FFT) of the signal **Y** on the time domain **T**.
+
+    If one_sided, only the spectrum at frequencies 0 to f_s / 2 is computed with a real FFT, which holds all information
+    of a real signal. By default real signals get one-sided spectra, and complex signals two-sided, shifted spectra.
+    If pad, the signal is zero padded to the next length the FFT backend is fast for, which gives a slightly finer
+    frequency axis. Results are kept in Cache.cache, so transforming an unchanged signal again returns at once.
+    """
+    if one_sided is None:
+        one_sided = not np.iscomplexobj(time_signal.Y)
+
+    if use_cache:
+        frequency_signal = Cache.cache.cached(
+            time_signal,
+            'fft',
+            lambda: fft(time_signal, use_cache=False, one_sided=one_sided, pad=pad),
+            one_sided=one_sided,
+            pad=pad
+        )
+        frequency_signal.time_signal = time_signal
+        return frequency_signal
+
     if time_signal.bit_depth in [1, 2, 8, 16, 32]:
         bit_depth = 64
     else:
         bit_depth = 128
-    Y_f = np.fft.fftshift(np.fft.fft(time_signal.Y, axis=0)).astype(eval('np.complex{}'.format(bit_depth)))
-    X_f = np.linspace(-time_signal.f_s / 2.0, time_signal.f_s / 2.0, num=Y_f.shape[0], dtype=np.float64)
-    frequency_signal = Signal.FrequencySignal.from_data(X_f, Y_f)
+    if pad:
+        n = Fourier.next_fast_len(time_signal.n, real=one_sided)
+    else:
+        n = time_signal.n
+    if one_sided:
+        if np.iscomplexobj(time_signal.Y):
+            raise ValueError('The spectrum of a complex signal is not one-sided')
+        Y_f = Fourier.rfft(time_signal.Y, n=n, axis=0).astype(eval('np.complex{}'.format(bit_depth)))
+        frequency_signal = Signal.FrequencySignal(
+            x_start=0.0,
+            x_end=(Y_f.shape[0] - 1) * time_signal.f_s / n,
+            delta_x=time_signal.f_s / n,
+            bit_depth=bit_depth,
+            codomain='complex',
+            channels=time_signal.channels,
+            Y=Y_f
+        )
+        frequency_signal.one_sided = True
+    else:
+        Y_f = np.fft.fftshift(Fourier.fft(time_signal.Y, n=n, axis=0), axes=0).astype(eval('np.complex{}'.format(bit_depth)))
+        X_f = np.linspace(-time_signal.f_s / 2.0, time_signal.f_s / 2.0, num=Y_f.shape[0], dtype=np.float64)
+        frequency_signal = Signal.FrequencySignal.from_data(X_f, Y_f)
+    frequency_signal.time_n = time_signal.n
+    frequency_signal.fft_n = n
     frequency_signal.time_signal = time_signal
     return frequency_signal
 
 
 def ifft(frequency_signal):
-    f_s = 2.0 * (frequency_signal.X[-1])
+    """Inverse of fft. One-sided spectra are inverted with a real FFT. Padding added by fft is cut off again."""
+    if frequency_signal.one_sided:
+        n = frequency_signal.fft_n
+        if n is None:
+            n = 2 * (frequency_signal.n - 1)
+        f_s = n * frequency_signal.delta_x
+        Y = Fourier.irfft(frequency_signal.Y, n=n, axis=0)
+    else:
+        f_s = 2.0 * (frequency_signal.X[-1])
+        Y = Fourier.ifft(np.fft.ifftshift(frequency_signal.Y, axes=0), axis=0)
+    if frequency_signal.time_n is not None:
+        Y = Y[:frequency_signal.time_n]
+    n = Y.shape[0]
     delta_x = 1.0 / f_s
 
-    Y = np.fft.ifft(np.fft.ifftshift(frequency_signal.Y), axis=0).real
-
     if frequency_signal.time_signal is not None:
         x_start = frequency_signal.time_signal.X[0]
         x_end = frequency_signal.time_signal.X[-1]
         bit_depth = frequency_signal.time_signal.bit_depth
+        codomain = frequency_signal.time_signal.codomain
     else:
         x_start = 0.0
-        x_end = delta_x * (frequency_signal.n - 1)
+        x_end = delta_x * (n - 1)
         if frequency_signal.bit_depth == 128:
             bit_depth = 64
         elif frequency_signal.bit_depth == 64:
             bit_depth = 16
         else:
             bit_depth = 8 * Y.dtype.itemsize
-
-    time_signal = Signal.TimeSignal(x_start=x_start, x_end=x_end, delta_x=delta_x, bit_depth=bit_depth, codomain='int', channels=frequency_signal.channels)
-    time_signal.Y = Y.astype(time_signal.Y.dtype)
+        codomain = 'int'
+
+    if not codomain == 'complex':
+        Y = Y.real
+    if codomain == 'int':
+        # Round rather than truncate, so integer signals come back exactly
+        Y = np.round(Y)
+
+    time_signal = Signal.TimeSignal(
+        x_start=x_start,
+        x_end=x_end,
+        delta_x=delta_x,
+        bit_depth=bit_depth,
+        codomain=codomain,
+        channels=frequency_signal.channels,
+        Y=Y.astype('{}{}'.format(codomain, bit_depth))
+    )
     return time_signal
 
 
-def gabor_transform(time_signal, window_size=0.1, window_function='Hann', delta_tau=None, delta_freq=None, update=None):
+def window(window_function, length):
+    """Get the values of a window function of the given length. Only the Hann window is implemented, other names give
+    the Hann window as well."""
+    x = np.arange(length)
+    return np.sin(np.pi * x / length) ** 2
+
+
+def stft_block(Y, i_0, i_1, delta_tau_n, P_n, window_function_values, n):
+    """Get the shifted spectra of frames i_0 to i_1 of Y, of shape (frames, channels, n).
+
+    Frame i is window_function_values times the samples of Y from i * delta_tau_n - P_n on, with zeros outside Y. Only
+    the samples the frames cover are read from Y, and the frames are strided views of them, so Y can be lazily loaded.
+    """
+    alpha_n = window_function_values.shape[0]
+    k_0 = i_0 * delta_tau_n - P_n
+    k_1 = (i_1 - 1) * delta_tau_n + alpha_n - P_n
+    segment = np.zeros((k_1 - k_0, Y.shape[1]), dtype=np.result_type(Y.dtype, np.float64))
+    segment[max(0, -k_0):max(0, -k_0) + max(0, min(k_1, Y.shape[0]) - max(k_0, 0))] = Y[max(k_0, 0):max(min(k_1, Y.shape[0]), 0)]
+    frames = np.lib.stride_tricks.sliding_window_view(segment, alpha_n, axis=0)[::delta_tau_n]
+    return np.fft.fftshift(Fourier.fft(frames * window_function_values, n=n, axis=-1), axes=-1)
+
+
+def stft_frame_bytes(dtype, channels, delta_tau_n, alpha_n, n):
+    """Bytes stft_block holds per frame of a block of samples of type dtype.
+
+    These are the frame's hop of the segment, its windowed copy, the copy zero padded to n for the FFT, and two
+    complex128 spectra, the FFT and its shifted copy.
+    """
+    itemsize = np.dtype(np.result_type(dtype, np.float64)).itemsize
+    return channels * (itemsize * (delta_tau_n + alpha_n + n) + 2 * 16 * n)
+
+
+def gabor_transform(time_signal, window_size=0.1, window_function='Hann', delta_tau=None, delta_freq=None, update=None,
+                    use_cache=True, method='block', block_bytes=stft_block_bytes):
+    """Short-time Fourier transform of the signal. Results are kept in Cache.cache, like those of fft.
+
+    With method 'block' the frames are strided views of the signal, transformed a block of frames at a time, with
+    blocks of about block_bytes of working memory, see stft_frame_bytes. Method 'loop' transforms one frame at a time, and is kept as a reference.
+    """
+
+    if use_cache:
+        time_frequency_signal = Cache.cache.cached(
+            time_signal,
+            'gabor',
+            lambda: gabor_transform(
+                time_signal,
+                window_size,
+                window_function,
+                delta_tau,
+                delta_freq,
+                update=update,
+                use_cache=False,
+                method=method,
+                block_bytes=block_bytes
+            ),
+            window_size=window_size,
+            window_function=window_function,
+            delta_tau=delta_tau,
+            delta_freq=delta_freq
+        )
+        time_frequency_signal.time_signal = time_signal
+        return time_frequency_signal
 
     if time_signal.bit_depth in [1, 2, 8, 16, 32]:
         bit_depth = 64
@@ -225,13 +354,7 @@ def gabor_transform(time_signal, window_size=0.1, window_function='Hann', delta_
     delta_o = time_signal.delta_x * (delta_o_n - 1)
     P_n = int(np.round(window_size / time_signal.delta_x + 1, decimals=0))
 
-    window_function_values = np.zeros((alpha_n, ), dtype=np.float64)
-    if window_function == 'Hann':
-        for x in range(alpha_n):
-            window_function_values[x] = (np.sin(np.pi * x / alpha_n)) ** 2
-    else:
-        for x in range(alpha_n):
-            window_function_values[x] = (np.sin(np.pi * x / alpha_n)) ** 2
+    window_function_values = window(window_function, alpha_n)
 
     # Transform sample space:
     x_start = [time_signal.X[0], -time_signal.f_s / 2]
@@ -245,20 +368,36 @@ def gabor_transform(time_signal, window_size=0.1, window_function='Hann', delta_
 
     Y_g = np.zeros((tau.shape[0], freq.shape[0], time_signal.channels), dtype=eval('np.complex{}'.format(bit_depth)))
 
-    Y = time_signal.Y
-    Y = np.concatenate((np.zeros((P_n, time_signal.channels), dtype=Y.dtype), Y, np.zeros((P_n, time_signal.channels), dtype=Y.dtype)), axis=0)
+    if method == 'block':
+        frame_bytes = stft_frame_bytes(time_signal.Y.dtype, time_signal.channels, delta_tau_n, alpha_n, N[1])
+        frames = max(1, int(block_bytes // frame_bytes))
+        for i_0 in range(0, N[0], frames):
+            i_1 = min(i_0 + frames, N[0])
+            Y_g[i_0:i_1] = stft_block(time_signal.Y, i_0, i_1, delta_tau_n, P_n, window_function_values, N[1]).transpose(0, 2, 1)
+            if update is not None:
+                update.setValue(i_1 * time_signal.channels)
 
-    for channel in range(time_signal.channels):
+    elif method == 'loop':
+        Y = time_signal.Y
+        Y = np.concatenate((np.zeros((P_n, time_signal.channels), dtype=Y.dtype), Y, np.zeros((P_n, time_signal.channels), dtype=Y.dtype)), axis=0)
 
-        for i in range(N[0]):
+        for channel in range(time_signal.channels):
 
-            k = i * delta_tau_n
-            Y_g[i, :, channel] = np.fft.fftshift(np.fft.fft(Y[k:(k + alpha_n), channel] * window_function_values, n=N[1], axis=0)).astype(eval('np.complex{}'.format(bit_depth)))
-            if update is not None:
-                update.setValue(channel * N[0] + i)
+            for i in range(N[0]):
+
+                k = i * delta_tau_n
+                Y_g[i, :, channel] = np.fft.fftshift(Fourier.fft(Y[k:(k + alpha_n), channel] * window_function_values, n=N[1], axis=0)).astype(eval('np.complex{}'.format(bit_depth)))
+                if update is not None:
+                    update.setValue(channel * N[0] + i)
+
+    else:
+        raise ValueError('Unknown method {}, use block or loop'.format(method))
 
     time_frequency_signal = Signal.TimeFrequencySignal.from_data([tau, freq], Y_g)
     time_frequency_signal.time_signal = time_signal
+    time_frequency_signal.window_size = window_size
+    time_frequency_signal.window_function = window_function
+    time_frequency_signal.delta_tau = delta_tau_n * time_signal.delta_x
 
     report = {
         'alpha_n': alpha_n,
@@ -275,11 +414,305 @@ def gabor_transform(time_signal, window_size=0.1, window_function='Hann', delta_
     return time_frequency_signal
 
 
-def inverse_gabor_transform(time_frequency_signal, window_size=1.0, window_function='Hann', delta_tau=None, delta_freq=None):
-    pass
+def plot_data(time_signal, x_0, x_1, channel=0, pixels=1000):
+    """Get X and Y to plot a channel of a time signal, see TimeSignal.plot_data.
+
+    The results are not cached: every pan and zoom asks for a new range, and reading a range from the pyramid, which the
+    signal keeps, costs about as much as looking it up.
+    """
+    return time_signal.plot_data(x_0, x_1, channel=channel, pixels=pixels)
+
+
+def istft_frame_bytes(spectrum_dtype, channels, n_f, delta_tau_n, R, dtype):
+    """Bytes istft_blocks holds per frame, for spectra of type spectrum_dtype and samples of type dtype.
+
+    These are the frame's spectrum and its unshifted copy, its complex128 inverse transform, its R hops windowed and
+    their padded copy, and its hop of the overlap-add block.
+    """
+    spectrum_itemsize = np.dtype(spectrum_dtype).itemsize
+    itemsize = np.dtype(dtype).itemsize
+    return channels * (2 * spectrum_itemsize * n_f + 16 * n_f + itemsize * delta_tau_n * (2 * R + 1))
+
+
+def istft_blocks(Y_g, n, delta_tau_n, P_n, window_function_values, real=True, block_bytes=stft_block_bytes):
+    """Invert the frames of a Gabor transform by weighted overlap-add, yielding (k_0, block) of finished samples.
+
+    Y_g holds the shifted spectra of the frames, of shape (frames, frequencies, channels). Every frame is inverse
+    transformed, windowed again, and added at its position, i * delta_tau_n - P_n. The sum of the squared windows is
+    added the same way, and the samples are divided by it once no later frame reaches them. Samples no frame covers
+    are zero. Blocks of frames of about block_bytes of working memory are transformed at a time, see istft_frame_bytes.
+    """
+    frames, n_f, channels = Y_g.shape
+    L = min(window_function_values.shape[0], n_f)
+    R = (L - 1) // delta_tau_n + 1
+    # Windows padded to R hops of delta_tau_n samples, so overlap-add is R shifted sums of whole hops
+    window_values = np.zeros((R * delta_tau_n, ), dtype=np.float64)
+    window_values[:L] = window_function_values[:L]
+    window_values = window_values.reshape((R, delta_tau_n))
+
+    dtype = np.float64 if real else np.complex128
+    accumulator = np.zeros((R - 1, delta_tau_n, channels), dtype=dtype)
+    normalization = np.zeros((R - 1, delta_tau_n), dtype=np.float64)
+    block_frames = max(1, int(block_bytes // istft_frame_bytes(Y_g.dtype, channels, n_f, delta_tau_n, R, dtype)))
+    k = 0
+
+    for i_0 in range(0, frames, block_frames):
+        i_1 = min(i_0 + block_frames, frames)
+        B = i_1 - i_0
+        spectra = np.asarray(Y_g[i_0:i_1])
+        segments = Fourier.ifft(np.fft.ifftshift(spectra, axes=1), axis=1)[:, :L, :]
+        if real:
+            segments = segments.real
+        padded = np.zeros((B, R * delta_tau_n, channels), dtype=dtype)
+        padded[:, :L, :] = segments
+        padded = padded.reshape((B, R, delta_tau_n, channels)) * window_values[None, :, :, None]
+
+        # Hop h of the block covers samples (i_0 + h) * delta_tau_n - P_n on
+        block = np.zeros((B + R - 1, delta_tau_n, channels), dtype=dtype)
+        block_normalization = np.zeros((B + R - 1, delta_tau_n), dtype=np.float64)
+        block[:R - 1] += accumulator
+        block_normalization[:R - 1] += normalization
+        for r in range(R):
+            block[r:r + B] += padded[:, r]
+            block_normalization[r:r + B] += window_values[r] ** 2
+
+        done = B if i_1 < frames else B + R - 1
+        accumulator = block[done:]
+        normalization = block_normalization[done:]
+
+        samples = block[:done].reshape((-1, channels))
+        weights = block_normalization[:done].reshape((-1, ))
+        p_0 = i_0 * delta_tau_n - P_n
+        a = max(k - p_0, 0)
+        b = min(n - p_0, samples.shape[0])
+        if b > a:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                values = np.where(weights[a:b, None] > 1e-10, samples[a:b] / weights[a:b, None], 0)
+            yield p_0 + a, values
+            k = p_0 + b
+
+    if k < n:
+        yield k, np.zeros((n - k, channels), dtype=dtype)
+
+
+def inverse_gabor_transform(time_frequency_signal, window_size=None, window_function=None, delta_tau=None, path_string=None,
+                            block_bytes=stft_block_bytes, update=None):
+    """Invert gabor_transform, by overlap-add of the inverse transformed frames. See istft_blocks.
+
+    window_size, window_function and delta_tau must be those of the forward transform, which records them on its result,
+    so by default they are taken from there. For a transform without them, window_size must be given, the window
+    function defaults to Hann and delta_tau is taken from the time axis. The sample rate, length and type come from the signal that was transformed if it
+    is known, otherwise the frequency axis gives the sample rate and the result is a float signal. If path_string is
+    given, the signal is written to that file block by block, and returned lazily loaded.
+    """
+
+    source = time_frequency_signal.time_signal
+    if source is not None:
+        delta_x = source.delta_x
+        n = source.n
+        x_start = source.x_start
+        dtype = source.Y.dtype
+        units = source.units
+    else:
+        f_s = time_frequency_signal.x_end[1] - time_frequency_signal.x_start[1]
+        delta_x = 1.0 / f_s
+        x_start = time_frequency_signal.x_start[0]
+        dtype = np.dtype(np.float64)
+        units = ['s', '1']
+    if window_size is None:
+        window_size = time_frequency_signal.window_size
+    if window_size is None:
+        raise ValueError('The window size of the forward transform is not known, give window_size')
+    if window_function is None:
+        window_function = time_frequency_signal.window_function or 'Hann'
+    if delta_tau is None:
+        delta_tau = time_frequency_signal.delta_tau or time_frequency_signal.delta_x[0]
+
+    # transform params, as in gabor_transform:
+    alpha_n = int(2 * np.round(window_size / delta_x + 1, decimals=0) + 1)
+    delta_tau_n = max(1, int(np.round(delta_tau / delta_x, decimals=0)))
+    P_n = int(np.round(window_size / delta_x + 1, decimals=0))
+    window_function_values = window(window_function, alpha_n)
+    if source is None:
+        n = time_frequency_signal.n[0] * delta_tau_n
+
+    real = not dtype.kind == 'c'
+    channels = time_frequency_signal.channels
+    x_end = x_start + (n - 1) * delta_x
+
+    if update is not None:
+        update.setMaximum(n)
+
+    def samples(block):
+        if dtype.kind in 'iu':
+            info = np.iinfo(dtype)
+            return np.clip(np.round(block), info.min, info.max).astype(dtype)
+        return block.astype(dtype)
+
+    blocks = istft_blocks(
+        time_frequency_signal.Y,
+        n,
+        delta_tau_n,
+        P_n,
+        window_function_values,
+        real=real,
+        block_bytes=block_bytes
+    )
+
+    if path_string is not None:
+        with Signal.TimeSignalWriter(path_string, x_start=x_start, x_end=x_end, delta_x=delta_x, dtype=dtype,
+                                     channels=channels, units=units) as writer:
+            for k_0, block in blocks:
+                writer.write(samples(block))
+                if update is not None:
+                    update.setValue(k_0 + block.shape[0])
+        return Signal.TimeSignal.static_load(path_string, lazy=True)
+
+    Y = np.zeros((n, channels), dtype=dtype)
+    for k_0, block in blocks:
+        Y[k_0:k_0 + block.shape[0]] = samples(block)
+        if update is not None:
+            update.setValue(k_0 + block.shape[0])
+
+    bit_depth = 8 * dtype.itemsize
+    return Signal.TimeSignal(
+        x_start=x_start,
+        x_end=x_end,
+        delta_x=delta_x,
+        bit_depth=bit_depth,
+        codomain=dtype.name.replace(str(bit_depth), ''),
+        channels=channels,
+        units=units,
+        Y=Y
+    )
+
+
+def wavelet_scales(window_function, frequencies, omega_0=6.0):
+    """Get the wavelet scales, in seconds, whose centre frequencies are frequencies."""
+    if window_function == 'Morlet':
+        return omega_0 / (2.0 * np.pi * frequencies)
+    if window_function == 'Mexican hat':
+        return np.sqrt(2.5) / (2.0 * np.pi * frequencies)
+    raise ValueError('Unknown wavelet {}, use Morlet or Mexican hat'.format(window_function))
 
 
-def wavelet_transform(time_signal, window_size=1.0, window_function='Morlet', delta_tau=None, delta_freq=None):
+def wavelet_f_max(window_function, f_s, omega_0=6.0):
+    """Get the highest centre frequency whose wavelet spectrum lies below the Nyquist frequency.
+
+    The band of the Morlet wavelet at scale s ends at (omega_0 + 5) / s, five standard deviations above its centre,
+    and that of the Mexican hat at 6 / s, where its spectrum has dropped below 1e-6 of its peak. Wavelets whose band is
+    cut off at Nyquist lose their compact time support, and chunked transforms no longer match whole ones.
+    """
+    if window_function == 'Morlet':
+        band = omega_0 + 5.0
+    elif window_function == 'Mexican hat':
+        band = 6.0
+    else:
+        raise ValueError('Unknown wavelet {}, use Morlet or Mexican hat'.format(window_function))
+    return f_s / 2.0 * wavelet_scales(window_function, np.array([1.0]), omega_0=omega_0)[0] * 2.0 * np.pi / band
+
+
+def wavelet_spectra(window_function, scales, n, delta_x, omega_0=6.0):
+    """Get the spectra of the wavelet at scales for FFTs of length n, of shape (scales, n).
+
+    The spectra are normalized to unit energy at every scale. They are kept per (scale, length) in wavelet_cache, so
+    chunks and channels of the same length reuse them.
+    """
+    omega = 2.0 * np.pi * np.fft.fftfreq(n, delta_x)
+    spectra = np.empty((len(scales), n), dtype=np.complex128)
+    for i, scale in enumerate(scales):
+        key = '{} {} {} {} {}'.format(window_function, omega_0, n, delta_x, scale)
+        spectrum = wavelet_cache.get(key)
+        if spectrum is None:
+            s_omega = scale * omega
+            if window_function == 'Morlet':
+                values = np.pi ** -0.25 * np.exp(-0.5 * (s_omega - omega_0) ** 2) * (omega > 0)
+            elif window_function == 'Mexican hat':
+                # Gamma(2.5) = 3 sqrt(pi) / 4
+                values = s_omega ** 2 * np.exp(-0.5 * s_omega ** 2) / np.sqrt(0.75 * np.sqrt(np.pi))
+            else:
+                raise ValueError('Unknown wavelet {}, use Morlet or Mexican hat'.format(window_function))
+            spectrum = (np.sqrt(2.0 * np.pi * scale / delta_x) * values, )
+            wavelet_cache.put(key, spectrum)
+        spectra[i] = spectrum[0]
+    return spectra
+
+
+def wavelet_chunk(Y, channel, k_0, k_1, margin, window_function, scales, omega_0, delta_x, delta_tau_n, out, block_bytes):
+    """Transform the samples k_0 to k_1 of a channel of Y into out[k_0 // delta_tau_n:, :, channel].
+
+    The FFT convolution runs over the chunk plus margin samples on both sides, zeros outside Y, which covers the support
+    of the widest wavelet. Scales are done in blocks of about block_bytes.
+    """
+    real = not np.iscomplexobj(Y)
+    segment = np.zeros((k_1 - k_0 + 2 * margin, ), dtype=np.complex128 if not real else np.float64)
+    a = max(k_0 - margin, 0)
+    b = min(k_1 + margin, Y.shape[0])
+    segment[a - (k_0 - margin):b - (k_0 - margin)] = Y[a:b, channel]
+
+    n = Fourier.next_fast_len(segment.shape[0], real=real)
+    if real:
+        spectrum = Fourier.rfft(segment, n=n)
+    else:
+        spectrum = Fourier.fft(segment, n=n)
+
+    i_0 = k_0 // delta_tau_n
+    i_1 = i_0 + len(range(k_0, k_1, delta_tau_n))
+    scales_per_block = max(1, int(block_bytes // (16 * n)))
+    for j_0 in range(0, len(scales), scales_per_block):
+        j_1 = min(j_0 + scales_per_block, len(scales))
+        psi = np.conj(wavelet_spectra(window_function, scales[j_0:j_1], n, delta_x, omega_0=omega_0)[:, :spectrum.shape[0]])
+        if real and window_function == 'Morlet':
+            # The Morlet wavelet is analytic, the negative frequencies that ifft fills with zeros are zero anyway
+            W = Fourier.ifft(spectrum * psi, n=n, axis=-1)
+        elif real:
+            W = Fourier.irfft(spectrum * psi, n=n, axis=-1)
+        else:
+            W = Fourier.ifft(spectrum * psi, n=n, axis=-1)
+        out[i_0:i_1, j_0:j_1, channel] = W[:, margin:margin + k_1 - k_0:delta_tau_n].T
+
+
+def wavelet_transform(time_signal, window_size=1.0, window_function='Morlet', delta_tau=None, delta_freq=None,
+                      f_min=None, f_max=None, omega_0=6.0, chunk_length=wavelet_chunk_length, workers=None, update=None,
+                      use_cache=True):
+    """Continuous wavelet transform of the signal, with the Morlet or the Mexican hat wavelet.
+
+    The frequencies run from f_min to f_max in steps of delta_freq. By default f_max is the highest frequency whose
+    wavelet fits below the Nyquist frequency (see wavelet_f_max), and f_min is the centre frequency of the wavelet that
+    spans window_size (six standard deviations). The transform is sampled
+    every delta_tau. It is an FFT convolution of chunks of chunk_length samples with the wavelets at all scales. Chunks
+    and channels are transformed in workers threads, all cores by default, and each thread's transforms get an equal share
+    of the Fourier.workers transform threads. Results are kept in Cache.cache.
+    """
+
+    if use_cache:
+        time_frequency_signal = Cache.cache.cached(
+            time_signal,
+            'wavelet',
+            lambda: wavelet_transform(
+                time_signal,
+                window_size,
+                window_function,
+                delta_tau,
+                delta_freq,
+                f_min=f_min,
+                f_max=f_max,
+                omega_0=omega_0,
+                chunk_length=chunk_length,
+                workers=workers,
+                update=update,
+                use_cache=False
+            ),
+            window_size=window_size,
+            window_function=window_function,
+            delta_tau=delta_tau,
+            delta_freq=delta_freq,
+            f_min=f_min,
+            f_max=f_max,
+            omega_0=omega_0
+        )
+        time_frequency_signal.time_signal = time_signal
+        return time_frequency_signal
 
     if time_signal.bit_depth in [1, 2, 8, 16, 32]:
         bit_depth = 64
@@ -288,77 +721,312 @@ def wavelet_transform(time_signal, window_size=1.0, window_function='Morlet', de
 
     if delta_tau is None:
         delta_tau = time_signal.delta_x
+    highest = wavelet_f_max(window_function, time_signal.f_s, omega_0=omega_0)
+    if f_max is None:
+        f_max = highest
+    if f_min is None:
+        f_min = wavelet_scales(window_function, np.array([1.0]), omega_0=omega_0)[0] / (window_size / 6.0)
     if delta_freq is None:
-        delta_freq = (time_signal.X[-1] - time_signal.X[0]) / (time_signal.n - 1.0)
+        # With a single frequency, the step only sets the spacing of the frequency axis
+        delta_freq = (f_max - f_min) / 99.0 if f_max > f_min else 1.0
+    if f_min <= 0 or f_max < f_min:
+        raise ValueError('The frequencies must run from f_min > 0 to f_max >= f_min')
+    if f_max > highest * (1.0 + 1e-9):
+        raise ValueError('f_max must be at most {:.6g}, the wavelets of higher frequencies cross Nyquist'.format(highest))
+    if delta_freq <= 0:
+        raise ValueError('delta_freq must be positive')
 
     # transform params:
-    alpha_n = int(2 * np.round(window_size / time_signal.delta_x + 1, decimals=0) + 1)
-    delta_tau_n = int(np.round(delta_tau / time_signal.delta_x, decimals=0))
-    delta_f_n = int(np.round(time_signal.f_s / delta_freq + 1, decimals=0))
-    delta_o_n = alpha_n - delta_tau_n
-    delta_o = time_signal.delta_x * (delta_o_n - 1)
-    P_n = int(np.round(window_size / time_signal.delta_x + 1, decimals=0))
+    delta_tau_n = max(1, int(np.round(delta_tau / time_signal.delta_x, decimals=0)))
+    freq = np.arange(f_min, f_max + 0.5 * delta_freq, delta_freq)
+    freq = freq[freq <= f_max + 1e-9 * f_max]
+    scales = wavelet_scales(window_function, freq, omega_0=omega_0)
+    margin = int(np.ceil(6.0 * scales.max() / time_signal.delta_x))
+    chunk_length = max(delta_tau_n, (chunk_length // delta_tau_n) * delta_tau_n)
+
+    N = [len(range(0, time_signal.n, delta_tau_n)), freq.shape[0]]
+    Y_w = np.zeros((N[0], N[1], time_signal.channels), dtype=eval('np.complex{}'.format(bit_depth)))
+
+    jobs = [(channel, k_0) for channel in range(time_signal.channels) for k_0 in range(0, time_signal.n, chunk_length)]
+    if update is not None:
+        update.setMaximum(len(jobs))
+
+    # Threads rather than processes: the FFTs release the GIL, and the chunks write straight into Y_w. The cores are
+    # shared between the pool threads and the threads of their transforms
+    threads = max(1, min(workers or os.cpu_count() or 1, len(jobs)))
+    fft_threads = max(1, (Fourier.workers or 1) // threads)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads, initializer=Fourier.set_thread_workers,
+                                               initargs=(fft_threads, )) as executor:
+        futures = [
+            executor.submit(
+                wavelet_chunk,
+                time_signal.Y,
+                channel,
+                k_0,
+                min(k_0 + chunk_length, time_signal.n),
+                margin,
+                window_function,
+                scales,
+                omega_0,
+                time_signal.delta_x,
+                delta_tau_n,
+                Y_w,
+                stft_block_bytes
+            ) for channel, k_0 in jobs
+        ]
+        for done, future in enumerate(concurrent.futures.as_completed(futures)):
+            future.result()
+            if update is not None:
+                update.setValue(done + 1)
+
+    time_frequency_signal = Signal.TimeFrequencySignal(
+        x_start=[float(time_signal.x_start), float(freq[0])],
+        x_end=[float(time_signal.x_start) + (N[0] - 1) * delta_tau_n * time_signal.delta_x, float(freq[-1])],
+        delta_x=[delta_tau_n * time_signal.delta_x, delta_freq],
+        bit_depth=bit_depth,
+        codomain='complex',
+        channels=time_signal.channels,
+        Y=Y_w
+    )
+    time_frequency_signal.time_signal = time_signal
 
-    f = 20.0
-    sigma = 0.2 * window_size
+    report = {
+        'scales': N[1],
+        'delta_tau_n': delta_tau_n,
+        'margin': margin,
+        'chunks': len(jobs)
+    }
 
-    window_function_values = np.zeros((alpha_n,), dtype=np.complex128)
-    if window_function == 'Morlet':
-        for x in range(alpha_n):
-            window_function_values[x] = np.exp(np.complex(-0.5 * (x / sigma) ** 2), 2 * np.pi * f * x)
-    else:
-        for x in range(alpha_n):
-            window_function_values[x] = np.exp(np.complex(-0.5 * (x / sigma) ** 2), 2 * np.pi * f * x)
-
-    X = np.linspace(0.0, time_signal.delta_x * (alpha_n - 1), num=alpha_n, dtype=np.float64)
-
-    morlet_wavelet = Signal.TimeSignal.from_data(X, window_function_values)
-
-    # # Transform sample space:
-    # x_start = [time_signal.X[0], -time_signal.f_s / 2]
-    # x_end = [
-    #     time_signal.X[0] + delta_tau_n * time_signal.delta_x * (np.round(time_signal.N / delta_tau_n, decimals=0) - 1),
-    #     time_signal.f_s / 2]
-    # delta_x = [delta_tau_n * time_signal.delta_x, time_signal.f_s / np.round(time_signal.f_s / delta_freq, decimals=0)]
-    # f_s = [1 / delta_x[0], 1 / delta_x[1]]
-    # N = [int(np.round(time_signal.N / delta_tau_n, decimals=0)),
-    #      int(np.round(time_signal.f_s / delta_freq + 1, decimals=0))]
-    #
-    # tau = np.linspace(x_start[0], x_end[0], num=N[0], dtype=np.float64)
-    # freq = np.linspace(x_start[1], x_end[1], num=N[1], dtype=np.float64)
-    #
-    # Y_g = np.zeros((tau.shape[0], freq.shape[0], time_signal.channels), dtype=eval('np.complex{}'.format(bit_depth)))
-    #
-    # Y = time_signal.Y
-    # Y = np.concatenate(
-    #     (np.zeros((P_n, time_signal.channels), dtype=Y.dtype), Y, np.zeros((P_n, time_signal.channels), dtype=Y.dtype)),
-    #     axis=0)
-    #
-    # for channel in range(time_signal.channels):
-    #
-    #     for i in range(N[0]):
-    #         k = i * delta_tau_n
-    #         Y_g[i, :, channel] = np.fft.fftshift(
-    #             np.fft.fft(Y[k:(k + alpha_n), channel] * window_function_values, n=N[1], axis=0)).astype(
-    #             eval('np.complex{}'.format(bit_depth)))
-    #
-    # time_frequency_signal = ss.TimeFrequencySignal.from_data([tau, freq], Y_g)
-    # time_frequency_signal.time_signal = time_signal
-    #
-    # report = {
-    #     'alpha_n': alpha_n,
-    #     'delta_tau_n': delta_tau_n,
-    #     'delta_f_n': delta_f_n,
-    #     'delta_o_n': delta_o_n,
-    #     'delta_o': delta_o,
-    #     'P_n': P_n
-    # }
-    #
-    # for key, value in report.items():
-    #     print('{}: {}'.format(key, value))
-
-    return morlet_wavelet
+    for key, value in report.items():
+        logger.debug('{}: {}'.format(key, value))
 
+    return time_frequency_signal
 
 
+def benchmark_formats(signal=None, formats=None, directory=None, repeats=1, windows=100, window_length=4096):
+    """Report write throughput, read throughput, random window reads and file size of the signal file layouts.
+
+    formats maps a name to the keyword arguments given to save(). The default signal is one minute of a noisy, two
+    channel 16 bit recording.
+    """
+
+    if signal is None:
+        signal = Signal.TimeSignal(x_start=0.0, x_end=60.0, delta_x=1.0 / 44100.0, bit_depth=16, codomain='int', channels=2)
+        t = np.arange(signal.n) / 44100.0
+        for j in range(signal.channels):
+            clean = 8000.0 * np.sin(2.0 * np.pi * 440.0 * (j + 1) * t)
+            signal.Y[:, j] = (clean + 200.0 * np.random.standard_normal(signal.n)).astype(np.int16)
+
+    if formats is None:
+        formats = {
+            'contiguous': {},
+            'chunked': {'chunks': (65536, signal.channels)},
+            'gzip': {'compression': 'gzip'},
+            'gzip shuffle': {'compression': 'gzip', 'shuffle': True},
+            'lzf': {'compression': 'lzf'},
+            'lzf shuffle': {'compression': 'lzf', 'shuffle': True}
+        }
+
+    if directory is None:
+        temporary_directory = tempfile.TemporaryDirectory()
+        directory = temporary_directory.name
+    else:
+        temporary_directory = None
+
+    size = signal.Y.nbytes / 1e6
+    starts = np.random.randint(0, max(signal.n - window_length, 1), size=windows)
+    report = dict()
+
+    for name, options in formats.items():
+        path = pathlib.Path(directory).joinpath('{}.h5'.format(name.replace(' ', '_')))
+        write_time = 0.0
+        read_time = 0.0
+        window_time = 0.0
+        for r in range(repeats):
+            start_time = time.perf_counter()
+            signal.save(path, **options)
+            write_time += time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            Signal.TimeSignal.static_load(path)
+            read_time += time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            lazy_signal = Signal.TimeSignal.static_load(path, lazy=True)
+            for k in starts:
+                np.asarray(lazy_signal.Y[k:k + window_length, :])
+            lazy_signal.close()
+            window_time += time.perf_counter() - start_time
+
+        report[name] = {
+            'write MB/s': repeats * size / write_time,
+            'read MB/s': repeats * size / read_time,
+            'window reads/s': repeats * windows / window_time,
+            'size MB': path.stat().st_size / 1e6,
+            'ratio': size * 1e6 / path.stat().st_size
+        }
+
+    signal.path = None
+    if temporary_directory is not None:
+        temporary_directory.cleanup()
 
+    for key, value in report.items():
+        print('{}: {}'.format(key, ', '.join(['{} {:.2f}'.format(k, v) for k, v in value.items()])))
+
+    return report
+
+
+def benchmark_gabor(signal=None, window_size=0.01, delta_tau=None, delta_freq=50.0, repeats=1):
+    """Report the time the block and the loop methods of gabor_transform take on signal, and their largest difference.
+
+    The default signal is two seconds of a noisy, two channel 16 bit recording. delta_tau defaults to the sample
+    interval, one frame per sample.
+    """
+
+    if signal is None:
+        signal = Signal.TimeSignal(x_start=0.0, x_end=2.0, delta_x=1.0 / 8000.0, bit_depth=16, codomain='int', channels=2)
+        t = np.arange(signal.n) / 8000.0
+        for j in range(signal.channels):
+            clean = 8000.0 * np.sin(2.0 * np.pi * 440.0 * (j + 1) * t)
+            signal.Y[:, j] = (clean + 200.0 * np.random.standard_normal(signal.n)).astype(np.int16)
+
+    report = dict()
+    results = dict()
+    for method in ['block', 'loop']:
+        start_time = time.perf_counter()
+        for r in range(repeats):
+            results[method] = gabor_transform(
+                signal,
+                window_size=window_size,
+                delta_tau=delta_tau,
+                delta_freq=delta_freq,
+                use_cache=False,
+                method=method
+            )
+        duration = (time.perf_counter() - start_time) / repeats
+        report[method] = {
+            'seconds': duration,
+            'frames/s': results[method].n[0] / duration
+        }
+    report['speedup'] = report['loop']['seconds'] / report['block']['seconds']
+    report['max difference'] = float(np.max(np.absolute(results['block'].Y - results['loop'].Y)))
+
+    for key, value in report.items():
+        if isinstance(value, dict):
+            print('{}: {}'.format(key, ', '.join(['{} {:.2f}'.format(k, v) for k, v in value.items()])))
+        else:
+            print('{}: {}'.format(key, value))
+
+    return report
+
+
+def import_batch(sources, output_directory, processes=None, manifest='manifest.json', chunks=None, compression=None,
+                 shuffle=False, update=None):
+    """Convert WAV and CSV recordings to signal files in a pool of worker processes.
+
+    sources is a directory (all .wav and .csv files in it), a glob pattern, a file, or a list of these. Every recording is
+    written to output_directory as <name>.h5, with the layout options of Signal.save. WAV files are streamed block by
+    block, so memory use does not grow with their length. A manifest with the source, output and format of every
+    recording, or the error if it failed, is written to output_directory. A failing file does not stop the others.
+    Returns the manifest entries.
+    """
+
+    if isinstance(sources, (str, pathlib.Path)):
+        sources = [sources]
+    expanded = []
+    for source in sources:
+        if pathlib.Path(source).is_dir():
+            expanded += [path for path in pathlib.Path(source).iterdir() if path.suffix.lower() in ['.wav', '.csv']]
+        elif pathlib.Path(source).is_file():
+            expanded.append(pathlib.Path(source))
+        else:
+            expanded += [pathlib.Path(path) for path in glob.glob(str(source))]
+    sources = sorted(set(expanded))
+
+    output_directory = pathlib.Path(output_directory)
+    output_directory.mkdir(parents=True, exist_ok=True)
+
+    # Give recordings with the same name distinct outputs
+    outputs = []
+    for source in sources:
+        output = output_directory.joinpath('{}.h5'.format(source.stem))
+        k = 1
+        while output in outputs:
+            output = output_directory.joinpath('{}_{}.h5'.format(source.stem, k))
+            k += 1
+        outputs.append(output)
+
+    options = {'chunks': chunks, 'compression': compression, 'shuffle': shuffle}
+
+    # Set progress max
+    if update is not None:
+        update.setMaximum(len(sources))
+
+    entries = [{'source': str(source), 'output': str(output), 'error': None} for source, output in zip(sources, outputs)]
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+
+        futures = dict()
+        for i, (source, output) in enumerate(zip(sources, outputs)):
+            futures[executor.submit(_import_job, str(source), str(output), options)] = i
+
+        for done, future in enumerate(concurrent.futures.as_completed(futures)):
+            i = futures[future]
+            try:
+                entries[i].update(future.result())
+            except Exception as error:
+                entries[i]['error'] = repr(error)
+            if entries[i]['error'] is None:
+                logger.info('Imported {}'.format(entries[i]['source']))
+            else:
+                logger.error('Import of {} failed: {}'.format(entries[i]['source'], entries[i]['error']))
+            if update is not None:
+                update.setValue(done + 1)
+
+    if manifest is not None:
+        with open(output_directory.joinpath(manifest), 'w') as f:
+            json.dump(entries, f, indent=4)
+
+    return entries
+
+
+def _import_job(source, output, options):
+    """Convert one recording in a worker. Returns its manifest entry."""
+    if pathlib.Path(source).suffix.lower() == '.wav':
+        header = Wav.read_header(source)
+        delta_x = 1.0 / header['f_s']
+        with Signal.TimeSignalWriter(
+                output,
+                x_start=0.0,
+                x_end=delta_x * (header['frames'] - 1),
+                delta_x=delta_x,
+                dtype=Wav.sample_dtype(header),
+                channels=header['channels'],
+                **options
+        ) as writer:
+            for block in Wav.read_blocks(source, header=header):
+                writer.write(block)
+        dtype = Wav.sample_dtype(header)
+        # 24-bit samples are stored as int32, the manifest records the width of the recording
+        bit_depth = header['bits']
+        n = writer.n
+        f_s = float(header['f_s'])
+        channels = header['channels']
+    elif pathlib.Path(source).suffix.lower() == '.csv':
+        signal = Signal.TimeSignal.from_csv(source)
+        signal.save(output, **options)
+        dtype = signal.Y.dtype
+        bit_depth = 8 * dtype.itemsize
+        n = signal.n
+        f_s = float(signal.f_s)
+        channels = signal.channels
+    else:
+        raise ValueError('Unknown file type {}'.format(pathlib.Path(source).suffix))
+    return {
+        'n': n,
+        'f_s': f_s,
+        'duration': (n - 1) / f_s,
+        'channels': channels,
+        'bit_depth': bit_depth,
+        'codomain': dtype.name.replace(str(8 * dtype.itemsize), '')
+    }
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+
+"""Signal store: many signals in one HDF5 file, with a metadata index
+
+Every signal is written to its own group under 'signals', in the same layout as a signal file. The index dataset holds
+one row of metadata per signal, so signals can be looked up without opening their groups. Signals that are read lazily
+share the one open handle of the store.
+
+A signal in a store is referenced as '<store path>::<signal name>', see reference() and resolve().
+"""
+
+# standard library
+import logging
+import pathlib
+import weakref
+# 3rd party
+import h5py
+import numpy as np
+# Internals
+from MechSys import Signal
+# Instantiate logger:
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+store_version = 1
+separator = '::'
+
+index_dtype = np.dtype([
+    ('name', h5py.string_dtype()),
+    ('signal_type', h5py.string_dtype()),
+    ('f_s', 'f8'),
+    ('duration', 'f8'),
+    ('x_start', 'f8'),
+    ('x_end', 'f8'),
+    ('n', 'i8'),
+    ('channels', 'i8'),
+    ('bit_depth', 'i8'),
+    ('codomain', h5py.string_dtype()),
+    ('x_unit', h5py.string_dtype()),
+    ('y_unit', h5py.string_dtype())
+])
+
+signal_classes = {
+    'time': Signal.TimeSignal,
+    'frequency': Signal.FrequencySignal
+}
+
+
+def reference(path_string, name):
+    """Get the reference string of the signal name in the store at path_string."""
+    return '{}{}{}'.format(path_string, separator, name)
+
+
+def split(reference_string):
+    """Split a reference string into the store path and the signal name. The name is None for a plain signal file."""
+    reference_string = str(reference_string)
+    if separator not in reference_string:
+        return reference_string, None
+    path_string, name = reference_string.rsplit(separator, 1)
+    return path_string, name
+
+
+def stem(reference_string):
+    """Get a short name for the signal a reference string points to: the signal name or the file stem."""
+    path_string, name = split(reference_string)
+    if name is None:
+        return pathlib.Path(path_string).stem
+    return name
+
+
+_stores = dict()
+
+
+def open_store(path_string, mode='r'):
+    """Get an open store for path_string, reusing the store opened before in this process if it is still open.
+
+    A store that is open for writing also serves reading. A store that is open read-only is opened again for writing
+    when mode asks for it, and the signals read lazily from it keep reading through the new handle.
+    """
+    key = str(pathlib.Path(path_string).resolve())
+    store = _stores.get(key)
+    if store is not None and store.file is not None and not mode == 'r' and store.mode == 'r':
+        store.reopen(mode)
+    if store is None or store.file is None:
+        store = SignalStore(path_string, mode=mode)
+        _stores[key] = store
+    return store
+
+
+def resolve(reference_string, lazy=True):
+    """Load the signal a reference string points to, either a signal in a store or a signal file."""
+    path_string, name = split(reference_string)
+    if name is None:
+        return Signal.TimeSignal.static_load(path_string, lazy=lazy)
+    return open_store(path_string).get(name, lazy=lazy)
+
+
+class SignalStore:
+    """Many signals in one HDF5 file, indexed by name. mode is an h5py file mode, by default the file is created if it
+    does not exist.
+
+    Example:
+        with SignalStore('recordings.h5') as store:
+            store.put('run_1', signal)
+            names = store.query(f_s=48000, duration=(10, None))
+    """
+
+    def __init__(self, path_string, mode='a'):
+        self.path = pathlib.Path(path_string)
+        self.mode = mode
+        # Arrays that read lazily through the handle of the store, by id, see reopen
+        self.readers = weakref.WeakValueDictionary()
+        self.file = h5py.File(path_string, mode)
+        if 'signals' not in self.file:
+            if mode == 'r':
+                self.file.close()
+                self.file = None
+                raise ValueError('{} is not a signal store'.format(path_string))
+            self.file.create_group('signals')
+            self.file.create_dataset('index', shape=(0,), maxshape=(None,), dtype=index_dtype, chunks=(256,))
+            self.file.attrs['store_version'] = store_version
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __contains__(self, name):
+        return name in self.file['signals']
+
+    def __len__(self):
+        return self.file['index'].shape[0]
+
+    def __str__(self):
+        return '{} ({} signals)'.format(self.path.name, len(self))
+
+    def close(self):
+        """Close the file. Signals that were read lazily from the store can no longer be read after this."""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def reopen(self, mode):
+        """Open the file again in mode, and move the signals read lazily from the store to the new handle.
+
+        HDF5 cannot open a file for writing while it is open read-only, so the old handle is closed first. If the file
+        can not be opened in mode, it is opened in the old mode again before the error is raised.
+        """
+        self.file.close()
+        try:
+            self.file = h5py.File(self.path, mode)
+            self.mode = mode
+        except OSError:
+            self.file = h5py.File(self.path, self.mode)
+            raise
+        finally:
+            for array in list(self.readers.values()):
+                array.reopen(self.file)
+
+    def put(self, name, signal, chunks=None, compression=None, compression_opts=None, shuffle=False, overwrite=True):
+        """Write signal to the store as name. See Signal.save for the layout options. The path of the signal is set
+        to its reference in the store."""
+        if separator in name or '/' in name:
+            raise ValueError('A signal name may not contain "{}" or "/"'.format(separator))
+        if not isinstance(signal, (Signal.TimeSignal, Signal.FrequencySignal)):
+            raise TypeError('Only time and frequency signals can be stored, not {}'.format(type(signal).__name__))
+        if name in self:
+            if not overwrite:
+                raise ValueError('{} already holds a signal {}'.format(self.path.name, name))
+            self.remove(name)
+
+        group = self.file['signals'].create_group(name)
+        signal.write(group, chunks=chunks, compression=compression, compression_opts=compression_opts, shuffle=shuffle)
+
+        index = self.file['index']
+        index.resize((index.shape[0] + 1,))
+        index[-1] = self.index_row(name, signal)
+        self.file.flush()
+
+        signal.path = pathlib.Path(reference(self.path, name))
+        return signal.path
+
+    @staticmethod
+    def index_row(name, signal):
+        """Get the index row of signal."""
+        x_start = float(signal.x_start)
+        x_end = float(signal.x_end)
+        return (
+            name,
+            signal.signal_type,
+            float(signal.f_s),
+            x_end - x_start + (1 / signal.f_s if signal.signal_type == 'time' and signal.f_s > 0 else 0),
+            x_start,
+            x_end,
+            int(signal.n),
+            int(signal.channels),
+            int(signal.bit_depth),
+            str(signal.codomain),
+            str(signal.units[0]),
+            str(signal.units[1])
+        )
+
+    def get(self, name, lazy=True):
+        """Read the signal name from the store. If lazy, X and Y are read on demand, through the handle of the store."""
+        if name not in self:
+            raise KeyError('{} holds no signal {}'.format(self.path.name, name))
+        group = self.file['signals'][name]
+        signal = signal_classes[str(group.attrs['signal_type'])]()
+        signal.read(group, lazy=lazy, shared=True)
+        signal.path = pathlib.Path(reference(self.path, name))
+        arrays = (signal.X if isinstance(signal.X, list) else [signal.X]) + [signal.Y]
+        for factor, Y_min, Y_max in getattr(signal, 'pyramid', None) or []:
+            arrays.extend([Y_min, Y_max])
+        for array in arrays:
+            if isinstance(array, Signal.LazyDataset):
+                array.readers = self.readers
+                self.readers[id(array)] = array
+        return signal
+
+    def remove(self, name):
+        """Remove the signal name from the store. The file does not shrink, see h5repack."""
+        if name not in self:
+            raise KeyError('{} holds no signal {}'.format(self.path.name, name))
+        del self.file['signals'][name]
+        index = self.file['index']
+        rows = index[()]
+        rows = rows[np.array([not self.decode(row['name']) == name for row in rows], dtype=bool)]
+        index.resize((rows.shape[0],))
+        if rows.shape[0] > 0:
+            index[:] = rows
+
+    def names(self):
+        """Get the names of the signals in the store, in the order they were put."""
+        return [self.decode(name) for name in self.file['index']['name']]
+
+    def table(self):
+        """Get the index as a list of dicts, one per signal."""
+        rows = self.file['index'][()]
+        return [{field: self.decode(row[field]) for field in index_dtype.names} for row in rows]
+
+    def query(self, **conditions):
+        """Get the names of the signals whose index rows match all conditions.
+
+        Every condition is a field of the index (f_s, duration, channels, x_unit, ...) with either a value it must equal,
+        or a (low, high) tuple it must lie within, bounds included. A bound of None is open.
+        """
+        rows = self.file['index'][()]
+        keep = np.ones(rows.shape[0], dtype=bool)
+        for field, condition in conditions.items():
+            if field not in index_dtype.names:
+                raise ValueError('{} is not an index field, use one of {}'.format(field, ', '.join(index_dtype.names)))
+            values = rows[field]
+            if values.dtype.kind == 'O':
+                values = np.array([self.decode(value) for value in values], dtype=object)
+            if isinstance(condition, tuple):
+                low, high = condition
+                if low is not None:
+                    keep &= values >= low
+                if high is not None:
+                    keep &= values <= high
+            else:
+                keep &= values == condition
+        return [self.decode(name) for name in rows['name'][keep]]
+
+    @staticmethod
+    def decode(value):
+        if isinstance(value, bytes):
+            return value.decode('utf-8')
+        if isinstance(value, np.generic):
+            return value.item()
+        return value
@@ -9,8 +9,11 @@ import pathlib
 from abc import ABC
 # 3rd party
 import h5py
+import numpy as np
 # Internals
 from MechSys import Signal
+from MechSys import Store
+from MechSys import Functions
 # Instantiate logger:
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -77,6 +80,24 @@ class System:
                     output_components.append(component)
         return output_components
 
+    def get_axis(self):
+        """Start, end, sample spacing and number of samples of the axis that pad_signals would make."""
+        x_start = None
+        x_end = None
+        delta_x = None
+        for s, input_signal in enumerate([input_component[1].signal for input_component in self.get_input_components()]):
+            if s == 0:
+                x_start = input_signal.x_start
+                x_end = input_signal.x_end
+                delta_x = input_signal.delta_x
+            else:
+                if input_signal.x_start < x_start:
+                    x_start = input_signal.x_start
+                if input_signal.x_end > x_end:
+                    x_end = input_signal.x_end
+        n = int(np.round(((x_end - x_start) / delta_x) + 1.0, decimals=0))
+        return x_start, x_end, delta_x, n
+
     def pad_signals(self):
         x_start = None
         x_end = None
@@ -113,7 +134,7 @@ class System:
                 )
                 start_index = new_signal.get_nearest_sample_index(input_component[1].signal.X[0])
                 end_index = new_signal.get_nearest_sample_index(input_component[1].signal.X[-1])
-                new_signal.Y[start_index:end_index, :] = input_component[1].signal.Y[:, :]
+                new_signal.Y[start_index:end_index + 1, :] = input_component[1].signal.Y[:, :]
                 self.components[input_component[0]].signal = new_signal
         for output_component in self.get_output_components():
             new_signal = Signal.TimeSignal(
@@ -206,7 +227,7 @@ class System:
                 f.attrs['connector_{}_b'.format(c)] = connector[1][0]
                 f.attrs['connector_{}_j'.format(c)] = connector[1][1]
 
-    def load(self, path_string):
+    def load(self, path_string, load_signals=True):
 
         self.path = pathlib.Path(path_string)
 
@@ -223,10 +244,13 @@ class System:
             for c in range(num_components):
                 component_type = f.attrs['component_{}'.format(c)]
                 if component_type == 'input':
-                    signal = Signal.TimeSignal.static_load(f.attrs['component_{}_path'.format(c)])
+                    if load_signals:
+                        signal = Store.resolve(f.attrs['component_{}_path'.format(c)], lazy=True)
+                    else:
+                        signal = None
                     self.add_input(signal)
                 elif component_type == 'system':
-                    system = System.static_load(f.attrs['component_{}_path'.format(c)])
+                    system = System.static_load(f.attrs['component_{}_path'.format(c)], load_signals=False)
                     self.add_system(system)
                 elif component_type == 'gain':
                     coefficient = float(f.attrs['component_{}_coefficient'.format(c)])
@@ -266,9 +290,9 @@ class System:
                 self.add_connector(((a, i), (b, j)))
 
     @staticmethod
-    def static_load(path_string):
+    def static_load(path_string, load_signals=True):
         system = System()
-        system.load(path_string=path_string)
+        system.load(path_string=path_string, load_signals=load_signals)
         return system
 
 
@@ -347,14 +371,26 @@ class SysSystem(SysComponent):
 
 class SysInput(SysComponent):
 
+    # Samples read at once by transfer, so lazily loaded signals are not read from file one sample at a time
+    block_length = 65536
+
     def __init__(self, signal):
         super().__init__()
         self.signal = signal
         self.out_nodes = [Node()]
         self.type = 'input'
+        self.block = None
+        self.block_source = None
+        self.block_start = 0
 
     def transfer(self, k):
-        self.out_nodes[0].value = self.signal.Y[k, 0]
+        Y = self.signal.Y
+        if self.block_source is not Y or not self.block_start <= k < self.block_start + self.block.shape[0]:
+            # Slices of arrays in memory are views, so changes to Y show up in the block
+            self.block = np.asarray(Y[k:k + self.block_length, 0])
+            self.block_source = Y
+            self.block_start = k
+        self.out_nodes[0].value = self.block[k - self.block_start]
 
 
 class SysOutput(SysComponent):
@@ -380,6 +416,9 @@ class SysAdd(SysComponent):
     def transfer(self):
         self.out_nodes[0].value = self.in_nodes[0].value + self.in_nodes[1].value
 
+    def transfer_block(self, blocks):
+        return [blocks[0] + blocks[1]]
+
 
 class SysAddN(SysComponent):
 
@@ -396,6 +435,12 @@ class SysAddN(SysComponent):
         for in_node in self.in_nodes:
             self.out_nodes[0].value += in_node.value
 
+    def transfer_block(self, blocks):
+        out = 0
+        for block in blocks:
+            out = out + block
+        return [out]
+
 
 class SysMultiply(SysComponent):
 
@@ -408,6 +453,9 @@ class SysMultiply(SysComponent):
     def transfer(self):
         self.out_nodes[0].value = self.in_nodes[0].value * self.in_nodes[1].value
 
+    def transfer_block(self, blocks):
+        return [blocks[0] * blocks[1]]
+
 
 class SysMultiplyN(SysComponent):
 
@@ -436,6 +484,9 @@ class SysSplit(SysComponent):
         self.out_nodes[0].value = self.in_nodes[0].value
         self.out_nodes[1].value = self.in_nodes[0].value
 
+    def transfer_block(self, blocks):
+        return [blocks[0], blocks[0]]
+
 
 class SysSum(SysComponent):
 
@@ -450,6 +501,17 @@ class SysSum(SysComponent):
         self.out_nodes[0].value = self.in_nodes[0].value + self.memory
         self.memory = self.out_nodes[0].value
 
+    def transfer_block(self, blocks):
+        # Accumulate in the type that transfer adds in, so integer samples wrap around as they do there
+        dtype = np.result_type(blocks[0], self.memory)
+        memory = np.broadcast_to(np.asarray(self.memory, dtype=dtype), (1, ) + blocks[0].shape[1:])
+        out = np.cumsum(np.concatenate((memory, blocks[0])), axis=0, dtype=dtype)[1:]
+        if out.ndim == 1:
+            self.memory = out[-1].item()
+        else:
+            self.memory = out[-1]
+        return [out]
+
 
 class SysDelay(SysComponent):
 
@@ -461,9 +523,25 @@ class SysDelay(SysComponent):
         self.memory = 0
 
     def transfer(self):
+        self.emit()
+        self.latch()
+
+    def emit(self):
         self.out_nodes[0].value = self.memory
+
+    def latch(self):
         self.memory = self.in_nodes[0].value
 
+    def transfer_block(self, blocks):
+        dtype = np.result_type(blocks[0], self.memory)
+        memory = np.broadcast_to(np.asarray(self.memory, dtype=dtype), (1, ) + blocks[0].shape[1:])
+        out = np.concatenate((memory, blocks[0][:-1]))
+        if out.ndim == 1:
+            self.memory = blocks[0][-1].item()
+        else:
+            self.memory = blocks[0][-1]
+        return [out]
+
 
 class SysGain(SysComponent):
 
@@ -477,6 +555,9 @@ class SysGain(SysComponent):
     def transfer(self):
         self.out_nodes[0].value = self.coefficient * self.in_nodes[0].value
 
+    def transfer_block(self, blocks):
+        return [self.coefficient * blocks[0]]
+
 
 class SysFunction(SysComponent):
 
@@ -488,11 +569,18 @@ class SysFunction(SysComponent):
         self.function_string = function_string
 
     def function(self, x):
-        return eval(self.function_string)
+        return Functions.compile_function(self.function_string)(x)
 
     def transfer(self):
         self.out_nodes[0].value = self.function(self.in_nodes[0].value)
 
+    def transfer_block(self, blocks):
+        x = blocks[0]
+        try:
+            return [np.broadcast_to(self.function(x), x.shape)]
+        except (TypeError, ValueError):
+            return [np.reshape(np.asarray([self.function(value) for value in x.ravel().tolist()]), x.shape)]
+
 
 
 
@@ -4,11 +4,22 @@
 
 # standard library
 import logging
+import concurrent.futures
+import copy
+import glob
+import itertools
+import pathlib
+import time
 # 3rd party
-
+import numpy as np
+import h5py
 # Internals
+from . import Fourier
 from . import Graph
 from . import System
+from . import Signal
+from . import Store
+from . import Functions
 # Instantiate logger:
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -22,7 +33,24 @@ def calculate(system):
     return result
 
 
-def simulate(system, update=None):
+def simulate(system, update=None, method='step', timing='step'):
+    """Simulate the system with one of the engines. See step_timing for the timing of the engines other than step."""
+
+    if method == 'compiled':
+        return simulate_compiled(system, update=update, timing=timing)
+    elif method == 'block':
+        return simulate_block(system, update=update, timing=timing)
+    elif method == 'linear':
+        return simulate_linear(system, update=update, timing=timing)
+    elif method == 'auto':
+        if use_linear(timed(system, timing), [component.signal.Y.dtype for component in system.get_input_components(get_index=False)]):
+            return simulate_linear(system, update=update, timing=timing)
+        else:
+            return simulate_block(system, update=update, timing=timing)
+    elif not method == 'step':
+        raise Exception('Unknown method type')
+    elif not timing == 'step':
+        raise ValueError('The step method only simulates step timing')
 
     # Pad input signals
     system_axis = system.pad_signals()
@@ -69,7 +97,12 @@ def simulate(system, update=None):
     return result
 
 
-def simulate_2(system, update=None):
+def simulate_compiled(system, update=None, chunk_size=65536, timing='step'):
+    """Simulate the system by compiling it to a flat execution plan first.
+
+    Components are evaluated in topological order. With timing='step' the output is the same as that of the step
+    method, with timing='instant' a sample propagates through the whole diagram in one step, see step_timing.
+    """
 
     # Pad input signals
     system_axis = system.pad_signals()
@@ -78,45 +111,972 @@ def simulate_2(system, update=None):
     if update is not None:
         update.setMaximum(system_axis.shape[0] - 1)
 
-    # Ensure initial conditions
+    # Compile and ensure initial conditions
+    plan = compile_system(timed(system, timing))
+    plan.reset()
+
+    # Simulate
+    plan.run(0, system_axis.shape[0], update=update, chunk_size=chunk_size)
+
+    # Prepare output
+    result = []
+    for output_component in system.get_output_components(get_index=False):
+        result.append(output_component.signal)
+
+    return result
+
+
+def benchmark(system, methods=('step', 'compiled', 'block'), repeats=1):
+    """Report the simulation throughput of each method in samples per second."""
+
+    report = dict()
+
+    for method in methods:
+        elapsed = 0.0
+        samples = 0
+        for r in range(repeats):
+            start_time = time.perf_counter()
+            simulate(system, method=method)
+            elapsed += time.perf_counter() - start_time
+            samples += system.system_axis.shape[0]
+        report[method] = samples / elapsed
+
+    for key, value in report.items():
+        print('{}: {:.0f} samples/s'.format(key, value))
+
+    return report
+
+
+def benchmark_nested(levels=3, samples=100000, methods=('step', 'compiled', 'block'), repeats=1):
+    """Benchmark a system that nests levels systems into each other.
+
+    Every level feeds its input both through the level below and through a delay, and adds the two.
+    """
+
+    def nested_system(depth):
+        system = System.System()
+        system.add_input(None)
+        system.add_split()
+        system.add_delay()
+        system.add_add()
+        system.add_output()
+        if depth == 1:
+            system.add_gain(0.5)
+        else:
+            system.add_system(nested_system(depth - 1))
+        for connector in [((0, 0), (1, 0)), ((1, 0), (5, 0)), ((5, 0), (3, 0)), ((1, 1), (2, 0)), ((2, 0), (3, 1)), ((3, 0), (4, 0))]:
+            system.add_connector(connector)
+        return system
+
+    signal = Signal.TimeSignal(x_start=0.0, x_end=(samples - 1) / 44100.0, delta_x=1.0 / 44100.0, bit_depth=64, codomain='float')
+    signal.Y[:, 0] = np.random.standard_normal(signal.n)
+
+    system = System.System()
+    system.add_input(signal)
+    system.add_system(nested_system(levels))
+    system.add_output()
+    system.add_connector(((0, 0), (1, 0)))
+    system.add_connector(((1, 0), (2, 0)))
+
+    return benchmark(system, methods=methods, repeats=repeats)
+
+
+class StreamEngine:
+    """Block-wise simulation state of a system, set up once and reusable for many runs.
+
+    Uses the linear filter path or the block engine, and carries the filter or component states from one call of run
+    to the next. With method='auto' the path is picked by the types of the first input blocks, see use_linear. See
+    step_timing for timing.
+    """
+
+    def __init__(self, system, method='auto', timing='step'):
+        self.system = system
+        self.timed_system = timed(system, timing)
+        self.method = None
+        if not method == 'auto':
+            self.set_up(method)
+
+    def set_up(self, method):
+        if method == 'linear':
+            self.state_filter = StateFilter(*state_matrices(self.timed_system))
+        elif method == 'block':
+            self.plan = compile_system(self.timed_system)
+            self.schedule = block_schedule(self.plan)
+        else:
+            raise Exception('Unknown method type')
+        self.method = method
+        self.reset()
+
+    def reset(self):
+        if self.method == 'linear':
+            self.state_filter.reset()
+        elif self.method == 'block':
+            self.plan.reset()
+
+    def run(self, in_blocks):
+        """Run one block of every input and return one block for every output, both in component order."""
+        if self.method is None:
+            self.set_up('linear' if use_linear(self.timed_system, [block.dtype for block in in_blocks]) else 'block')
+        if self.method == 'linear':
+            y = self.state_filter.run(np.stack([np.asarray(block, dtype=np.float64) for block in in_blocks], axis=1))
+            out_blocks = [y[:, o] for o in range(y.shape[1])]
+        else:
+            out_blocks = run_block(self.plan, self.schedule, in_blocks)
+        return out_blocks
+
+
+def simulate_stream(system, chunk_size=65536, method='auto', engine=None, timing='step'):
+    """Simulate the system one chunk at a time, with memory use independent of the signal length.
+
+    The inputs are read chunk by chunk and padded to the system axis on the fly, so nothing is allocated for the full
+    length. The component states are carried from one chunk to the next. Yields (k_0, out_blocks) for every chunk,
+    where out_blocks holds one array for every output component, in component order. A StreamEngine set up for the
+    system can be passed to skip compiling it again.
+    """
+
+    x_start, x_end, delta_x, n = system.get_axis()
+
+    inputs = system.get_input_components(get_index=False)
+    offsets = [int(np.round((component.signal.x_start - x_start) / delta_x, decimals=0)) for component in inputs]
+
+    if engine is None:
+        engine = StreamEngine(system, method=method, timing=timing)
+    else:
+        engine.reset()
+
+    for k_0 in range(0, n, chunk_size):
+        k_1 = min(k_0 + chunk_size, n)
+        in_blocks = [read_padded(component.signal, offset, k_0, k_1) for component, offset in zip(inputs, offsets)]
+        yield k_0, engine.run(in_blocks)
+
+
+def read_padded(signal, offset, k_0, k_1):
+    """Samples [k_0, k_1) of the first channel of a signal that starts offset samples into the system axis.
+
+    Samples outside the signal are zero. The signal is only sliced, so it may be backed by a file.
+    """
+    a = max(k_0 - offset, 0)
+    b = min(k_1 - offset, signal.Y.shape[0])
+    if a == k_0 - offset and b == k_1 - offset:
+        return np.asarray(signal.Y[a:b, 0])
+    block = np.zeros((k_1 - k_0, ), dtype=signal.Y.dtype)
+    if a < b:
+        block[a + offset - k_0:b + offset - k_0] = signal.Y[a:b, 0]
+    return block
+
+
+def simulate_to_file(system, path_strings, chunk_size=65536, method='auto', update=None, engine=None, timing='step'):
+    """Stream the simulation to one signal file per output component, written chunk by chunk."""
+
+    x_start, x_end, delta_x, n = system.get_axis()
+    template = system.get_input_components(get_index=False)[0].signal
+
+    # Set progress max
+    if update is not None:
+        update.setMaximum(n - 1)
+
+    writers = []
+    try:
+        for path_string in path_strings:
+            writers.append(Signal.TimeSignalWriter(
+                path_string,
+                x_start=x_start,
+                x_end=x_end,
+                delta_x=delta_x,
+                dtype=template.Y.dtype,
+                channels=1,
+                units=template.units
+            ))
+        for k_0, out_blocks in simulate_stream(system, chunk_size=chunk_size, method=method, engine=engine, timing=timing):
+            for writer, out_block in zip(writers, out_blocks):
+                writer.write(out_block)
+            if update is not None:
+                update.setValue(k_0 + out_blocks[0].shape[0] - 1)
+    finally:
+        for writer in writers:
+            writer.close()
+
+    return [writer.path for writer in writers]
+
+
+def simulate_batch(system_path, jobs, output_directory, processes=None, chunk_size=65536, method='auto', update=None,
+                   timing='step'):
+    """Simulate one system file over many sets of input signal files in a pool of worker processes.
+
+    jobs is either a glob pattern or a list, where each entry is one signal file for a system with a single input, or
+    a list with one signal file per input component. Signals in a store are given as store references, see
+    Store.reference. Every worker loads and compiles the system once. The outputs of
+    job j are written to output_directory as <name of the first input>_output_<o>.h5. A failing job does not stop the
+    others. Returns one dict per job with the input paths, the output paths and the error message, if any.
+    """
+
+    if isinstance(jobs, str):
+        jobs = sorted(glob.glob(jobs))
+    jobs = [[job] if isinstance(job, (str, pathlib.Path)) else list(job) for job in jobs]
+
+    output_directory = pathlib.Path(output_directory)
+    output_directory.mkdir(parents=True, exist_ok=True)
+
+    # Set progress max
+    if update is not None:
+        update.setMaximum(len(jobs))
+
+    results = [{'inputs': job, 'outputs': [], 'error': None} for job in jobs]
+
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=processes,
+            initializer=_batch_initializer,
+            initargs=(str(system_path), method, timing)
+    ) as executor:
+
+        futures = dict()
+        for j, job in enumerate(jobs):
+            futures[executor.submit(_batch_job, [str(path) for path in job], str(output_directory), chunk_size)] = j
+
+        for done, future in enumerate(concurrent.futures.as_completed(futures)):
+            j = futures[future]
+            try:
+                results[j]['outputs'], results[j]['error'] = future.result()
+            except Exception as error:
+                results[j]['error'] = repr(error)
+            if results[j]['error'] is None:
+                logger.info('Batch job {} done: {}'.format(j, results[j]['outputs']))
+            else:
+                logger.error('Batch job {} failed: {}'.format(j, results[j]['error']))
+            if update is not None:
+                update.setValue(done + 1)
+
+    return results
+
+
+_batch_state = dict()
+
+
+def _batch_initializer(system_path, method, timing):
+    try:
+        system = System.System.static_load(system_path, load_signals=False)
+        _batch_state['system'] = system
+        _batch_state['engine'] = StreamEngine(system, method=method, timing=timing)
+        _batch_state['error'] = None
+    except Exception as error:
+        _batch_state['error'] = repr(error)
+
+
+def _batch_job(input_paths, output_directory, chunk_size):
+    """Run one batch job in a worker. Returns (output paths, error message)."""
+    if _batch_state['error'] is not None:
+        return [], _batch_state['error']
+    try:
+        system = _batch_state['system']
+        inputs = system.get_input_components(get_index=False)
+        if not len(input_paths) == len(inputs):
+            raise ValueError('The system has {} inputs, but {} signals were given'.format(len(inputs), len(input_paths)))
+        for component, input_path in zip(inputs, input_paths):
+            component.signal = Store.resolve(input_path, lazy=True)
+        name = Store.stem(input_paths[0])
+        output_paths = []
+        for o in range(len(system.get_output_components())):
+            output_paths.append(str(pathlib.Path(output_directory) / '{}_output_{}.h5'.format(name, o)))
+        output_paths = simulate_to_file(system, output_paths, chunk_size=chunk_size, engine=_batch_state['engine'])
+        return [str(path) for path in output_paths], None
+    except Exception as error:
+        return [], repr(error)
+
+
+def simulate_sweep(system, parameters, path_string, chunk_size=65536, processes=None, update=None, timing='step'):
+    """Simulate the system over a grid of component parameters and write the outputs to one result cube.
+
+    parameters maps component indices to the values to sweep: coefficients for gain components, function strings for
+    function components. The grid is the cartesian product of the value lists. If only gains are swept and the system
+    has no feedback loops, the parameter axis is vectorized in the block engine. Otherwise the grid points are
+    simulated in a pool of worker processes.
+
+    The cube is written to path_string, with one dataset Y of shape (outputs, *grid shape, samples) and one dataset
+    parameter_<c> with the swept values of every component c.
+    """
+
+    components = sorted(parameters.keys())
+    values = [list(parameters[c]) for c in components]
+    for c in components:
+        if system.components[c].type not in ['gain', 'function']:
+            raise TypeError('Only gain and function components can be swept')
+
+    grid_shape = tuple([len(component_values) for component_values in values])
+    points = list(itertools.product(*[range(len(component_values)) for component_values in values]))
+
+    x_start, x_end, delta_x, n = system.get_axis()
+    template = system.get_input_components(get_index=False)[0].signal
+    q = len(system.get_output_components())
+
+    vectorize = all([system.components[c].type == 'gain' for c in components])
+    if vectorize:
+        for mode, members in block_schedule(compile_system(timed(system, timing))):
+            if mode == 'step':
+                vectorize = False
+
+    with h5py.File(path_string, 'w') as f:
+
+        f.attrs['components'] = components
+        f.attrs['x_start'] = x_start
+        f.attrs['x_end'] = x_end
+        f.attrs['delta_x'] = delta_x
+        f.attrs['n'] = n
+        f.attrs['outputs'] = q
+        for c, component_values in zip(components, values):
+            if system.components[c].type == 'gain':
+                f.create_dataset('parameter_{}'.format(c), data=np.array(component_values, dtype=np.float64))
+            else:
+                f.create_dataset('parameter_{}'.format(c), data=np.array(component_values, dtype=h5py.string_dtype()))
+        Y = f.create_dataset(
+            'Y',
+            shape=(q, ) + grid_shape + (n, ),
+            dtype=template.Y.dtype,
+            chunks=(1, ) + (1, ) * len(grid_shape) + (min(n, chunk_size), )
+        )
+
+        if vectorize:
+            _sweep_vectorized(system, components, values, points, grid_shape, Y, chunk_size, update, timing)
+        else:
+            _sweep_pool(system, components, values, points, Y, chunk_size, processes, update, timing)
+
+    return pathlib.Path(path_string)
+
+
+def _sweep_vectorized(system, components, values, points, grid_shape, Y, chunk_size, update, timing):
+    """Run every grid point at once by giving the swept gains one coefficient per point along a second block axis."""
+
+    x_start, x_end, delta_x, n = system.get_axis()
+    inputs = system.get_input_components(get_index=False)
+    offsets = [int(np.round((component.signal.x_start - x_start) / delta_x, decimals=0)) for component in inputs]
+
+    # Set progress max
+    if update is not None:
+        update.setMaximum(n - 1)
+
+    coefficients = [system.components[c].coefficient for c in components]
+    try:
+        for d, c in enumerate(components):
+            system.components[c].coefficient = np.array([values[d][point[d]] for point in points])
+        engine = StreamEngine(system, method='block', timing=timing)
+        for k_0 in range(0, n, chunk_size):
+            k_1 = min(k_0 + chunk_size, n)
+            in_blocks = [read_padded(component.signal, offset, k_0, k_1)[:, np.newaxis] for component, offset in zip(inputs, offsets)]
+            for o, out_block in enumerate(engine.run(in_blocks)):
+                out_block = np.broadcast_to(out_block, (k_1 - k_0, len(points)))
+                Y[o, ..., k_0:k_1] = np.reshape(out_block.T, grid_shape + (k_1 - k_0, )).astype(Y.dtype)
+            if update is not None:
+                update.setValue(k_1 - 1)
+    finally:
+        for c, coefficient in zip(components, coefficients):
+            system.components[c].coefficient = coefficient
+
+
+def _sweep_pool(system, components, values, points, Y, chunk_size, processes, update, timing):
+    """Run the grid points one by one in a pool of worker processes."""
+
+    # Set progress max
+    if update is not None:
+        update.setMaximum(len(points))
+
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=processes,
+            initializer=_sweep_initializer,
+            initargs=(system, components, chunk_size, timing)
+    ) as executor:
+
+        futures = dict()
+        for point in points:
+            point_values = [values[d][point[d]] for d in range(len(components))]
+            futures[executor.submit(_sweep_point, point_values)] = point
+
+        for done, future in enumerate(concurrent.futures.as_completed(futures)):
+            point = futures[future]
+            for o, out in enumerate(future.result()):
+                Y[(o, ) + point] = out.astype(Y.dtype)
+            if update is not None:
+                update.setValue(done + 1)
+
+
+_sweep_state = dict()
+
+
+def _sweep_initializer(system, components, chunk_size, timing):
+    _sweep_state['system'] = system
+    _sweep_state['components'] = components
+    _sweep_state['chunk_size'] = chunk_size
+    _sweep_state['timing'] = timing
+
+
+def _sweep_point(point_values):
+    """Simulate one grid point in a worker. Returns one full length array per output."""
+    system = _sweep_state['system']
+    for c, value in zip(_sweep_state['components'], point_values):
+        if system.components[c].type == 'gain':
+            system.components[c].coefficient = value
+        else:
+            system.components[c].function_string = value
+    outs = [[] for output_component in system.get_output_components()]
+    for k_0, out_blocks in simulate_stream(system, chunk_size=_sweep_state['chunk_size'], timing=_sweep_state['timing']):
+        for out, out_block in zip(outs, out_blocks):
+            out.append(out_block)
+    return [np.concatenate(out) for out in outs]
+
+
+def flatten(system):
+    """Inline nested systems into one flat system, recursively.
+
+    The components of a nested system are appended in place of the system component, with their indices remapped,
+    and its input and output components are dissolved into direct connectors. The top level components are shared
+    with the original system, the nested ones are copies. A system without nested systems is returned as is.
+    """
+    if 'system' not in [component.type for component in system.components]:
+        return system
+
+    flat_system = System.System()
+    flat_system.path = system.path
+    flat_system.type = system.type
+
+    index = dict()
+    sources = dict()
+    consumers = dict()
+    through = dict()
+
+    for c, component in enumerate(system.components):
+
+        if component.type == 'system':
+            inner = flatten(component.system)
+            inner_inputs = [ic for ic, inner_component in enumerate(inner.components) if inner_component.type == 'input']
+            inner_outputs = [ic for ic, inner_component in enumerate(inner.components) if inner_component.type == 'output']
+            inner_index = dict()
+            for ic, inner_component in enumerate(inner.components):
+                if inner_component.type not in ['input', 'output']:
+                    inner_index[ic] = len(flat_system.components)
+                    flat_system.components.append(copy.copy(inner_component))
+            for i in range(len(inner_inputs)):
+                consumers[(c, i)] = []
+            for ((a, i), (b, j)) in inner.connectors:
+                if a in inner_inputs and b in inner_outputs:
+                    through[(c, inner_outputs.index(b))] = inner_inputs.index(a)
+                elif a in inner_inputs:
+                    consumers[(c, inner_inputs.index(a))].append((inner_index[b], j))
+                elif b in inner_outputs:
+                    sources[(c, inner_outputs.index(b))] = (inner_index[a], i)
+                else:
+                    flat_system.add_connector(((inner_index[a], i), (inner_index[b], j)))
+
+        else:
+            index[c] = len(flat_system.components)
+            flat_system.components.append(component)
+
+    feeding = dict()
+    for ((a, i), (b, j)) in system.connectors:
+        feeding[(b, j)] = (a, i)
+
+    def resolve_source(a, i):
+        if a in index:
+            return index[a], i
+        elif (a, i) in through:
+            if (a, through[(a, i)]) in feeding:
+                return resolve_source(*feeding[(a, through[(a, i)])])
+            return None
+        else:
+            return sources.get((a, i), None)
+
+    for ((a, i), (b, j)) in system.connectors:
+        source = resolve_source(a, i)
+        if source is None:
+            continue
+        if b in index:
+            flat_system.add_connector((source, (index[b], j)))
+        else:
+            for target in consumers[(b, j)]:
+                flat_system.add_connector((source, target))
+
+    return flat_system
+
+
+def step_timing(system):
+    """Copy of the system with the timing of the step method made explicit as delays.
+
+    The step method copies all connectors before it transfers the components, so a connector passes the value its
+    source had at the previous sample, unless the source is an input component. Every stage of a diagram therefore
+    adds a sample of latency. The other engines evaluate the components in topological order instead, where a sample
+    propagates through the whole diagram at once and only delays hold values back ('instant' timing). To give the same
+    output as the step method, they simulate this copy, where a delay is put into every connector whose source is not
+    an input component, in nested systems too.
+
+    The components are shared with the system, and the delays are appended after them, so component indices stay
+    valid. Since every feedback loop now runs through a delay, the copy has no algebraic loops.
+    """
+    timed_system = System.System()
+    timed_system.path = system.path
+    timed_system.type = system.type
+
     for component in system.components:
-        for node in component.in_nodes:
-            node.value = 0
+        if component.type == 'system':
+            component = copy.copy(component)
+            component.system = step_timing(component.system)
+        timed_system.components.append(component)
+
+    for connector in system.connectors:
+        ((a, i), (b, j)) = connector
+        if system.components[a].type == 'input':
+            timed_system.add_connector(connector)
+        else:
+            timed_system.add_delay()
+            d = len(timed_system.components) - 1
+            timed_system.add_connector(((a, i), (d, 0)))
+            timed_system.add_connector(((d, 0), (b, j)))
+
+    return timed_system
+
+
+def timed(system, timing):
+    """The system to simulate for timing, either 'step' (see step_timing) or 'instant'."""
+    if timing == 'step':
+        return step_timing(system)
+    elif timing == 'instant':
+        return system
+    raise Exception('Unknown timing type')
+
+
+def dependency_graph(system):
+    """Graph of the instantaneous data flow between components.
+
+    The edge into a delay is left out, since the delay output only depends on the input of the previous sample.
+    """
+    graph = Graph.Digraph()
+    for c, component in enumerate(system.components):
+        graph.vertices.append(Graph.Vertex(c))
+    for c, connector in enumerate(system.connectors):
+        ((a, i), (b, j)) = connector
+        if not system.components[b].type == 'delay':
+            graph.vertices[a].add_out_neighbour(b)
+    return graph
+
+
+def schedule(system, strict=False):
+    """Evaluation order of the components, such that every component comes after the components that feed it.
+
+    Feedback loops are broken at the delays. A loop without a delay is an algebraic loop. If strict, it raises a
+    ValueError. Otherwise the components of the loop are evaluated together, in index order, after the components that
+    feed the loop, and a component in the loop reads the previous sample of the loop components that come after it.
+    The engines then step the loop sample by sample. Under step timing there are no algebraic loops, see step_timing.
+    """
+    graph = dependency_graph(system)
+    try:
+        return graph.topological_sort(strict=True)
+    except ValueError:
+        if strict:
+            raise ValueError('Algebraic loop through the components {}'.format(algebraic_loops(system)))
+    order = []
+    for members in graph.strongly_connected_components():
+        order.extend(sorted(members))
+    return order
+
+
+class Plan:
+    """Flat execution plan of a system.
+
+    Every out node of every component is given an integer slot in a shared value list, and every in node is resolved
+    to the slot of the out node that feeds it. Slot 0 is a constant zero for in nodes that are not connected. The
+    components are then reduced to a list of pre-bound kernels in topological order.
+    """
+
+    def __init__(self, system):
+        self.system = system
+        self.order = []
+        self.values = [0]
+        self.in_slots = []
+        self.out_slots = []
+        self.kernels = []
+        self.component_kernels = []
+        self.input_slots = []
+        self.output_slots = []
+        self.latch_slots = []
+        self.latch = None
+
+    def __len__(self):
+        return len(self.order)
+
+    def reset(self):
+        for s in range(len(self.values)):
+            self.values[s] = 0
+        for component in self.system.components:
+            if component.type in ['sum', 'delay']:
+                component.memory = 0
+
+    def load_memory(self, members=None):
+        if members is None:
+            members = range(len(self.system.components))
+        for c in members:
+            if self.system.components[c].type in ['sum', 'delay']:
+                self.values[self.out_slots[c][0]] = self.system.components[c].memory
+
+    def store_memory(self, members=None):
+        if members is None:
+            members = range(len(self.system.components))
+        for c in members:
+            if self.system.components[c].type in ['sum', 'delay']:
+                self.system.components[c].memory = self.values[self.out_slots[c][0]]
+
+    def step(self, in_data, out_data, n, kernels=None, latch=None):
+        """Run n samples. in_data and out_data are lists of (slot, list) pairs.
+
+        By default the whole plan is run, but a subset of the kernels and its own latch can be given instead.
+        """
+        values = self.values
+        if kernels is None:
+            kernels = self.kernels
+            latch = self.latch
+        for k in range(n):
+            for slot, data in in_data:
+                values[slot] = data[k]
+            for kernel in kernels:
+                kernel()
+            for slot, data in out_data:
+                data.append(values[slot])
+            if latch is not None:
+                latch()
+
+    def run(self, k_start, k_end, update=None, chunk_size=65536):
+        """Run the plan over the samples [k_start, k_end) of the input and output signals."""
+        self.load_memory()
+        for k_0 in range(k_start, k_end, chunk_size):
+            k_1 = min(k_0 + chunk_size, k_end)
+            in_data = []
+            for c, slot in self.input_slots:
+                in_data.append((slot, sample_values(self.system.components[c].signal.Y[k_0:k_1, 0])))
+            out_data = []
+            for c, slot in self.output_slots:
+                out_data.append((slot, []))
+            self.step(in_data, out_data, k_1 - k_0)
+            for (c, slot), (_, data) in zip(self.output_slots, out_data):
+                self.system.components[c].signal.Y[k_0:k_1, 0] = np.asarray(data)
+            if update is not None:
+                update.setValue(k_1 - 1)
+        self.store_memory()
+
+
+def sample_values(A):
+    """Get the samples of the array A as a list of values that compute like the samples the step method reads, which
+    are numpy scalars of the type of A. Integer samples therefore wrap around on overflow. Samples of type float64 are
+    given as Python floats, which compute the same, and faster.
+    """
+    A = np.asarray(A)
+    if A.dtype == np.float64:
+        return A.tolist()
+    return list(A)
+
+
+def _kernel_add(values, component, ins, outs):
+    (a, b), (o, ) = ins, outs
+
+    def kernel():
+        values[o] = values[a] + values[b]
+    return kernel
+
+
+def _kernel_addn(values, component, ins, outs):
+    (o, ) = outs
+
+    def kernel():
+        values[o] = sum([values[i] for i in ins])
+    return kernel
+
+
+def _kernel_multiply(values, component, ins, outs):
+    (a, b), (o, ) = ins, outs
+
+    def kernel():
+        values[o] = values[a] * values[b]
+    return kernel
+
+
+def _kernel_split(values, component, ins, outs):
+    (i, ), (o_1, o_2) = ins, outs
+
+    def kernel():
+        values[o_1] = values[o_2] = values[i]
+    return kernel
+
+
+def _kernel_sum(values, component, ins, outs):
+    (i, ), (o, ) = ins, outs
+
+    def kernel():
+        values[o] = values[i] + values[o]
+    return kernel
+
+
+def _kernel_gain(values, component, ins, outs):
+    (i, ), (o, ) = ins, outs
+    coefficient = component.coefficient
+
+    def kernel():
+        values[o] = coefficient * values[i]
+    return kernel
+
+
+def _kernel_function(values, component, ins, outs):
+    (i, ), (o, ) = ins, outs
+    function = Functions.compile_function(component.function_string)
+
+    def kernel():
+        values[o] = function(values[i])
+    return kernel
+
+
+def _kernel_generic(values, component, ins, outs):
+    in_nodes = list(zip(component.in_nodes, ins))
+    out_nodes = list(zip(component.out_nodes, outs))
+    transfer = component.transfer
+
+    def kernel():
+        for node, i in in_nodes:
+            node.value = values[i]
+        transfer()
+        for node, o in out_nodes:
+            values[o] = node.value
+    return kernel
+
+
+kernels = {
+    'add': _kernel_add,
+    'addn': _kernel_addn,
+    'multiply': _kernel_multiply,
+    'split': _kernel_split,
+    'sum': _kernel_sum,
+    'gain': _kernel_gain,
+    'function': _kernel_function,
+}
+
+
+def compile_system(system):
+    """Compile the system to a flat, topologically ordered execution plan. Nested systems are inlined first."""
+
+    system = flatten(system)
+    plan = Plan(system)
+
+    # Give every out node a slot
+    for c, component in enumerate(system.components):
+        plan.out_slots.append([])
         for node in component.out_nodes:
-            node.value = 0
+            plan.out_slots[c].append(len(plan.values))
+            plan.values.append(0)
+
+    # Resolve connectors. If several connectors end in the same in node, the last one wins.
+    for c, component in enumerate(system.components):
+        plan.in_slots.append([0] * len(component.in_nodes))
+    for c, connector in enumerate(system.connectors):
+        ((a, i), (b, j)) = connector
+        plan.in_slots[b][j] = plan.out_slots[a][i]
+
+    # Bind kernels in topological order
+    plan.order = schedule(system)
+    plan.component_kernels = [None] * len(system.components)
+    for c in plan.order:
+        component = system.components[c]
+        if component.type == 'input':
+            plan.input_slots.append((c, plan.out_slots[c][0]))
+        elif component.type == 'output':
+            plan.output_slots.append((c, plan.in_slots[c][0]))
+        elif component.type == 'delay':
+            plan.latch_slots.append((plan.in_slots[c][0], plan.out_slots[c][0]))
+        else:
+            factory = kernels.get(component.type, _kernel_generic)
+            plan.component_kernels[c] = factory(plan.values, component, tuple(plan.in_slots[c]), tuple(plan.out_slots[c]))
+            plan.kernels.append(plan.component_kernels[c])
+
+    # Delays take their new value after all other components have been evaluated
+    plan.latch = _latch(plan.values, plan.latch_slots)
+
+    return plan
+
+
+def _latch(values, latch_slots):
+    if not latch_slots:
+        return None
+
+    sources = tuple([slot[0] for slot in latch_slots])
+    targets = tuple([slot[1] for slot in latch_slots])
+
+    def latch():
+        latched = [values[i] for i in sources]
+        for o, value in zip(targets, latched):
+            values[o] = value
+    return latch
+
+
+def simulate_block(system, update=None, block_size=262144, timing='step'):
+    """Simulate the system by pushing whole blocks of samples through each component.
+
+    Components that implement transfer_block are evaluated on arrays. Feedback loops, and components without a block
+    transfer, are stepped sample by sample with the kernels of the compiled plan. See step_timing for timing.
+    """
+
+    # Pad input signals
+    system_axis = system.pad_signals()
+
+    # Set progress max
+    if update is not None:
+        update.setMaximum(system_axis.shape[0] - 1)
+
+    # Compile and ensure initial conditions
+    plan = compile_system(timed(system, timing))
+    plan.reset()
+    schedule = block_schedule(plan)
+
+    inputs = system.get_input_components(get_index=False)
+    outputs = system.get_output_components(get_index=False)
+
+    # Simulate
+    for k_0 in range(0, system_axis.shape[0], block_size):
+        k_1 = min(k_0 + block_size, system_axis.shape[0])
+        out_blocks = run_block(plan, schedule, [component.signal.Y[k_0:k_1, 0] for component in inputs])
+        for component, out_block in zip(outputs, out_blocks):
+            component.signal.Y[k_0:k_1, 0] = out_block
+        if update is not None:
+            update.setValue(k_1 - 1)
+
+    # Prepare output
+    result = []
+    for output_component in system.get_output_components(get_index=False):
+        result.append(output_component.signal)
+
+    return result
+
+
+def block_schedule(plan):
+    """Group the components of a compiled plan into the steps of the block engine.
+
+    Returns a list of (mode, members) tuples in evaluation order, where mode is 'block' for a single component that is
+    evaluated on arrays, and 'step' for a group of components that has to be stepped sample by sample.
+    """
+    system = plan.system
 
-    # Build graph
     graph = Graph.Digraph()
     for c, component in enumerate(system.components):
         graph.vertices.append(Graph.Vertex(c))
     for c, connector in enumerate(system.connectors):
         graph.vertices[connector[0][0]].add_out_neighbour(connector[1][0])
 
-    # Find input indices
-    input_indices = []
-    for input_component in system.get_input_components():
-        input_indices.append(input_component[0])
-    order = graph.BFS(input_indices)
-    print([i for i in order])
+    position = [0] * len(system.components)
+    for p, c in enumerate(plan.order):
+        position[c] = p
+
+    schedule = []
+    for members in graph.strongly_connected_components():
+        c = members[0]
+        component = system.components[c]
+        if len(members) == 1 and c not in graph.vertices[c].out_neighbourhood and (
+                component.type in ['input', 'output'] or hasattr(component, 'transfer_block')):
+            schedule.append(('block', members))
+        else:
+            schedule.append(('step', sorted(members, key=lambda m: position[m])))
+
+    return schedule
+
+
+def run_block(plan, schedule, in_blocks):
+    """Run one block of every input through the block schedule and return one block for every output.
+
+    The inputs and outputs are in component order.
+    """
+    system = plan.system
+    m = in_blocks[0].shape[0]
+    blocks = {0: np.zeros(in_blocks[0].shape, dtype=in_blocks[0].dtype)}
+    for (c, component), in_block in zip(system.get_input_components(), in_blocks):
+        blocks[plan.out_slots[c][0]] = in_block
+
+    for mode, members in schedule:
+
+        if mode == 'block':
+            c = members[0]
+            component = system.components[c]
+            if component.type in ['input', 'output']:
+                pass
+            else:
+                out_blocks = component.transfer_block([blocks[i] for i in plan.in_slots[c]])
+                for o, out_block in zip(plan.out_slots[c], out_blocks):
+                    blocks[o] = out_block
+
+        else:
+            produced = set()
+            for c in members:
+                produced.update(plan.out_slots[c])
+            in_data = []
+            for c in members:
+                for i in plan.in_slots[c]:
+                    if i not in produced:
+                        produced.add(i)
+                        in_data.append((i, sample_values(blocks[i])))
+            out_data = [(o, []) for c in members for o in plan.out_slots[c]]
+            kernels = [plan.component_kernels[c] for c in members if plan.component_kernels[c] is not None]
+            latch_slots = [(plan.in_slots[c][0], plan.out_slots[c][0]) for c in members if system.components[c].type == 'delay']
+            plan.load_memory(members)
+            plan.step(in_data, out_data, m, kernels=kernels, latch=_latch(plan.values, latch_slots))
+            plan.store_memory(members)
+            for o, data in out_data:
+                blocks[o] = np.asarray(data)
+
+    out_blocks = []
+    for c, component in system.get_output_components():
+        out_blocks.append(blocks[plan.in_slots[c][0]])
+
+    return out_blocks
+
+
+def simulate_2(system, update=None):
+    """Simulate the system sample by sample, evaluating the components in topological order (timing='instant')."""
+
+    # Pad input signals
+    system_axis = system.pad_signals()
+
+    # Set progress max
+    if update is not None:
+        update.setMaximum(system_axis.shape[0] - 1)
+
+    # Inline nested systems, so that they are scheduled along with the rest. The top level components are shared, so
+    # the outputs are written to the signals of the system.
+    outputs = system.get_output_components(get_index=False)
+    system = flatten(system)
+
+    # Ensure initial conditions
+    for component in system.components:
+        for node in component.in_nodes:
+            node.value = 0
+        for node in component.out_nodes:
+            node.value = 0
+        if component.type in ['sum', 'delay']:
+            component.memory = 0
+
+    # Schedule, and resolve the connectors that feed each component
+    order = schedule(system)
+    incoming = [[] for component in system.components]
+    for c, connector in enumerate(system.connectors):
+        ((a, i), (b, j)) = connector
+        incoming[b].append((system.components[a].out_nodes[i], system.components[b].in_nodes[j]))
+    delays = [c for c in order if system.components[c].type == 'delay']
 
     # Simulate
     for k, x in enumerate(system_axis):
 
-        # Set input nodes
-        for input_component in system.get_input_components(get_index=False):
-            input_component.transfer(k)
-
-        # Transfer
-        for c, connector in enumerate(system.connectors):
-            ((a, i), (b, j)) = connector
-            system.components[b].in_nodes[j].value = system.components[a].out_nodes[i].value
-        for c, component in enumerate(system.components):
-            if component.type == 'output':
+        # Transfer in topological order. Delays emit their memory here and latch their input at the end.
+        for c in order:
+            component = system.components[c]
+            for out_node, in_node in incoming[c]:
+                in_node.value = out_node.value
+            if component.type in ['input', 'output']:
                 component.transfer(k)
-            elif component.type == 'input':
-                pass
+            elif component.type == 'delay':
+                component.emit()
             else:
                 component.transfer()
+        for c in delays:
+            for out_node, in_node in incoming[c]:
+                in_node.value = out_node.value
+            system.components[c].latch()
 
         # Set progress
         if update is not None:
@@ -124,13 +1084,208 @@ def simulate_2(system, update=None):
 
     # Prepare output
     result = []
-    for output_component in system.get_output_components(get_index=False):
+    for output_component in outputs:
+        result.append(output_component.signal)
+
+    return result
+
+
+linear_types = ['input', 'output', 'gain', 'add', 'addn', 'split', 'sum', 'delay']
+
+
+def is_linear(system):
+    """A system that only consists of gain, add, split, sum and delay blocks is a discrete LTI system."""
+    for component in flatten(system).components:
+        if component.type not in linear_types:
+            return False
+    return True
+
+
+def algebraic_loops(system):
+    """Groups of components that depend on each other within the same sample, without a delay to break the loop.
+
+    Nested systems are flattened first, so the component indices refer to the flattened system.
+    """
+    graph = dependency_graph(flatten(system))
+    loops = []
+    for members in graph.strongly_connected_components():
+        if len(members) > 1 or members[0] in graph.vertices[members[0]].out_neighbourhood:
+            loops.append(sorted(members))
+    return loops
+
+
+def has_algebraic_loop(system):
+    return len(algebraic_loops(system)) > 0
+
+
+def use_linear(system, dtypes):
+    """Check if simulate_linear gives the output of the step method for inputs of the types dtypes, up to rounding.
+
+    simulate_linear computes in float64, while the step method computes in the type of the samples, where integers wrap
+    around on overflow. The linear path is therefore only used for float64 inputs to linear systems without algebraic
+    loops.
+    """
+    if not all([np.dtype(dtype) == np.float64 for dtype in dtypes]):
+        return False
+    return is_linear(system) and not has_algebraic_loop(system)
+
+
+def state_matrices(system):
+    """Extract the state space form x[k + 1] = A x[k] + B u[k], y[k] = C x[k] + D u[k] of a linear system.
+
+    The states are the memories of the delay and sum components, in the component order of the flattened system. The
+    inputs and outputs are the input and output components, in component order. The form is that of the diagram under
+    timing='instant'. For the form under step timing, pass step_timing(system), which adds a state for every connector
+    that leaves a component.
+    """
+    if not is_linear(system):
+        raise TypeError('System is not linear')
+    if has_algebraic_loop(system):
+        raise ValueError('System has an algebraic loop')
+
+    plan = compile_system(system)
+    system = plan.system
+
+    states = [c for c, component in enumerate(system.components) if component.type in ['sum', 'delay']]
+    inputs = [c for c, component in enumerate(system.components) if component.type == 'input']
+    outputs = [c for c, component in enumerate(system.components) if component.type == 'output']
+    n = len(states)
+    p = len(inputs)
+
+    # Evaluate the plan once with unit vectors in the (state, input) space as node values
+    unit = np.eye(n + p)
+    for s in range(len(plan.values)):
+        plan.values[s] = np.zeros((n + p, ))
+    for s, c in enumerate(states):
+        plan.values[plan.out_slots[c][0]] = unit[s]
+    for s, c in enumerate(inputs):
+        plan.values[plan.out_slots[c][0]] = unit[n + s]
+    for kernel in plan.kernels:
+        kernel()
+
+    # Sums take their own output as the next state, delays their input
+    next_states = []
+    for c in states:
+        if system.components[c].type == 'sum':
+            next_states.append(plan.values[plan.out_slots[c][0]])
+        else:
+            next_states.append(plan.values[plan.in_slots[c][0]])
+    output_values = [plan.values[plan.in_slots[c][0]] for c in outputs]
+
+    next_states = np.reshape(np.array(next_states), (n, n + p))
+    output_values = np.reshape(np.array(output_values), (len(outputs), n + p))
+
+    A = next_states[:, :n]
+    B = next_states[:, n:]
+    C = output_values[:, :n]
+    D = output_values[:, n:]
+
+    return A, B, C, D
+
+
+def simulate_linear(system, update=None, block_size=1048576, timing='step'):
+    """Simulate a linear system in its state space form with a StateFilter instead of the per-sample loop.
+
+    See step_timing for timing.
+    """
+
+    # Pad input signals
+    system_axis = system.pad_signals()
+
+    # Set progress max
+    if update is not None:
+        update.setMaximum(system_axis.shape[0] - 1)
+
+    state_filter = StateFilter(*state_matrices(timed(system, timing)))
+
+    inputs = system.get_input_components(get_index=False)
+    outputs = system.get_output_components(get_index=False)
+
+    # Simulate
+    for k_0 in range(0, system_axis.shape[0], block_size):
+        k_1 = min(k_0 + block_size, system_axis.shape[0])
+        u = np.stack([np.asarray(component.signal.Y[k_0:k_1, 0], dtype=np.float64) for component in inputs], axis=1)
+        y = state_filter.run(u)
+        for o, component in enumerate(outputs):
+            component.signal.Y[k_0:k_1, 0] = y[:, o]
+        if update is not None:
+            update.setValue(k_1 - 1)
+
+    # Prepare output
+    result = []
+    for output_component in outputs:
         result.append(output_component.signal)
 
     return result
 
 
+class StateFilter:
+    """Block-wise simulation of the state space form x[k + 1] = A x[k] + B u[k], y[k] = C x[k] + D u[k].
+
+    Within a block of block_length samples, the output is the response to the state at the start of the block plus the
+    convolution of the inputs with the impulse response over the block, computed by FFT. The state is then carried to
+    the start of the next block. This follows the state recursion, so unlike a transfer function polynomial it stays
+    accurate for systems of high order. The state is kept from one call of run to the next.
+    """
+
+    def __init__(self, A, B, C, D, block_length=4096):
+        self.A = A
+        self.D = D
+        self.block_length = block_length
+        n = A.shape[0]
+        (q, p) = D.shape
+
+        # G[m] = A^m B and O[m] = C A^m, for the first block_length powers
+        self.G = np.zeros((block_length, n, p))
+        self.O = np.zeros((block_length, q, n))
+        G = B
+        O = C
+        for m in range(block_length):
+            self.G[m] = G
+            self.O[m] = O
+            G = A @ G
+            O = O @ A
+        self.A_block = np.linalg.matrix_power(A, block_length)
+
+        # Impulse response h[0] = D, h[m] = C A^(m - 1) B, and its spectrum for the convolutions
+        h = np.concatenate((D[np.newaxis], np.einsum('qn,mnp->mqp', C, self.G[:-1])), axis=0)
+        self.n_fft = Fourier.next_fast_len(2 * block_length - 1, real=True)
+        self.H = Fourier.rfft(h, n=self.n_fft, axis=0)
+
+        self.x = np.zeros((n, ))
+
+    def reset(self):
+        self.x[...] = 0
+
+    def run(self, u):
+        """Filter the inputs u, of shape (samples, inputs), and return the outputs, of shape (samples, outputs)."""
+        y = np.zeros((u.shape[0], self.D.shape[0]))
+        if self.x.shape[0] == 0:
+            y[:] = u @ self.D.T
+            return y
+        for k_0 in range(0, u.shape[0], self.block_length):
+            u_block = u[k_0:k_0 + self.block_length]
+            l = u_block.shape[0]
+            U = Fourier.rfft(u_block, n=self.n_fft, axis=0)
+            y_u = Fourier.irfft(np.einsum('fqp,fp->fq', self.H, U), n=self.n_fft, axis=0)[:l]
+            y[k_0:k_0 + l] = y_u + self.O[:l] @ self.x
+            A_l = self.A_block if l == self.block_length else np.linalg.matrix_power(self.A, l)
+            self.x = A_l @ self.x + np.einsum('mnp,mp->n', self.G[l - 1::-1], u_block)
+        return y
+
+
 def state_system(A, B, C, D):
+    """Build a system of gains, adders, splits and delays that realizes the state space form (A, B, C, D).
+
+    Every state is the memory of a delay. Zero coefficients are left out of the diagram, and coefficients of one are
+    connected without a gain. The diagram realizes (A, B, C, D) when it is simulated with timing='instant'. Under the
+    default step timing every stage of the diagram adds a sample of latency, see step_timing.
+    """
+
+    A = np.atleast_2d(A)
+    B = np.atleast_2d(B)
+    C = np.atleast_2d(C)
+    D = np.atleast_2d(D)
 
     n = A.shape[0]
     (q, p) = D.shape
@@ -147,7 +1302,68 @@ def state_system(A, B, C, D):
         system.components[-1].x = 80
         system.components[-1].y = 40 * o
 
-    return system
+    for s in range(n):
+        system.add_delay()
+        system.components[-1].x = 60
+        system.components[-1].y = 40 * s
+
+    # Sources are the inputs followed by the states, targets the next states followed by the outputs
+    sources = [(i, 0) for i in range(p)] + [(p + q + s, 0) for s in range(n)]
+    targets = [(p + q + s, 0) for s in range(n)] + [(p + o, 0) for o in range(q)]
+    coefficients = np.concatenate((np.concatenate((B, A), axis=1), np.concatenate((D, C), axis=1)), axis=0)
+
+    consumers = [[] for source in sources]
+    adders = 0
+    gains = 0
+
+    for t, target in enumerate(targets):
 
+        terms = [(s, coefficients[t, s]) for s in range(len(sources)) if not coefficients[t, s] == 0]
 
+        # Sum the terms into the target
+        if len(terms) == 0:
+            continue
+        elif len(terms) == 1:
+            term_nodes = [target]
+        else:
+            if len(terms) == 2:
+                system.add_add()
+            else:
+                system.add_addn(len(terms))
+            system.components[-1].x = 40
+            system.components[-1].y = 40 * adders
+            adders += 1
+            a = len(system.components) - 1
+            system.add_connector(((a, 0), target))
+            term_nodes = [(a, j) for j in range(len(terms))]
+
+        # Scale each term
+        for (s, coefficient), node in zip(terms, term_nodes):
+            if coefficient == 1:
+                consumers[s].append(node)
+            else:
+                system.add_gain(float(coefficient))
+                system.components[-1].x = 20
+                system.components[-1].y = 40 * gains
+                gains += 1
+                g = len(system.components) - 1
+                system.add_connector(((g, 0), node))
+                consumers[s].append((g, 0))
 
+    # Fan each source out to its consumers through a chain of splits
+    splits = 0
+    for source, source_consumers in zip(sources, consumers):
+        node = source
+        for consumer in source_consumers[:-1]:
+            system.add_split()
+            system.components[-1].x = 0
+            system.components[-1].y = 40 * splits
+            splits += 1
+            b = len(system.components) - 1
+            system.add_connector((node, (b, 0)))
+            system.add_connector(((b, 0), consumer))
+            node = (b, 1)
+        if source_consumers:
+            system.add_connector((node, source_consumers[-1]))
+
+    return system
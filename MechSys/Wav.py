@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+"""Chunked reading and writing of WAV files"""
+
+# standard library
+import logging
+import mmap
+import pathlib
+import struct
+# 3rd party
+import numpy as np
+# Internals
+# Instantiate logger:
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+format_pcm = 1
+format_float = 3
+format_extensible = 0xFFFE
+
+chunk_frames = 65536
+
+
+def read_header(path_string):
+    """Read the format and the position of the sample data of a WAV file.
+
+    Returns a dict with the format code (1 for PCM, 3 for float), channels, sample rate f_s, bits per sample, and the
+    byte offset and number of frames of the data chunk.
+    """
+    with open(path_string, 'rb') as f:
+        riff = f.read(12)
+        if len(riff) < 12 or not riff[0:4] == b'RIFF' or not riff[8:12] == b'WAVE':
+            raise ValueError('{} is not a WAV file'.format(path_string))
+
+        header = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                raise ValueError('{} has no data chunk'.format(path_string))
+            chunk_id, chunk_size = struct.unpack('<4sI', chunk)
+            if chunk_id == b'fmt ':
+                fmt = f.read(chunk_size)
+                code, channels, f_s, byte_rate, block_align, bits = struct.unpack('<HHIIHH', fmt[:16])
+                if code == format_extensible:
+                    code = struct.unpack('<H', fmt[24:26])[0]
+                header = {'format': code, 'channels': channels, 'f_s': f_s, 'bits': bits, 'block_align': block_align}
+                if chunk_size % 2 == 1:
+                    f.seek(1, 1)
+            elif chunk_id == b'data':
+                if header is None:
+                    raise ValueError('{} has no fmt chunk before the data chunk'.format(path_string))
+                header['offset'] = f.tell()
+                # Recordings that were cut short may declare more data than the file holds
+                available = pathlib.Path(path_string).stat().st_size - header['offset']
+                header['frames'] = min(chunk_size, available) // header['block_align']
+                break
+            else:
+                f.seek(chunk_size + chunk_size % 2, 1)
+
+    if header['format'] == format_pcm and header['bits'] not in [8, 16, 24, 32]:
+        raise ValueError('{}-bit PCM is not supported'.format(header['bits']))
+    if header['format'] == format_float and header['bits'] not in [32, 64]:
+        raise ValueError('{}-bit float is not supported'.format(header['bits']))
+    if header['format'] not in [format_pcm, format_float]:
+        raise ValueError('WAV format {} is not supported'.format(header['format']))
+
+    return header
+
+
+def sample_dtype(header):
+    """Get the numpy type that the samples of a WAV file are read as. 24-bit PCM is read as int32."""
+    if header['format'] == format_float:
+        return np.dtype('<f{}'.format(header['bits'] // 8))
+    if header['bits'] == 24:
+        return np.dtype('<i4')
+    return np.dtype('<i{}'.format(header['bits'] // 8))
+
+
+def decode(data, header):
+    """Convert the raw bytes of whole frames to an array of shape (frames, channels)."""
+    channels = header['channels']
+    if header['format'] == format_float:
+        Y = np.frombuffer(data, dtype=sample_dtype(header))
+    elif header['bits'] == 8:
+        # 8-bit PCM is unsigned
+        Y = (np.frombuffer(data, dtype=np.uint8).astype(np.int16) - 128).astype(np.int8)
+    elif header['bits'] == 24:
+        raw = np.frombuffer(data, dtype=np.uint8).reshape((-1, 3)).astype(np.int32)
+        Y = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        Y = np.where(Y >= 1 << 23, Y - (1 << 24), Y).astype(np.int32)
+    else:
+        Y = np.frombuffer(data, dtype=sample_dtype(header))
+    return Y.reshape((-1, channels))
+
+
+def encode(Y, bits, codomain):
+    """Convert a block of samples of shape (frames, channels) to the bytes of a WAV data chunk."""
+    Y = np.asarray(Y)
+    if np.iscomplexobj(Y):
+        Y = Y.real
+    if codomain == 'float':
+        return Y.astype('<f{}'.format(bits // 8)).tobytes()
+    low = -(1 << (bits - 1))
+    high = (1 << (bits - 1)) - 1
+    if Y.dtype.kind == 'f' or Y.dtype.itemsize * 8 > bits:
+        Y = np.clip(Y, low, high)
+    if bits == 8:
+        return (Y.astype(np.int16) + 128).astype(np.uint8).tobytes()
+    if bits == 24:
+        Y = Y.astype('<i4').reshape((-1, 1)).view(np.uint8)
+        return np.ascontiguousarray(Y[:, :3]).tobytes()
+    return Y.astype('<i{}'.format(bits // 8)).tobytes()
+
+
+def read(path_string, out=None, frames=chunk_frames):
+    """Read the samples of a WAV file.
+
+    If out is None and the samples are stored in a numpy type (16/32-bit PCM, float), they are memory mapped copy on
+    write, so they are read from disk only as they are used. Otherwise they are decoded frames at a time into out, or
+    into a new array. out can be any array-like with slice assignment of shape (frames, channels), such as an HDF5
+    dataset. Returns the samples and the header.
+    """
+    header = read_header(path_string)
+    shape = (header['frames'], header['channels'])
+    direct = header['format'] == format_float or header['bits'] in [16, 32]
+
+    if out is None and direct and header['frames'] > 0:
+        return np.memmap(path_string, dtype=sample_dtype(header), mode='c', offset=header['offset'], shape=shape), header
+
+    if out is None:
+        out = np.empty(shape, dtype=sample_dtype(header))
+    elif not tuple(out.shape) == shape:
+        raise ValueError('out has shape {}, the file holds {}'.format(out.shape, shape))
+
+    k_0 = 0
+    for block in read_blocks(path_string, header=header, frames=frames):
+        out[k_0:k_0 + block.shape[0]] = block
+        k_0 += block.shape[0]
+
+    return out, header
+
+
+def read_blocks(path_string, header=None, frames=chunk_frames):
+    """Decode the samples of a WAV file frames at a time. Yields arrays of shape (frames, channels)."""
+    if header is None:
+        header = read_header(path_string)
+    if header['frames'] == 0:
+        return
+
+    block_align = header['block_align']
+    with open(path_string, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for k_0 in range(0, header['frames'], frames):
+                k_1 = min(k_0 + frames, header['frames'])
+                start = header['offset'] + k_0 * block_align
+                yield decode(mm[start:start + (k_1 - k_0) * block_align], header)
+
+
+def write(path_string, Y, f_s, bits=16, codomain='int', frames=chunk_frames):
+    """Write the samples Y, of shape (frames, channels), to a WAV file, frames at a time.
+
+    bits is 8, 16, 24 or 32 for PCM (codomain 'int'), and 32 or 64 for codomain 'float'. Y is only read block by block,
+    so it can be lazily loaded. PCM samples outside the range of bits are clipped.
+    """
+    if codomain == 'float':
+        code = format_float
+        if bits not in [32, 64]:
+            raise ValueError('{}-bit float is not supported'.format(bits))
+    else:
+        code = format_pcm
+        if bits not in [8, 16, 24, 32]:
+            raise ValueError('{}-bit PCM is not supported'.format(bits))
+
+    n = Y.shape[0]
+    channels = Y.shape[1]
+    block_align = channels * bits // 8
+    data_size = n * block_align
+    if data_size + 36 > 0xFFFFFFFF:
+        raise ValueError('The signal is too long for a WAV file')
+
+    with open(path_string, 'wb') as f:
+        f.write(struct.pack('<4sI4s', b'RIFF', 36 + data_size + data_size % 2, b'WAVE'))
+        f.write(struct.pack('<4sIHHIIHH', b'fmt ', 16, code, channels, int(round(f_s)), int(round(f_s)) * block_align, block_align, bits))
+        f.write(struct.pack('<4sI', b'data', data_size))
+        for k_0 in range(0, n, frames):
+            f.write(encode(Y[k_0:min(k_0 + frames, n)], bits, codomain))
+        if data_size % 2 == 1:
+            f.write(b'\x00')
+
+    return pathlib.Path(path_string)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+"""Tests of the transform cache in Cache"""
+
+# standard library
+# 3rd party
+import numpy as np
+# Internals
+from MechSys import Cache, Signal, Signal_processing
+
+
+def random_signal(n=1000, seed=0):
+    signal = Signal.TimeSignal(x_start=0.0, x_end=(n - 1) / 1000.0, delta_x=1.0 / 1000.0, bit_depth=64, codomain='float')
+    signal.Y[:, 0] = np.random.default_rng(seed).standard_normal(signal.n)
+    return signal
+
+
+def fft(cache, signal):
+    return cache.cached(signal, 'fft', lambda: Signal_processing.fft(signal, use_cache=False))
+
+
+def test_spill(tmp_path):
+    signals = [random_signal(seed=seed) for seed in range(3)]
+    expected = [Signal_processing.fft(signal, use_cache=False).Y for signal in signals]
+    # Room for a single spectrum, so every new one pushes the one before to the spill file
+    cache = Cache.TransformCache(max_bytes=expected[0].nbytes + 100, spill_path=tmp_path / 'spill.h5')
+    for signal in signals:
+        fft(cache, signal)
+    assert len(cache) == 1
+    assert (tmp_path / 'spill.h5').exists()
+    for signal, expected_Y in zip(signals, expected):
+        assert np.array_equal(fft(cache, signal).Y, expected_Y)
+    assert cache.info()['misses'] == 3
+    assert cache.info()['hits'] == 3
+    cache.clear()
+    assert not (tmp_path / 'spill.h5').exists()
+
+
+def test_result_is_a_copy():
+    cache = Cache.TransformCache()
+    signal = random_signal()
+    fft(cache, signal).Y[:] = 0
+    assert np.any(fft(cache, signal).Y != 0)
+
+
+def test_invalidate(tmp_path):
+    signal = random_signal()
+    cache = Cache.TransformCache(max_bytes=0, spill_path=tmp_path / 'spill.h5')
+    before = fft(cache, signal)
+    key = Cache.transform_key(signal, 'fft')
+    assert key in cache
+
+    signal.Y[0, 0] += 1.0
+    cache.invalidate(signal)
+    assert key not in cache
+    assert len(cache.sources) == 0
+    after = fft(cache, signal)
+    assert np.array_equal(after.Y, Signal_processing.fft(signal, use_cache=False).Y)
+    assert not np.array_equal(after.Y, before.Y)
+    assert cache.info()['misses'] == 2
+
+
+def test_eviction_without_spill_file_forgets_sources():
+    signals = [random_signal(seed=seed) for seed in range(3)]
+    cache = Cache.TransformCache(max_bytes=0)
+    for signal in signals:
+        fft(cache, signal)
+    assert len(cache) == 0
+    assert len(cache.sources) == 0
+    assert len(cache.source_of) == 0
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+"""Tests of the function strings of Functions.compile_function"""
+
+# standard library
+# 3rd party
+import numpy as np
+import pytest
+# Internals
+from MechSys import Functions
+
+
+@pytest.mark.parametrize('string, expected', [
+    ('x * x + 1', 10.0),
+    ('np.sin(x) ** 2 + cos(x) ** 2', 1.0),
+    ('abs(-x) if x > 0 else pi', 3.0),
+    ('max(x, 4) + np.pi - pi', 4.0),
+    ('imag(where(x >= 3, 1j, 0))', 1.0),
+])
+def test_compile_function(string, expected):
+    assert Functions.compile_function(string)(3.0) == pytest.approx(expected)
+
+
+def test_compiled_function_of_arrays():
+    x = np.linspace(-1.0, 1.0, 11)
+    assert np.allclose(Functions.compile_function('np.exp(x) * x')(x), np.exp(x) * x)
+    assert np.allclose(Functions.custom_R2(x, 2 * x, 'hypot(x_1, x_2)'), np.hypot(x, 2 * x))
+
+
+@pytest.mark.parametrize('string', [
+    '__import__("os").system("true")',
+    'open("/etc/passwd")',
+    'x.__class__',
+    'np.load("a.npy")',
+    'np.sin.__globals__',
+    '[x for x in range(3)]',
+    'lambda: x',
+    '"x" * 2',
+    'y + 1',
+    'eval("1")',
+    'x and 1',
+    'x[0]',
+    '(y := 1)',
+])
+def test_compile_function_rejects_what_is_not_whitelisted(string):
+    with pytest.raises(ValueError):
+        Functions.compile_function(string)
+
+
+def test_syntax_error():
+    with pytest.raises(SyntaxError):
+        Functions.compile_function('x +')
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+"""Tests of the topological sort and the strongly connected components of Graph.Digraph"""
+
+# standard library
+# 3rd party
+import pytest
+# Internals
+from MechSys import Graph
+
+
+def digraph(order, edges):
+    graph = Graph.Digraph()
+    for i in range(order):
+        graph.vertices.append(Graph.Vertex(i))
+    for i, j in edges:
+        graph.vertices[i].add_out_neighbour(j)
+    return graph
+
+
+def test_topological_sort_of_acyclic_graph():
+    edges = [(5, 2), (5, 0), (4, 0), (4, 1), (2, 3), (3, 1)]
+    order = digraph(6, edges).topological_sort(strict=True)
+    assert sorted(order) == list(range(6))
+    position = {i: k for k, i in enumerate(order)}
+    for i, j in edges:
+        assert position[i] < position[j]
+
+
+def test_csr():
+    indptr, indices = digraph(4, [(0, 1), (0, 2), (2, 3), (3, 0)]).csr()
+    assert indptr == [0, 2, 2, 3, 4]
+    assert indices == [1, 2, 3, 0]
+
+
+def test_topological_sort_of_cyclic_graph():
+    # 1 -> 2 -> 3 -> 1 is a cycle, 4 lies behind it
+    graph = digraph(5, [(0, 1), (1, 2), (2, 3), (3, 1), (3, 4)])
+    assert graph.topological_sort() == [0, 1, 2, 3, 4]
+    with pytest.raises(ValueError):
+        graph.topological_sort(strict=True)
+
+
+def test_strongly_connected_components():
+    # Two cycles, 1 -> 2 -> 1 and 3 -> 4 -> 5 -> 3, joined by 2 -> 3, a self loop on 6, and 7 on its own
+    graph = digraph(8, [(0, 1), (1, 2), (2, 1), (2, 3), (3, 4), (4, 5), (5, 3), (5, 6), (6, 6)])
+    components = [sorted(component) for component in graph.strongly_connected_components()]
+    assert sorted(components) == [[0], [1, 2], [3, 4, 5], [6], [7]]
+    # Topological order of the condensation
+    position = {i: k for k, component in enumerate(components) for i in component}
+    assert position[0] < position[1] < position[3] < position[6]
+
+
+def test_strongly_connected_components_of_long_cycle():
+    # Iterative, so a cycle longer than the recursion limit is fine
+    n = 5000
+    graph = digraph(n, [(i, (i + 1) % n) for i in range(n)])
+    assert [sorted(component) for component in graph.strongly_connected_components()] == [list(range(n))]
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+"""Tests of the signal classes and their files in Signal"""
+
+# standard library
+# 3rd party
+import h5py
+import numpy as np
+import pytest
+# Internals
+from MechSys import Signal
+
+
+def counting_signal(n=1001, channels=2):
+    signal = Signal.TimeSignal(x_start=0.0, x_end=(n - 1) / 1000.0, delta_x=1.0 / 1000.0, bit_depth=16, codomain='int',
+                               channels=channels)
+    signal.Y[:] = (np.arange(signal.Y.size).reshape(signal.Y.shape) % 20000).astype(np.int16)
+    return signal
+
+
+@pytest.mark.parametrize('options', [{}, {'compression': 'gzip'}])
+def test_save_view_over_its_source_file(tmp_path, options):
+    signal = counting_signal()
+    signal.save(tmp_path / 'a.h5', **options)
+    loaded = Signal.TimeSignal.static_load(tmp_path / 'a.h5', lazy=True)
+    view = loaded.view(0.2, 0.5)
+    view.save(tmp_path / 'a.h5')
+    # The signal the view was taken from still reads the old file
+    assert np.array_equal(np.asarray(loaded.Y), signal.Y)
+    loaded.close()
+    saved = Signal.TimeSignal.static_load(tmp_path / 'a.h5')
+    assert saved.x_start == pytest.approx(0.2)
+    assert np.array_equal(saved.Y, signal.Y[200:501])
+    assert [path.name for path in tmp_path.iterdir()] == ['a.h5']
+
+
+def test_view_of_lazy_signal_shares_its_file_handle(tmp_path):
+    signal = counting_signal()
+    signal.save(tmp_path / 'a.h5', compression='gzip')
+    loaded = Signal.TimeSignal.static_load(tmp_path / 'a.h5', lazy=True)
+    view = loaded.view(0.1, 0.2, channels=[1])
+    assert view.Y.file is loaded.Y.file
+    assert np.array_equal(np.asarray(view.Y), signal.Y[100:201, 1:2])
+    loaded.close()
+    # No handle is left open, so the file can be written again
+    h5py.File(tmp_path / 'a.h5', 'w').close()
+
+
+def random_signal(codomain, n=1001, channels=2, seed=0):
+    bit_depth = {'int': 16, 'float': 64, 'complex': 128}[codomain]
+    signal = Signal.TimeSignal(x_start=0.5, x_end=0.5 + (n - 1) / 1000.0, delta_x=1.0 / 1000.0, bit_depth=bit_depth,
+                               codomain=codomain, channels=channels)
+    rng = np.random.default_rng(seed)
+    if codomain == 'int':
+        signal.Y[:] = rng.integers(-20000, 20000, size=signal.Y.shape)
+    elif codomain == 'complex':
+        signal.Y[:] = rng.standard_normal(signal.Y.shape) + 1j * rng.standard_normal(signal.Y.shape)
+    else:
+        signal.Y[:] = rng.standard_normal(signal.Y.shape)
+    return signal
+
+
+layouts = [
+    ({}, 'contiguous'),
+    ({'chunks': 128}, 'chunked'),
+    ({'chunks': (100, 1), 'compression': 'gzip', 'compression_opts': 9, 'shuffle': True}, 'chunked'),
+    ({'compression': 'lzf'}, 'chunked'),
+]
+
+
+@pytest.mark.parametrize('options, layout', layouts)
+@pytest.mark.parametrize('codomain', ['int', 'float', 'complex'])
+@pytest.mark.parametrize('lazy', [False, True])
+def test_round_trip(tmp_path, options, layout, codomain, lazy):
+    signal = random_signal(codomain)
+    signal.save(tmp_path / 'a.h5', **options)
+    with h5py.File(tmp_path / 'a.h5', 'r') as f:
+        assert f.attrs['format_version'] == 2
+        assert f.attrs['layout'] == layout
+        # Version 2 files store a uniform sample axis as attributes only
+        assert 'X' not in f
+    loaded = Signal.TimeSignal.static_load(tmp_path / 'a.h5', lazy=lazy)
+    assert loaded.Y.dtype == signal.Y.dtype
+    assert np.array_equal(np.asarray(loaded.Y), signal.Y)
+    assert (loaded.x_start, loaded.x_end, loaded.delta_x, loaded.n) == (signal.x_start, signal.x_end, signal.delta_x,
+                                                                       signal.n)
+    assert np.allclose(loaded.X[:], signal.X[:])
+    loaded.close()
+
+
+def test_round_trip_of_sample_axis(tmp_path):
+    # Signals with a non-uniform sample axis store it as an X dataset
+    signal = random_signal('float')
+    signal.X = np.sort(np.random.default_rng(1).uniform(0.0, 1.0, signal.n))
+    signal.save(tmp_path / 'a.h5', compression='gzip')
+    for lazy in [False, True]:
+        loaded = Signal.TimeSignal.static_load(tmp_path / 'a.h5', lazy=lazy)
+        assert np.array_equal(np.asarray(loaded.X), signal.X)
+        assert np.array_equal(np.asarray(loaded.Y), signal.Y)
+        loaded.close()
+
+
+def expected_statistics(Y, length):
+    Y = np.absolute(Y) if np.iscomplexobj(Y) else Y
+    starts = np.arange(0, Y.shape[0], length)
+    return np.minimum.reduceat(Y, starts, axis=0), np.maximum.reduceat(Y, starts, axis=0)
+
+
+@pytest.mark.parametrize('codomain', ['int', 'float', 'complex'])
+def test_chunk_statistics(tmp_path, codomain):
+    signal = random_signal(codomain)
+    signal.save(tmp_path / 'a.h5', chunks=128, compression='gzip')
+    length, Y_min, Y_max = Signal.TimeSignal.static_load(tmp_path / 'a.h5', lazy=True).statistics()
+    assert length == 128
+    # 1001 samples make 7 whole chunks and a last one of 105 samples
+    assert Y_min.shape == (8, 2)
+    expected_min, expected_max = expected_statistics(signal.Y, 128)
+    assert np.array_equal(Y_min, expected_min)
+    assert np.array_equal(Y_max, expected_max)
+
+    signal.save(tmp_path / 'b.h5')
+    assert Signal.TimeSignal.static_load(tmp_path / 'b.h5').statistics() is None
+
+
+def test_writer_statistics_equal_save(tmp_path):
+    signal = random_signal('int')
+    with Signal.TimeSignalWriter(tmp_path / 'a.h5', x_start=signal.x_start, x_end=signal.x_end, delta_x=signal.delta_x,
+                                 dtype=signal.Y.dtype, channels=2, chunks=128, compression='gzip') as writer:
+        # Blocks that start and end within chunks
+        for k_0 in range(0, signal.n, 77):
+            writer.write(signal.Y[k_0:k_0 + 77])
+    written = Signal.TimeSignal.static_load(tmp_path / 'a.h5')
+    assert np.array_equal(written.Y, signal.Y)
+    signal.save(tmp_path / 'b.h5', chunks=128)
+    for written_statistics, saved_statistics in zip(written.statistics(), signal.statistics()):
+        assert np.array_equal(written_statistics, saved_statistics)
+
+
+def long_signal(n=2 ** 20, codomain='int'):
+    return random_signal(codomain, n=n)
+
+
+def test_pyramid_levels():
+    signal = long_signal()
+    levels = signal.get_pyramid()
+    # Bins of 16 samples, coarsened by 4 until at most 1024 bins are left
+    assert [factor for factor, Y_min, Y_max in levels] == [16, 64, 256, 1024]
+    for factor, Y_min, Y_max in levels:
+        expected_min, expected_max = expected_statistics(signal.Y, factor)
+        assert np.array_equal(Y_min, expected_min)
+        assert np.array_equal(Y_max, expected_max)
+    assert Signal.build_pyramid(signal.Y[:16 * 1024 - 1]) == []
+
+
+@pytest.mark.parametrize('pixels, factor', [(1000, 1024), (4000, 256), (10000, 64), (50000, 16), (100000, None)])
+def test_plot_data_level_selection(pixels, factor):
+    signal = long_signal()
+    X, Y = signal.plot_data(signal.x_start, signal.x_end, channel=1, pixels=pixels)
+    if factor is None:
+        # Fewer than 16 samples per pixel are drawn as they are
+        assert np.array_equal(Y, signal.Y[:, 1])
+        return
+    # The largest bins that still give a bin per pixel, drawn as strokes from min to max
+    assert Y.shape[0] == 2 * (signal.n // factor)
+    assert signal.n // factor >= pixels
+    expected_min, expected_max = expected_statistics(signal.Y[:, 1], factor)
+    assert np.array_equal(Y[0::2], expected_min)
+    assert np.array_equal(Y[1::2], expected_max)
+    assert np.allclose(X[0::2], signal.x_start + (np.arange(signal.n // factor) * factor + 0.5 * (factor - 1)) * signal.delta_x)
+
+
+def test_plot_data_of_range_reads_its_bins():
+    signal = long_signal()
+    x_0 = signal.x_start + 100000 * signal.delta_x
+    x_1 = signal.x_start + 300000 * signal.delta_x
+    X, Y = signal.plot_data(x_0, x_1, pixels=1000)
+    # 200001 samples on 1000 pixels give bins of 64 samples, those that hold the range
+    assert Y.shape[0] == 2 * (300000 // 64 - 100000 // 64 + 1)
+    assert X[0] <= x_0 and X[-1] >= x_1 - 64 * signal.delta_x
+    assert np.min(Y) == np.min(signal.Y[100000 // 64 * 64:(300000 // 64 + 1) * 64, 0])
+
+
+def test_plot_data_without_pyramid():
+    # Too short for a pyramid, or complex
+    for signal in [long_signal(n=16 * 1024 - 1), long_signal(n=2 ** 16, codomain='complex')]:
+        X, Y = signal.plot_data(signal.x_start, signal.x_end, pixels=100)
+        assert np.array_equal(Y, signal.Y[:, 0])
+
+
+def test_pyramid_is_saved(tmp_path):
+    signal = long_signal()
+    signal.save(tmp_path / 'a.h5', compression='gzip')
+    loaded = Signal.TimeSignal.static_load(tmp_path / 'a.h5', lazy=True)
+    for (factor, Y_min, Y_max), (loaded_factor, loaded_min, loaded_max) in zip(signal.get_pyramid(), loaded.pyramid):
+        assert factor == loaded_factor
+        assert np.array_equal(np.asarray(loaded_min), Y_min)
+        assert np.array_equal(np.asarray(loaded_max), Y_max)
+    assert np.array_equal(loaded.plot_data(0.5, 1000.0, pixels=1000)[1], signal.plot_data(0.5, 1000.0, pixels=1000)[1])
+    loaded.close()
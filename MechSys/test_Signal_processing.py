@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+
+"""Tests of the transforms in Signal_processing"""
+
+# standard library
+import threading
+import tracemalloc
+# 3rd party
+import numpy as np
+import pytest
+# Internals
+from MechSys import Fourier, Signal, Signal_processing
+
+
+def noisy_signal(n=4000, f_s=10000.0, channels=2, codomain='int', seed=0):
+    bit_depth = 16 if codomain == 'int' else (128 if codomain == 'complex' else 64)
+    signal = Signal.TimeSignal(x_start=0.0, x_end=(n - 1) / f_s, delta_x=1.0 / f_s, bit_depth=bit_depth,
+                               codomain=codomain, channels=channels)
+    rng = np.random.default_rng(seed)
+    if codomain == 'int':
+        signal.Y[:] = rng.integers(-20000, 20000, size=signal.Y.shape)
+    elif codomain == 'complex':
+        signal.Y[:] = rng.standard_normal(signal.Y.shape) + 1j * rng.standard_normal(signal.Y.shape)
+    else:
+        signal.Y[:] = rng.standard_normal(signal.Y.shape)
+    return signal
+
+
+@pytest.mark.parametrize('codomain', ['int', 'float', 'complex'])
+def test_gabor_block_equals_loop(codomain):
+    signal = noisy_signal(codomain=codomain)
+    parameters = {'window_size': 0.005, 'delta_tau': 0.001, 'delta_freq': 100.0, 'use_cache': False}
+    loop = Signal_processing.gabor_transform(signal, method='loop', **parameters)
+    for block_bytes in [Signal_processing.stft_block_bytes, 100000]:
+        block = Signal_processing.gabor_transform(signal, method='block', block_bytes=block_bytes, **parameters)
+        assert block.Y.shape == loop.Y.shape
+        assert np.max(np.abs(block.Y - loop.Y)) <= 1e-9 * np.max(np.abs(loop.Y))
+
+
+def test_gabor_of_lazy_signal(tmp_path):
+    signal = noisy_signal()
+    signal.save(tmp_path / 'a.h5', compression='gzip')
+    lazy_signal = Signal.TimeSignal.static_load(tmp_path / 'a.h5', lazy=True)
+    parameters = {'window_size': 0.005, 'delta_tau': 0.001, 'delta_freq': 100.0, 'use_cache': False}
+    lazy = Signal_processing.gabor_transform(lazy_signal, **parameters)
+    lazy_signal.close()
+    assert np.array_equal(lazy.Y, Signal_processing.gabor_transform(signal, **parameters).Y)
+
+
+@pytest.mark.parametrize('codomain', ['int', 'complex'])
+def test_gabor_blocks_stay_within_block_bytes(codomain):
+    signal = noisy_signal(n=20000, codomain=codomain)
+    parameters = {'window_size': 0.005, 'delta_tau': 0.0005, 'delta_freq': 10.0, 'use_cache': False}
+    block_bytes = 2 ** 20
+    tracemalloc.start()
+    try:
+        transform = Signal_processing.gabor_transform(signal, block_bytes=block_bytes, **parameters)
+        forward_peak = tracemalloc.get_traced_memory()[1] - transform.Y.nbytes
+        tracemalloc.reset_peak()
+        start = tracemalloc.get_traced_memory()[0]
+        inverse = Signal_processing.inverse_gabor_transform(transform, block_bytes=block_bytes)
+        inverse_peak = tracemalloc.get_traced_memory()[1] - start - inverse.Y.nbytes
+    finally:
+        tracemalloc.stop()
+    # The transform holds many blocks of output, so a wrong frame size would show as a multiple of block_bytes
+    assert transform.Y.nbytes > 20 * block_bytes
+    assert forward_peak < 1.5 * block_bytes
+    assert inverse_peak < 1.5 * block_bytes
+
+
+def direct_wavelet_transform(x, delta_x, scale, window_function, k):
+    """The wavelet transform of x at sample k and scale, as a sum over the samples of x, which are zero outside."""
+    eta = (np.arange(x.shape[0]) - k) * delta_x / scale
+    if window_function == 'Morlet':
+        psi = np.pi ** -0.25 * np.exp(6.0j * eta) * np.exp(-0.5 * eta ** 2)
+    else:
+        psi = 2.0 / (np.sqrt(3.0) * np.pi ** 0.25) * (1.0 - eta ** 2) * np.exp(-0.5 * eta ** 2)
+    return np.sqrt(delta_x / scale) * np.sum(x * np.conj(psi))
+
+
+@pytest.mark.parametrize('window_function', ['Morlet', 'Mexican hat'])
+def test_wavelet_equals_direct_convolution(window_function):
+    signal = noisy_signal(n=2000, f_s=1000.0, channels=1, codomain='float')
+    transform = Signal_processing.wavelet_transform(signal, window_function=window_function, f_min=20.0, f_max=100.0,
+                                                    delta_freq=40.0, use_cache=False)
+    scales = Signal_processing.wavelet_scales(window_function, transform.X[1][:], omega_0=6.0)
+    for j, scale in enumerate(scales):
+        for k in [0, 35, 1000, 1999]:
+            expected = direct_wavelet_transform(signal.Y[:, 0], signal.delta_x, scale, window_function, k)
+            assert abs(transform.Y[k, j, 0] - expected) <= 1e-6 * np.max(np.abs(transform.Y[:, j, 0]))
+
+
+def test_mexican_hat_of_impulse_is_positive_at_the_impulse():
+    signal = noisy_signal(n=1001, f_s=1000.0, channels=1, codomain='float')
+    signal.Y[:] = 0.0
+    signal.Y[500, 0] = 1.0
+    transform = Signal_processing.wavelet_transform(signal, window_function='Mexican hat', f_min=20.0, f_max=100.0,
+                                                    delta_freq=40.0, use_cache=False)
+    assert np.all(transform.Y[500, :, 0].real > 0)
+
+
+@pytest.mark.parametrize('window_function', ['Morlet', 'Mexican hat'])
+def test_wavelet_chunks_equal_whole(window_function):
+    signal = noisy_signal(n=4096, codomain='float')
+    whole = Signal_processing.wavelet_transform(signal, window_size=0.02, window_function=window_function, use_cache=False)
+    chunked = Signal_processing.wavelet_transform(signal, window_size=0.02, window_function=window_function,
+                                                  chunk_length=257, workers=4, use_cache=False)
+    assert whole.X[1][-1] == pytest.approx(Signal_processing.wavelet_f_max(window_function, signal.f_s))
+    error = np.max(np.abs(whole.Y - chunked.Y), axis=(0, 2)) / np.max(np.abs(whole.Y), axis=(0, 2))
+    assert np.max(error) < 1e-5
+
+
+def test_wavelet_threads_share_the_transform_threads(monkeypatch):
+    monkeypatch.setattr(Fourier, 'workers', 8)
+    wavelet_chunk = Signal_processing.wavelet_chunk
+    seen = {}
+
+    def recording_chunk(*args):
+        seen[threading.get_ident()] = Fourier.thread_workers()
+        return wavelet_chunk(*args)
+
+    monkeypatch.setattr(Signal_processing, 'wavelet_chunk', recording_chunk)
+    signal = noisy_signal(n=4096, codomain='float')
+    Signal_processing.wavelet_transform(signal, window_size=0.02, chunk_length=257, workers=4, use_cache=False)
+    assert threading.get_ident() not in seen
+    assert set(seen.values()) == {2}
+    assert Fourier.thread_workers() == 8
+
+
+def test_wavelet_frequencies():
+    signal = noisy_signal(n=1000, channels=1, codomain='float')
+    single = Signal_processing.wavelet_transform(signal, f_min=500.0, f_max=500.0, use_cache=False)
+    assert single.Y.shape == (1000, 1, 1)
+    for parameters in [{'delta_freq': 0.0}, {'delta_freq': -10.0}, {'f_max': signal.f_s / 2.0}, {'f_min': 0.0}]:
+        with pytest.raises(ValueError):
+            Signal_processing.wavelet_transform(signal, window_size=0.02, use_cache=False, **parameters)
+
+
+@pytest.mark.parametrize('window_size, delta_tau, delta_freq', [(0.005, 0.001, 100.0), (0.01, 0.004, 40.0)])
+def test_inverse_gabor_int16_round_trip(window_size, delta_tau, delta_freq):
+    signal = noisy_signal()
+    transform = Signal_processing.gabor_transform(signal, window_size=window_size, delta_tau=delta_tau,
+                                                  delta_freq=delta_freq, use_cache=False)
+    assert transform.window_size == window_size
+    assert transform.delta_tau == pytest.approx(delta_tau)
+    inverse = Signal_processing.inverse_gabor_transform(transform, block_bytes=100000)
+    assert inverse.Y.dtype == np.int16
+    assert np.array_equal(inverse.Y, signal.Y)
+
+
+def test_inverse_gabor_of_cropped_frames():
+    # With fewer frequencies than window samples, the frames are cropped and the last samples are in no frame
+    signal = noisy_signal()
+    transform = Signal_processing.gabor_transform(signal, window_size=0.01, delta_tau=0.004, delta_freq=100.0,
+                                                  use_cache=False)
+    inverse = Signal_processing.inverse_gabor_transform(transform)
+    assert np.array_equal(inverse.Y[:3960], signal.Y[:3960])
+    assert np.all(inverse.Y[3960:] == 0)
+
+
+def test_inverse_gabor_float_round_trip():
+    signal = noisy_signal(codomain='float')
+    transform = Signal_processing.gabor_transform(signal, window_size=0.005, delta_tau=0.001, delta_freq=100.0,
+                                                  use_cache=False)
+    inverse = Signal_processing.inverse_gabor_transform(transform)
+    assert np.max(np.abs(inverse.Y - signal.Y)) < 1e-9
+
+
+def test_inverse_gabor_to_file(tmp_path):
+    signal = noisy_signal()
+    transform = Signal_processing.gabor_transform(signal, window_size=0.005, delta_tau=0.002, delta_freq=100.0)
+    inverse = Signal_processing.inverse_gabor_transform(transform, path_string=tmp_path / 'a.h5', block_bytes=100000)
+    assert np.array_equal(np.asarray(inverse.Y), signal.Y)
+    inverse.close()
+
+
+def test_inverse_gabor_of_saved_transform(tmp_path):
+    signal = noisy_signal()
+    transform = Signal_processing.gabor_transform(signal, window_size=0.005, delta_tau=0.002, delta_freq=100.0,
+                                                  use_cache=False)
+    transform.save(tmp_path / 'a.h5')
+    loaded = Signal.TimeFrequencySignal(Y=np.zeros((1, 1, 1)))
+    loaded.load(tmp_path / 'a.h5')
+    assert (loaded.window_size, loaded.window_function, loaded.delta_tau) == (0.005, 'Hann', pytest.approx(0.002))
+    loaded.time_signal = signal
+    assert np.array_equal(Signal_processing.inverse_gabor_transform(loaded).Y, signal.Y)
+
+
+def test_inverse_of_wavelet_transform_is_refused():
+    signal = noisy_signal(channels=1, codomain='float')
+    transform = Signal_processing.wavelet_transform(signal, window_size=0.02, delta_freq=500.0, use_cache=False)
+    with pytest.raises(ValueError):
+        Signal_processing.inverse_gabor_transform(transform)
+
+
+@pytest.mark.parametrize('n', [999, 1000, 1031])
+@pytest.mark.parametrize('channels', [1, 3])
+@pytest.mark.parametrize('codomain', ['int', 'float'])
+@pytest.mark.parametrize('pad', [False, True])
+def test_one_sided_fft_round_trip(n, channels, codomain, pad):
+    signal = noisy_signal(n=n, channels=channels, codomain=codomain)
+    spectrum = Signal_processing.fft(signal, pad=pad, use_cache=False)
+    assert spectrum.one_sided
+    n_f = spectrum.fft_n
+    assert n_f >= n if pad else n_f == n
+    assert spectrum.Y.shape == (n_f // 2 + 1, channels)
+    assert spectrum.X[-1] == pytest.approx((n_f // 2) * signal.f_s / n_f)
+    expected = np.fft.rfft(signal.Y.astype(np.float64), n=n_f, axis=0)
+    assert np.allclose(spectrum.Y, expected, rtol=1e-5, atol=1e-5 * np.max(np.abs(expected)))
+
+    inverse = Signal_processing.ifft(spectrum)
+    assert inverse.Y.dtype == signal.Y.dtype
+    assert inverse.Y.shape == signal.Y.shape
+    if codomain == 'int':
+        assert np.array_equal(inverse.Y, signal.Y)
+    else:
+        assert np.allclose(inverse.Y, signal.Y, atol=1e-12)
+
+
+def test_one_sided_fft_round_trip_of_saved_spectrum(tmp_path):
+    # Odd length: the last bin is below f_s / 2, and only time_n tells irfft the length. Without the time signal the
+    # samples are taken to be integers, of 16 bits for a complex64 spectrum
+    signal = noisy_signal(n=1001, channels=2, codomain='int')
+    Signal_processing.fft(signal, pad=True, use_cache=False).save(tmp_path / 'a.h5')
+    loaded = Signal.FrequencySignal.static_load(tmp_path / 'a.h5')
+    assert loaded.one_sided
+    assert loaded.time_n == 1001
+    assert loaded.fft_n > 1001
+    inverse = Signal_processing.ifft(loaded)
+    assert inverse.Y.dtype == signal.Y.dtype
+    assert np.array_equal(inverse.Y, signal.Y)
+
+
+def test_two_sided_fft_round_trip():
+    signal = noisy_signal(n=999, channels=3, codomain='complex')
+    spectrum = Signal_processing.fft(signal, use_cache=False)
+    assert not spectrum.one_sided
+    assert spectrum.Y.shape == (999, 3)
+    assert np.allclose(spectrum.Y, np.fft.fftshift(np.fft.fft(signal.Y, axis=0), axes=0))
+    inverse = Signal_processing.ifft(spectrum)
+    assert inverse.Y.dtype == signal.Y.dtype
+    assert np.allclose(inverse.Y, signal.Y, atol=1e-12)
+    with pytest.raises(ValueError):
+        Signal_processing.fft(signal, one_sided=True, use_cache=False)
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+"""Tests of the signal store in Store"""
+
+# standard library
+# 3rd party
+import numpy as np
+# Internals
+from MechSys import Signal, Store
+
+
+def random_signal(n=1000, seed=0):
+    signal = Signal.TimeSignal(x_start=0.0, x_end=(n - 1) / 1000.0, delta_x=1.0 / 1000.0, bit_depth=16, codomain='int',
+                               channels=2)
+    signal.Y[:] = np.random.default_rng(seed).integers(-20000, 20000, size=signal.Y.shape)
+    return signal
+
+
+def test_save_to_a_store_that_was_loaded_from(tmp_path):
+    path = tmp_path / 'store.h5'
+    signal = random_signal()
+    with Store.SignalStore(path) as store:
+        store.put('chunked', signal, compression='gzip')
+        store.put('contiguous', signal)
+
+    store = Store.open_store(path, mode='r')
+    chunked = store.get('chunked', lazy=True)
+    contiguous = store.get('contiguous', lazy=True)
+    view = chunked.view(0.1, 0.2)
+    assert isinstance(chunked.Y, Signal.LazyDataset)
+
+    writable = Store.open_store(path, mode='a')
+    assert writable is store
+    writable.put('other', random_signal(seed=1))
+
+    # The lazily read signals now read through the writable handle
+    assert np.array_equal(np.asarray(chunked.Y), signal.Y)
+    assert np.array_equal(np.asarray(view.Y), signal.Y[100:201])
+    assert np.array_equal(np.asarray(contiguous.Y), signal.Y)
+    assert Store.open_store(path, mode='r').names() == ['chunked', 'contiguous', 'other']
+    store.close()
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+
+"""Tests of the simulation engines in System_processing"""
+
+# standard library
+# 3rd party
+import h5py
+import numpy as np
+import pytest
+# Internals
+from MechSys import Signal, System, System_processing
+
+
+def input_signal(n=500, seed=0, codomain='float', amplitude=50):
+    """Random float64 samples, or int16 samples from -amplitude to amplitude."""
+    bit_depth = 16 if codomain == 'int' else 64
+    signal = Signal.TimeSignal(x_start=0.0, x_end=(n - 1) / 1000.0, delta_x=1.0 / 1000.0, bit_depth=bit_depth,
+                               codomain=codomain)
+    rng = np.random.default_rng(seed)
+    if codomain == 'int':
+        signal.Y[:, 0] = rng.integers(-amplitude, amplitude, size=signal.n, endpoint=True)
+    else:
+        signal.Y[:, 0] = rng.standard_normal(signal.n)
+    return signal
+
+
+def build(components, connectors, **signal_options):
+    system = System.System()
+    for component in components:
+        if component == 'input':
+            system.add_input(input_signal(**signal_options))
+        elif isinstance(component, tuple):
+            getattr(system, 'add_{}'.format(component[0]))(*component[1:])
+        else:
+            getattr(system, 'add_{}'.format(component))()
+    for connector in connectors:
+        system.add_connector(connector)
+    return system
+
+
+def nested_system(depth):
+    """Every level feeds its input both through the level below and through a delay, and adds the two."""
+    system = build([('input', None), 'split', 'delay', 'add', 'output'], [])
+    if depth == 1:
+        system.add_gain(0.5)
+    else:
+        system.add_system(nested_system(depth - 1))
+    for connector in [((0, 0), (1, 0)), ((1, 0), (5, 0)), ((5, 0), (3, 0)), ((1, 1), (2, 0)), ((2, 0), (3, 1)), ((3, 0), (4, 0))]:
+        system.add_connector(connector)
+    return system
+
+
+def make_system(name, codomain='float'):
+    if name == 'feed forward':
+        return build(['input', 'input', ('gain', 2.0), 'split', 'add', 'sum', 'output', ('function', 'x * x'), 'output'],
+                     [((0, 0), (2, 0)), ((2, 0), (3, 0)), ((3, 0), (4, 0)), ((1, 0), (4, 1)), ((4, 0), (5, 0)),
+                      ((5, 0), (6, 0)), ((3, 1), (7, 0)), ((7, 0), (8, 0))], codomain=codomain)
+    if name == 'delay loop':
+        return build(['input', 'add', 'split', 'delay', ('gain', 0.5), 'output'],
+                     [((0, 0), (1, 0)), ((1, 0), (2, 0)), ((2, 0), (5, 0)), ((2, 1), (3, 0)), ((3, 0), (4, 0)),
+                      ((4, 0), (1, 1))], codomain=codomain)
+    if name == 'algebraic loop':
+        return build(['input', 'add', 'split', ('gain', 0.5), 'output'],
+                     [((0, 0), (1, 0)), ((1, 0), (2, 0)), ((2, 0), (4, 0)), ((2, 1), (3, 0)), ((3, 0), (1, 1))],
+                     codomain=codomain)
+    if name == 'delay sum gain':
+        return build(['input', 'delay', 'sum', ('gain', 0.5), 'output'],
+                     [((0, 0), (1, 0)), ((1, 0), (2, 0)), ((2, 0), (3, 0)), ((3, 0), (4, 0))], codomain=codomain)
+    if name == 'integer sum':
+        # Large enough samples for the integer add and sum to wrap around
+        return build(['input', 'input', 'add', 'delay', 'sum', ('gain', 0.5), 'output'],
+                     [((0, 0), (2, 0)), ((1, 0), (2, 1)), ((2, 0), (3, 0)), ((3, 0), (4, 0)), ((4, 0), (5, 0)),
+                      ((5, 0), (6, 0))], codomain=codomain, amplitude=20000)
+    if name == 'nested':
+        system = build(['input', 'output'], [], codomain=codomain)
+        system.add_system(nested_system(3))
+        system.add_connector(((0, 0), (2, 0)))
+        system.add_connector(((2, 0), (1, 0)))
+        return system
+
+
+systems = ['feed forward', 'delay loop', 'algebraic loop', 'delay sum gain', 'integer sum', 'nested']
+
+
+def outputs(system, **parameters):
+    return [np.array(signal.Y) for signal in System_processing.simulate(system, **parameters)]
+
+
+# Integer samples wrap around in every engine, as numpy scalars do in the step method
+@pytest.mark.filterwarnings('ignore:overflow encountered')
+@pytest.mark.parametrize('name', systems)
+@pytest.mark.parametrize('method', ['compiled', 'block'])
+@pytest.mark.parametrize('codomain', ['float', 'int'])
+def test_engines_equal_step(name, method, codomain):
+    expected = outputs(make_system(name, codomain), method='step')
+    for out, expected_out in zip(outputs(make_system(name, codomain), method=method), expected):
+        assert out.dtype == expected_out.dtype
+        assert np.array_equal(out, expected_out)
+
+
+@pytest.mark.filterwarnings('ignore:overflow encountered')
+@pytest.mark.parametrize('name', systems)
+@pytest.mark.parametrize('codomain', ['float', 'int'])
+def test_auto_equals_step(name, codomain):
+    expected = outputs(make_system(name, codomain), method='step')
+    for out, expected_out in zip(outputs(make_system(name, codomain), method='auto'), expected):
+        assert np.allclose(out, expected_out, rtol=1e-10, atol=1e-10)
+
+
+@pytest.mark.filterwarnings('ignore:overflow encountered')
+def test_integer_sum_wraps_around():
+    system = make_system('integer sum', 'int')
+    x = system.components[0].signal.Y[:, 0] + system.components[1].signal.Y[:, 0]
+    out = outputs(system, method='block')[0][:, 0]
+    # One sample for the delay, and one for each of the four connectors that leave a component
+    assert np.array_equal(out[5:], (0.5 * np.cumsum(x, dtype=np.int16)[:-5]).astype(np.int16))
+    assert np.max(np.abs(np.cumsum(x.astype(np.int64)))) > 32767
+
+
+def test_stream_equals_step():
+    system = make_system('delay loop')
+    expected = outputs(system, method='step')[0][:, 0]
+    blocks = [out_blocks[0] for k_0, out_blocks in System_processing.simulate_stream(system, chunk_size=64, method='block')]
+    assert np.array_equal(np.concatenate(blocks), expected)
+
+
+def test_delay_sum_gain_latency():
+    system = make_system('delay sum gain')
+    x = system.components[0].signal.Y[:, 0].copy()
+    step = outputs(system, method='step')[0][:, 0]
+    # One sample for the delay, and one for each of the three connectors that leave a component
+    assert np.array_equal(step[:4], np.zeros(4))
+    assert np.allclose(step[4:], 0.5 * np.cumsum(x)[:-4])
+    instant = outputs(make_system('delay sum gain'), method='block', timing='instant')[0][:, 0]
+    assert np.allclose(instant[1:], 0.5 * np.cumsum(x)[:-1])
+
+
+def test_stream_of_integers_equals_step():
+    system = make_system('integer sum', 'int')
+    with np.errstate(over='ignore'):
+        expected = outputs(system, method='step')[0][:, 0]
+    blocks = [out_blocks[0] for k_0, out_blocks in System_processing.simulate_stream(system, chunk_size=64)]
+    assert np.array_equal(np.concatenate(blocks), expected)
+
+
+@pytest.mark.parametrize('method', ['compiled', 'block', 'auto'])
+def test_instant_algebraic_loop(method):
+    system = make_system('algebraic loop')
+    x = system.components[0].signal.Y[:, 0].copy()
+    expected = np.zeros(x.shape[0])
+    for k in range(x.shape[0]):
+        expected[k] = x[k] + 0.5 * (expected[k - 1] if k > 0 else 0.0)
+    assert np.allclose(outputs(system, method=method, timing='instant')[0][:, 0], expected)
+    with pytest.raises(ValueError):
+        System_processing.simulate(make_system('algebraic loop'), method='linear', timing='instant')
+
+
+def gain_loop(gains):
+    """An input added to its own feedback through a chain of gains."""
+    system = build(['input', 'add', 'split', 'output'], [((0, 0), (1, 0)), ((1, 0), (2, 0)), ((2, 0), (3, 0))])
+    node = (2, 1)
+    for gain in gains:
+        system.add_gain(gain)
+        system.add_connector((node, (len(system.components) - 1, 0)))
+        node = (len(system.components) - 1, 0)
+    system.add_connector((node, (1, 1)))
+    return system
+
+
+@pytest.mark.parametrize('length', [20, 80, 120])
+def test_linear_of_high_order_equals_step(length):
+    gains = [0.97] + [1.0] * (length - 1)
+    expected = outputs(gain_loop(gains), method='step')[0]
+    assert np.allclose(outputs(gain_loop(gains), method='linear')[0], expected, rtol=1e-10, atol=1e-10)
+
+
+def test_state_system_realizes_state_space():
+    A = np.array([[0.5, 0.2], [-0.3, 0.9]])
+    B = np.array([[1.0], [0.5]])
+    C = np.array([[1.0, -2.0]])
+    D = np.array([[0.25]])
+    u = input_signal().Y[:, 0].copy()
+    x = np.zeros(2)
+    expected = np.zeros(u.shape[0])
+    for k in range(u.shape[0]):
+        expected[k] = C[0] @ x + D[0, 0] * u[k]
+        x = A @ x + B[:, 0] * u[k]
+    for method in ['compiled', 'block', 'linear']:
+        system = System_processing.state_system(A, B, C, D)
+        system.components[0].signal = input_signal()
+        assert np.allclose(outputs(system, method=method, timing='instant')[0][:, 0], expected)
+    with pytest.raises(ValueError):
+        System_processing.simulate(system, method='step', timing='instant')
+
+
+def test_step_reads_lazy_input_in_blocks(tmp_path, monkeypatch):
+    expected = outputs(make_system('delay sum gain'), method='step')[0]
+    system = make_system('delay sum gain')
+    system.components[0].signal.save(tmp_path / 'a.h5', compression='gzip')
+    system.components[0].signal = Signal.TimeSignal.static_load(tmp_path / 'a.h5', lazy=True)
+    reads = []
+    getitem = Signal.LazyDataset.__getitem__
+    monkeypatch.setattr(Signal.LazyDataset, '__getitem__', lambda self, key: reads.append(key) or getitem(self, key))
+    assert np.array_equal(outputs(system, method='step')[0], expected)
+    assert len(reads) == 1
+
+
+@pytest.mark.parametrize('name', systems)
+def test_simulate_2_equals_instant(name):
+    expected = outputs(make_system(name), method='compiled', timing='instant')
+    result = [np.array(signal.Y) for signal in System_processing.simulate_2(make_system(name))]
+    for out, expected_out in zip(result, expected):
+        assert np.array_equal(out, expected_out)
+
+
+@pytest.mark.parametrize('name', ['feed forward', 'delay loop', 'delay sum gain'])
+def test_schedule_follows_the_data_flow(name):
+    system = make_system(name)
+    order = System_processing.schedule(system, strict=True)
+    assert sorted(order) == list(range(len(system.components)))
+    position = {c: k for k, c in enumerate(order)}
+    for ((a, i), (b, j)) in system.connectors:
+        if not system.components[b].type == 'delay':
+            assert position[a] < position[b]
+
+
+def test_schedule_of_algebraic_loop():
+    # add -> split -> gain -> add is a loop without a delay, fed by the input and feeding the output
+    system = make_system('algebraic loop')
+    assert System_processing.algebraic_loops(system) == [[1, 2, 3]]
+    assert System_processing.has_algebraic_loop(system)
+    assert not System_processing.has_algebraic_loop(make_system('delay loop'))
+    with pytest.raises(ValueError, match='Algebraic loop'):
+        System_processing.schedule(system, strict=True)
+    # Otherwise the loop is evaluated together, after the input and before the output
+    assert System_processing.schedule(system) == [0, 1, 2, 3, 4]
+
+
+def test_simulate_batch(tmp_path):
+    system = make_system('delay sum gain')
+    for seed in range(3):
+        input_signal(seed=seed).save(tmp_path / 'input_{}.h5'.format(seed))
+    system.components[0].signal = Signal.TimeSignal.static_load(tmp_path / 'input_0.h5', lazy=True)
+    system.save(tmp_path / 'system.h5')
+    system.components[0].signal.close()
+
+    # A failing job does not stop the others
+    jobs = [tmp_path / 'input_{}.h5'.format(seed) for seed in range(3)] + [[tmp_path / 'missing.h5']]
+    results = System_processing.simulate_batch(tmp_path / 'system.h5', jobs, tmp_path / 'outputs', processes=2,
+                                               chunk_size=128)
+    assert [result['error'] is None for result in results] == [True, True, True, False]
+    for seed, result in enumerate(results[:3]):
+        expected = make_system('delay sum gain')
+        expected.components[0].signal = input_signal(seed=seed)
+        assert result['outputs'] == [str(tmp_path / 'outputs' / 'input_{}_output_0.h5'.format(seed))]
+        assert np.allclose(Signal.TimeSignal.static_load(result['outputs'][0]).Y, outputs(expected, method='step')[0])
+
+
+def test_simulate_batch_of_a_missing_system(tmp_path):
+    input_signal().save(tmp_path / 'input.h5')
+    results = System_processing.simulate_batch(tmp_path / 'missing.h5', str(tmp_path / 'input*.h5'), tmp_path / 'outputs',
+                                               processes=1)
+    assert len(results) == 1
+    assert results[0]['outputs'] == []
+    assert results[0]['error'] is not None
+
+
+def test_sweep_of_gains(tmp_path):
+    gains = [0.5, 1.0, -2.0]
+    path = System_processing.simulate_sweep(make_system('delay sum gain'), {3: gains}, tmp_path / 'sweep.h5', chunk_size=128)
+    with h5py.File(path, 'r') as f:
+        assert f['Y'].shape == (1, 3, 500)
+        assert np.array_equal(f['parameter_3'][()], gains)
+        for g, gain in enumerate(gains):
+            system = make_system('delay sum gain')
+            system.components[3].coefficient = gain
+            assert np.allclose(f['Y'][0, g], outputs(system, method='step')[0][:, 0])
+
+
+def test_sweep_of_gains_and_functions(tmp_path):
+    gains = [2.0, 3.0]
+    functions = ['x * x', 'sin(x)', '-x']
+    path = System_processing.simulate_sweep(make_system('feed forward'), {2: gains, 7: functions}, tmp_path / 'sweep.h5',
+                                            chunk_size=128, processes=2)
+    with h5py.File(path, 'r') as f:
+        assert f['Y'].shape == (2, 2, 3, 500)
+        assert [value.decode() for value in f['parameter_7'][()]] == functions
+        for g, gain in enumerate(gains):
+            for h, function in enumerate(functions):
+                system = make_system('feed forward')
+                system.components[2].coefficient = gain
+                system.components[7].function_string = function
+                for o, expected in enumerate(outputs(system, method='step')):
+                    assert np.allclose(f['Y'][o, g, h], expected[:, 0])
+
+
+def test_sweep_of_other_components_is_refused(tmp_path):
+    with pytest.raises(TypeError):
+        System_processing.simulate_sweep(make_system('delay sum gain'), {1: [0.5]}, tmp_path / 'sweep.h5')
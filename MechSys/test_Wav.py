@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+"""Tests of the chunked WAV reader and writer"""
+
+# standard library
+import json
+import pathlib
+import wave
+# 3rd party
+import h5py
+import numpy as np
+import pytest
+# Internals
+import MechImport
+from MechSys import Signal, Wav
+
+
+def random_samples(frames, channels, bits, codomain, seed=0):
+    rng = np.random.default_rng(seed)
+    if codomain == 'float':
+        return rng.uniform(-1.0, 1.0, size=(frames, channels)).astype('<f{}'.format(bits // 8))
+    high = (1 << (bits - 1)) - 1
+    dtype = Wav.sample_dtype({'format': Wav.format_pcm, 'bits': bits})
+    return rng.integers(-high - 1, high, size=(frames, channels), endpoint=True).astype(dtype)
+
+
+@pytest.mark.parametrize('bits, codomain', [(8, 'int'), (16, 'int'), (24, 'int'), (32, 'int'), (32, 'float'), (64, 'float')])
+@pytest.mark.parametrize('channels', [1, 2])
+def test_round_trip(tmp_path, bits, codomain, channels):
+    Y = random_samples(1001, channels, bits, codomain)
+    path = Wav.write(tmp_path / 'a.wav', Y, 48000, bits=bits, codomain=codomain, frames=128)
+    header = Wav.read_header(path)
+    assert header['frames'] == 1001
+    assert header['channels'] == channels
+    assert header['f_s'] == 48000
+    read, header = Wav.read(path, frames=100)
+    assert read.dtype == Wav.sample_dtype(header)
+    assert np.array_equal(read, Y)
+    assert np.array_equal(np.concatenate(list(Wav.read_blocks(path, frames=77))), Y)
+
+
+def test_24_bit_extremes(tmp_path):
+    Y = np.array([[-(1 << 23)], [-1], [0], [1], [(1 << 23) - 1]], dtype=np.int32)
+    Y_read, header = Wav.read(Wav.write(tmp_path / 'a.wav', Y, 44100, bits=24))
+    assert header['bits'] == 24
+    assert np.array_equal(Y_read, Y)
+
+
+def test_matches_wave_module(tmp_path):
+    Y = random_samples(500, 2, 16, 'int')
+    Wav.write(tmp_path / 'a.wav', Y, 44100, bits=16)
+    with wave.open(str(tmp_path / 'a.wav'), 'rb') as f:
+        assert f.getnchannels() == 2
+        assert f.getframerate() == 44100
+        assert f.getsampwidth() == 2
+        data = np.frombuffer(f.readframes(f.getnframes()), dtype='<i2').reshape((-1, 2))
+    assert np.array_equal(data, Y)
+
+
+def test_read_into_dataset(tmp_path):
+    Y = random_samples(300, 2, 24, 'int')
+    path = Wav.write(tmp_path / 'a.wav', Y, 8000, bits=24)
+    with h5py.File(tmp_path / 'a.h5', 'w') as f:
+        out = f.create_dataset('Y', shape=(300, 2), dtype=np.int32)
+        Wav.read(path, out=out, frames=64)
+        assert np.array_equal(out[()], Y)
+
+
+def test_pcm_is_clipped(tmp_path):
+    Y = np.array([[-2.0e5], [-3.0], [4.0], [2.0e5]])
+    Y_read, header = Wav.read(Wav.write(tmp_path / 'a.wav', Y, 8000, bits=16))
+    assert np.array_equal(Y_read[:, 0], [-32768, -3, 4, 32767])
+
+
+def test_signal_export_and_import(tmp_path):
+    signal = Signal.TimeSignal(x_start=0.0, x_end=0.099, delta_x=0.001, bit_depth=32, codomain='int', channels=2)
+    signal.Y[:] = random_samples(signal.n, 2, 24, 'int')
+    signal.export_wav_signal(tmp_path / 'a.wav', bit_depth=24)
+    imported = Signal.TimeSignal.from_wav(tmp_path / 'a.wav')
+    assert imported.Y.dtype == np.int32
+    assert np.array_equal(imported.Y, signal.Y)
+    assert imported.f_s == pytest.approx(1000.0)
+
+
+def test_batch_import_from_the_command_line(tmp_path, capsys):
+    Y_24 = random_samples(1001, 2, 24, 'int')
+    Y_16 = random_samples(500, 1, 16, 'int', seed=1)
+    (tmp_path / 'recordings').mkdir()
+    Wav.write(tmp_path / 'recordings' / 'a.wav', Y_24, 48000, bits=24)
+    Wav.write(tmp_path / 'recordings' / 'b.wav', Y_16, 8000, bits=16)
+    assert MechImport.main([str(tmp_path / 'recordings'), '-o', str(tmp_path / 'signals'), '-p', '1']) == 0
+    # Progress is written a line at a time when the output is not a terminal
+    assert capsys.readouterr().out.split('\n')[:2] == ['1/2', '2/2']
+
+    manifest = json.loads((tmp_path / 'signals' / 'manifest.json').read_text())
+    entries = {pathlib.Path(entry['source']).name: entry for entry in manifest}
+    # 24-bit samples are stored as int32, but the manifest records the width of the recording
+    assert entries['a.wav']['bit_depth'] == 24
+    assert entries['b.wav']['bit_depth'] == 16
+    assert entries['a.wav']['codomain'] == 'int'
+    signal = Signal.TimeSignal.static_load(entries['a.wav']['output'])
+    assert np.array_equal(signal.Y, Y_24)
+
+
+def test_not_a_wav_file(tmp_path):
+    (tmp_path / 'a.wav').write_bytes(b'not a wav file')
+    with pytest.raises(ValueError):
+        Wav.read_header(tmp_path / 'a.wav')
@@ -4,6 +4,7 @@
 
 # standard library
 import logging
+import collections
 # 3rd party
 
 # Internals
@@ -16,18 +17,20 @@ logger.setLevel(logging.DEBUG)
 class Queue:
 
     def __init__(self):
-        self.que = []
+        self.que = collections.deque()
         self.processed = []
+        self.seen = set()
 
     def __len__(self):
         return len(self.que)
 
     def enqueue(self, i):
-        if i not in self.que and i not in self.processed:
+        if i not in self.seen:
+            self.seen.add(i)
             self.que.append(i)
 
     def dequeue(self):
-        self.processed.append(self.que.pop(0))
+        self.processed.append(self.que.popleft())
         return self.processed[-1]
 
 